@@ -9,13 +9,20 @@ Supports both local and remote backups with retention policy.
 import os
 import sys
 import json
+import time
+import shlex
 import shutil
+import hashlib
 import logging
 import argparse
 from datetime import datetime, timedelta
 from pathlib import Path
-import paramiko
-from typing import List, Dict
+from typing import Any, List, Dict, Optional
+
+import snapshot_store
+from backup_catalog import CATALOG_FILE, BackupCatalog, format_entries, parse_backup_name
+from remote import close_all, get_host
+from transfer import PART_SIZE, ParallelDownload, remote_sha256
 
 # Configure logging
 logging.basicConfig(
@@ -28,12 +35,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Sent over stdin to `python3 -` on the server; standard library only
+SNAPSHOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshot_store.py')
+SELECTIVE_RESTORE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'selective_restore.py')
+
+ARCHIVE_SUFFIXES = ('.tar.gz', '.tar.zst')
+# Leading bytes of each compressed format, used to name a streamed archive after the compressor the server had
+ARCHIVE_MAGIC = {b'\x28\xb5\x2f\xfd': '.tar.zst', b'\x1f\x8b': '.tar.gz'}
+# Remote extraction of an archive read from stdin
+EXTRACT_COMMANDS = {'.tar.gz': 'tar -xzf - -C {dir}', '.tar.zst': 'zstd -dc | tar -xf - -C {dir}'}
+
+# Multi-threaded zstd when installed, then pigz, then gzip; `ext` names the optional remote copy
+COMPRESSOR_SELECTION = (
+    'if command -v zstd >/dev/null 2>&1; then ext=zst; set -- zstd -T0 -q -c; '
+    'elif command -v pigz >/dev/null 2>&1; then ext=gz; set -- pigz -c; '
+    'else ext=gz; set -- gzip -c; fi; '
+)
+STREAM_BLOCK_SIZE = 1024 * 1024
+
 class BackupManager:
     def __init__(self, config_path: str = 'tools/config.json'):
         """Initialize backup manager with configuration."""
         self.config = self._load_config(config_path)
         self.ssh_client = None
         self.sftp_client = None
+        # 'archive': one tarball per backup; 'stream': archive compressed straight into the SSH channel;
+        # 'snapshot': deduplicated chunk store (see snapshot_store.py)
+        self.mode = self.config['backup'].get('mode', 'archive')
+        self.remote_store = f"{self.config['backup']['remote_dir']}/snapshots"
+        self.local_store = str(Path(self.config['backup']['local_dir']) / 'snapshots')
+        # Index of all backups, kept locally and mirrored next to the remote backups
+        self.catalog = BackupCatalog(str(Path(self.config['backup']['local_dir']) / CATALOG_FILE))
+        self.remote_catalog = f"{self.config['backup']['remote_dir']}/{CATALOG_FILE}"
 
     def _load_config(self, config_path: str) -> Dict:
         """Load configuration from JSON file."""
@@ -50,18 +83,88 @@ class BackupManager:
     def connect_ssh(self) -> None:
         """Establish SSH connection to the server."""
         try:
-            self.ssh_client = paramiko.SSHClient()
-            self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.ssh_client.connect(
-                hostname=self.config['server']['host'],
-                username=self.config['server']['username'],
-                key_filename=self.config['server']['key_path']
-            )
+            self.ssh_client = get_host(self.config['server']).connect()
             self.sftp_client = self.ssh_client.open_sftp()
             logger.info("SSH connection established successfully")
         except Exception as e:
             logger.error(f"Failed to establish SSH connection: {str(e)}")
             sys.exit(1)
+        self.load_catalog()
+
+    def load_catalog(self) -> None:
+        """Use the local catalog; without one, fetch the remote mirror or index the existing backups."""
+        if self.catalog.exists:
+            return
+        temp_file = f"{self.catalog.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.catalog.path), exist_ok=True)
+            self.sftp_client.get(self.remote_catalog, temp_file)
+        except FileNotFoundError:
+            if os.path.exists(temp_file):
+                os.unlink(temp_file)
+            self.rebuild_catalog()
+            return
+        os.replace(temp_file, self.catalog.path)
+        self.catalog = BackupCatalog(self.catalog.path)
+        logger.info(f"Fetched backup catalog from the server ({len(self.catalog.backups)} backups)")
+
+    def rebuild_catalog(self) -> None:
+        """Index the backups found in the remote and local backup directories (one listing per side)."""
+        backup_config = self.config['backup']
+        catalog = BackupCatalog(self.catalog.path)
+        catalog.backups = {}
+        
+        exit_status, output, _ = self.ssh_client.run(
+            f"find {backup_config['remote_dir']} -maxdepth 1 -type f -name 'backup_*' -printf '%f %s\\n'"
+        )
+        remote_files = dict(line.split(' ', 1) for line in output.splitlines() if exit_status == 0 and line)
+        local_backup_dir = Path(backup_config['local_dir'])
+        local_files = {f.name: f.stat().st_size for f in local_backup_dir.glob('backup_*')
+                       if f.name.endswith(ARCHIVE_SUFFIXES)}
+        for file in sorted(set(remote_files) | set(local_files)):
+            if not file.endswith(ARCHIVE_SUFFIXES):
+                continue
+            name = file[:-len(next(suffix for suffix in ARCHIVE_SUFFIXES if file.endswith(suffix)))]
+            try:
+                parsed = parse_backup_name(name)
+            except ValueError:
+                continue
+            catalog.add(
+                name, parsed['type'], 'stream' if file.endswith('.tar.zst') else 'archive',
+                local_files[file] if file in local_files else int(remote_files[file]), self.known_sha256(name),
+                local_path=str(local_backup_dir / file) if file in local_files else None,
+                remote_path=f"{backup_config['remote_dir']}/{file}" if file in remote_files else None,
+                created=parsed['created']
+            )
+        
+        remote_snapshots = {item['name']: item for item in self.run_snapshot_command('list', self.remote_store)}
+        local_snapshots = {item['name']: item for item in snapshot_store.summary(self.local_store)}
+        for name, item in sorted(dict(local_snapshots, **remote_snapshots).items()):
+            catalog.add(
+                name, item['type'], 'snapshot', item['bytes'], self.known_sha256(name),
+                local_path=snapshot_store.manifest_path(self.local_store, name) if name in local_snapshots else None,
+                remote_path=f"{self.remote_store}/manifests/{name}.json" if name in remote_snapshots else None,
+                created=item['created'], files=item['files']
+            )
+        
+        self.catalog = catalog
+        self.save_catalog()
+        logger.info(f"Indexed {len(catalog.backups)} existing backups into {catalog.path}")
+
+    def known_sha256(self, backup_name: str) -> Optional[str]:
+        """Checksum recorded for a backup by the current catalog, kept when the catalog is rebuilt."""
+        entry = self.catalog.get(backup_name)
+        return entry.get('sha256') if entry else None
+
+    def save_catalog(self) -> None:
+        """Write the catalog locally and replace the remote mirror atomically."""
+        self.catalog.save()
+        try:
+            self.ssh_client.run(f"mkdir -p {self.config['backup']['remote_dir']}")
+            self.sftp_client.put(self.catalog.path, f"{self.remote_catalog}.tmp")
+            self.sftp_client.posix_rename(f"{self.remote_catalog}.tmp", self.remote_catalog)
+        except Exception as e:
+            logger.warning(f"Failed to mirror backup catalog to the server: {str(e)}")
 
     def create_backup(self, backup_type: str = 'full') -> str:
         """Create a backup of specified type."""
@@ -74,28 +177,45 @@ class BackupManager:
             local_backup_dir.mkdir(parents=True, exist_ok=True)
             
             remote_backup_dir = self.config['backup']['remote_dir']
-            self.ssh_client.exec_command(f"mkdir -p {remote_backup_dir}")
             
             # Create backup package
             if backup_type == 'full':
                 # Backup entire application directory
-                self.ssh_client.exec_command(
-                    f"tar -czf {remote_backup_dir}/{backup_name}.tar.gz -C {self.config['server']['app_dir']} ."
-                )
+                source_dir = self.config['server']['app_dir']
             elif backup_type == 'data':
                 # Backup only data directory
-                self.ssh_client.exec_command(
-                    f"tar -czf {remote_backup_dir}/{backup_name}.tar.gz -C {self.config['server']['app_dir']}/data ."
-                )
+                source_dir = f"{self.config['server']['app_dir']}/data"
             elif backup_type == 'config':
                 # Backup only configuration files
-                self.ssh_client.exec_command(
-                    f"tar -czf {remote_backup_dir}/{backup_name}.tar.gz -C {self.config['server']['app_dir']}/config ."
-                )
+                source_dir = f"{self.config['server']['app_dir']}/config"
+            
+            if self.mode == 'snapshot':
+                return self.create_snapshot(backup_name, backup_type, source_dir)
+            if self.mode == 'stream':
+                stats = self.create_stream_backup(backup_name, source_dir)
+                self.catalog.add(backup_name, backup_type, 'stream', stats['size'], stats['sha256'],
+                                 local_path=stats['local_path'], remote_path=stats['remote_path'])
+                self.save_catalog()
+                logger.info(f"Backup created successfully: {backup_name}")
+                return backup_name
             
-            # Download backup to local machine
-            local_backup_path = local_backup_dir / f"{backup_name}.tar.gz"
-            self.sftp_client.get(f"{remote_backup_dir}/{backup_name}.tar.gz", str(local_backup_path))
+            # One round trip; waits for tar to finish before downloading
+            result = self.ssh_client.batch() \
+                .add(f"mkdir -p {remote_backup_dir}", 'prepare') \
+                .add(f"tar -czf {remote_backup_dir}/{backup_name}.tar.gz -C {source_dir} .", 'archive') \
+                .add(f"sha256sum {remote_backup_dir}/{backup_name}.tar.gz", 'checksum') \
+                .run()
+            result.raise_for_status()
+            logger.info(f"Remote steps: {result.describe()}")
+            
+            # Download backup to local machine; the archive is complete once the batch has returned
+            stats = self.download_archive(backup_name, result['checksum'].stdout.split()[0])
+            self.catalog.add(
+                backup_name, backup_type, 'archive', stats['size'], stats['sha256'],
+                local_path=str(local_backup_dir / f"{backup_name}.tar.gz"),
+                remote_path=f"{remote_backup_dir}/{backup_name}.tar.gz"
+            )
+            self.save_catalog()
             
             logger.info(f"Backup created successfully: {backup_name}")
             return backup_name
@@ -104,72 +224,379 @@ class BackupManager:
             logger.error(f"Backup creation failed: {str(e)}")
             sys.exit(1)
 
+    def download_archive(self, backup_name: str, sha256: Optional[str] = None) -> Dict:
+        """Fetch a remote archive in parallel byte ranges, resuming a partial download, and verify its SHA-256."""
+        backup_config = self.config['backup']
+        remote_path = f"{backup_config['remote_dir']}/{backup_name}.tar.gz"
+        local_backup_dir = Path(backup_config['local_dir'])
+        local_backup_dir.mkdir(parents=True, exist_ok=True)
+        
+        sha256 = sha256 or remote_sha256(self.ssh_client, remote_path)
+        stats = ParallelDownload(
+            self.ssh_client, remote_path, str(local_backup_dir / f"{backup_name}.tar.gz"),
+            workers=backup_config.get('download_workers', 4),
+            part_size=backup_config.get('download_part_size', PART_SIZE)
+        ).run(sha256)
+        logger.info(
+            f"Downloaded {backup_name}.tar.gz: {stats['size'] / 1024 / 1024:.1f} MB in {stats['parts']} parts "
+            f"({stats['resumed_parts']} resumed) at {stats['mb_per_second']} MB/s, SHA-256 verified"
+        )
+        return stats
+
+    def create_stream_backup(self, backup_name: str, source_dir: str) -> Dict:
+        """
+        Archive source_dir through the best compressor on the server straight into an SSH channel and write it to
+        local disk as it arrives; a remote copy is only kept (via tee) when backup.keep_remote_copy is set.
+        Returns the archive's size, SHA-256 and locations.
+        """
+        backup_config = self.config['backup']
+        remote_backup_dir = backup_config['remote_dir']
+        local_backup_dir = Path(backup_config['local_dir'])
+        local_backup_dir.mkdir(parents=True, exist_ok=True)
+        keep_remote_copy = backup_config.get('keep_remote_copy', False)
+        
+        remote_copy = f"{remote_backup_dir}/{backup_name}.tar.$ext"
+        # tar exits 1 when files change while being read (live logs); only worse is a failure. The status of tar and
+        # of the compressor are recorded in files because $? is only the last command's (tee) and sh has no pipefail
+        command = (
+            (f"mkdir -p {remote_backup_dir} && " if keep_remote_copy else '') + COMPRESSOR_SELECTION +
+            'status=$(mktemp) && cstatus=$(mktemp) || exit 97; '
+            f'{{ tar -cf - -C {source_dir} .; echo $? >"$status"; }} | {{ "$@"; echo $? >"$cstatus"; }} '
+            f'{"| tee " + remote_copy if keep_remote_copy else ""}; '
+            'rc=$?; t=$(cat "$status"); c=$(cat "$cstatus"); rm -f "$status" "$cstatus"; '
+            'if [ "$c" -ne 0 ]; then rc=$c; fi; if [ "$t" -gt 1 ]; then rc=$t; fi; '
+            f'{"if [ $rc -ne 0 ]; then rm -f " + remote_copy + "; fi; " if keep_remote_copy else ""}exit $rc'
+        )
+        
+        started = time.time()
+        partial_path = local_backup_dir / f"{backup_name}.tar.part"
+        digest = hashlib.sha256()
+        header = b''
+        total = 0
+        channel = self.ssh_client.get_transport().open_session()
+        channel.exec_command(command)
+        with open(partial_path, 'wb') as f:
+            while True:
+                data = channel.recv(STREAM_BLOCK_SIZE)
+                if not data:
+                    break
+                if len(header) < 4:
+                    header = (header + data)[:4]
+                f.write(data)
+                digest.update(data)
+                total += len(data)
+        
+        exit_status = channel.recv_exit_status()
+        error = channel.makefile_stderr('rb').read().decode(errors='replace').strip()
+        channel.close()
+        suffix = next((suffix for magic, suffix in ARCHIVE_MAGIC.items() if header.startswith(magic)), None)
+        if exit_status != 0 or suffix is None:
+            partial_path.unlink()
+            raise Exception(f"Remote archive stream failed (exit {exit_status}): {error or 'unrecognized data'}")
+        
+        local_backup_path = local_backup_dir / f"{backup_name}{suffix}"
+        os.replace(partial_path, local_backup_path)
+        seconds = time.time() - started
+        logger.info(
+            f"Streamed {local_backup_path.name}: {total / 1024 / 1024:.1f} MB in {seconds:.1f}s "
+            f"({total / 1024 / 1024 / max(seconds, 1e-6):.1f} MB/s), SHA-256 {digest.hexdigest()}"
+            f"{', remote copy kept' if keep_remote_copy else ''}"
+        )
+        return {
+            'size': total,
+            'sha256': digest.hexdigest(),
+            'local_path': str(local_backup_path),
+            'remote_path': f"{remote_backup_dir}/{local_backup_path.name}" if keep_remote_copy else None,
+        }
+
+    def find_local_archive(self, backup_name: str) -> Optional[Path]:
+        local_backup_dir = Path(self.config['backup']['local_dir'])
+        for suffix in ARCHIVE_SUFFIXES:
+            if (local_backup_dir / f"{backup_name}{suffix}").exists():
+                return local_backup_dir / f"{backup_name}{suffix}"
+        return None
+
+    def upload_archive_extract(self, local_archive: Path, target_dir: str) -> None:
+        """Stream a local archive into a remote extraction, for backups that have no remote copy."""
+        suffix = next(suffix for suffix in ARCHIVE_SUFFIXES if local_archive.name.endswith(suffix))
+        channel = self.ssh_client.get_transport().open_session()
+        channel.exec_command(f"mkdir -p {target_dir} && {EXTRACT_COMMANDS[suffix].format(dir=target_dir)}")
+        with open(local_archive, 'rb') as f:
+            for block in iter(lambda: f.read(STREAM_BLOCK_SIZE), b''):
+                channel.sendall(block)
+        channel.shutdown_write()
+        exit_status = channel.recv_exit_status()
+        if exit_status != 0:
+            error = channel.makefile_stderr('rb').read().decode(errors='replace').strip()
+            raise Exception(f"Remote extraction failed (exit {exit_status}): {error}")
+        channel.close()
+        logger.info(f"Uploaded and extracted local archive {local_archive.name}")
+
+    def fetch_backup(self, backup_name: str) -> None:
+        """Download (or resume downloading) an existing remote archive."""
+        try:
+            stats = self.download_archive(backup_name)
+            backup_config = self.config['backup']
+            entry = self.catalog.get(backup_name) or self.catalog.add(
+                backup_name, parse_backup_name(backup_name)['type'], 'archive', stats['size'], stats['sha256'],
+                remote_path=f"{backup_config['remote_dir']}/{backup_name}.tar.gz",
+                created=parse_backup_name(backup_name)['created']
+            )
+            entry.update(sha256=stats['sha256'],
+                         local_path=str(Path(backup_config['local_dir']) / f"{backup_name}.tar.gz"))
+            self.save_catalog()
+        except Exception as e:
+            logger.error(f"Backup download failed: {str(e)}")
+            sys.exit(1)
+
+    def run_remote_script(self, script_path: str, *args) -> Any:
+        """Pipe a standard-library script into `python3 -` on the server and return its JSON output."""
+        with open(script_path, 'r') as f:
+            script = f.read()
+        exit_status, output, error = self.ssh_client.run(
+            'python3 - ' + ' '.join(shlex.quote(str(arg)) for arg in args),
+            input=script
+        )
+        if exit_status != 0:
+            raise Exception(f"Remote {os.path.basename(script_path)} {args[0]} failed: {error.strip()}")
+        return json.loads(output)
+
+    def run_snapshot_command(self, *args) -> Any:
+        """Run a snapshot_store.py command on the server and return its JSON output."""
+        return self.run_remote_script(SNAPSHOT_SCRIPT, *args)
+
+    def create_snapshot(self, backup_name: str, backup_type: str, source_dir: str) -> str:
+        """Snapshot source_dir into the remote chunk store and mirror it locally."""
+        chunk_size = self.config['backup'].get('chunk_size', snapshot_store.CHUNK_SIZE)
+        stats = self.run_snapshot_command(
+            'create', self.remote_store, source_dir, backup_name, backup_type, chunk_size
+        )
+        logger.info(
+            f"Snapshot {backup_name}: {stats['files']} files ({stats['bytes'] / 1024 / 1024:.1f} MB), "
+            f"{stats['unchanged_files']} unchanged, {stats['read_bytes'] / 1024 / 1024:.1f} MB read, "
+            f"{stats['new_chunks']} new chunks ({stats['new_bytes'] / 1024:.1f} KB stored) in {stats['seconds']}s"
+        )
+        manifest_sha256 = self.download_snapshot(backup_name)
+        self.catalog.add(
+            backup_name, backup_type, 'snapshot', stats['bytes'], manifest_sha256,
+            local_path=snapshot_store.manifest_path(self.local_store, backup_name),
+            remote_path=f"{self.remote_store}/manifests/{backup_name}.json", files=stats['files']
+        )
+        self.save_catalog()
+        logger.info(f"Backup created successfully: {backup_name}")
+        return backup_name
+
+    def download_snapshot(self, backup_name: str) -> str:
+        """
+        Mirror a remote snapshot into the local store, downloading only chunks it does not have yet.
+        Returns the SHA-256 of the manifest, which pins the content of every file in the snapshot.
+        """
+        with self.sftp_client.open(f"{self.remote_store}/manifests/{backup_name}.json", 'r') as f:
+            data = f.read()
+        manifest = json.loads(data)
+        chunks = {digest for entry in manifest['files'] for digest in entry['chunks']}
+        missing = sorted(
+            digest for digest in chunks
+            if not os.path.exists(snapshot_store.chunk_path(self.local_store, digest))
+        )
+        for digest in missing:
+            local_path = snapshot_store.chunk_path(self.local_store, digest)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            self.sftp_client.get(f"{self.remote_store}/chunks/{digest[:2]}/{digest}", f"{local_path}.part")
+            os.replace(f"{local_path}.part", local_path)
+        # Manifest last, so an interrupted download never leaves a snapshot with missing chunks
+        snapshot_store.write_atomic(snapshot_store.manifest_path(self.local_store, backup_name), data)
+        logger.info(f"Mirrored snapshot locally: downloaded {len(missing)} of {len(chunks)} chunks")
+        return hashlib.sha256(data).hexdigest()
+
+    def snapshot_exists(self, backup_name: str) -> bool:
+        try:
+            self.sftp_client.stat(f"{self.remote_store}/manifests/{backup_name}.json")
+            return True
+        except FileNotFoundError:
+            return False
+
     def cleanup_old_backups(self) -> None:
-        """Remove backups older than retention period."""
+        """Remove backups older than retention period, as listed in the catalog."""
         try:
             retention_days = self.config['backup']['retention_days']
             cutoff_date = datetime.now() - timedelta(days=retention_days)
+            expired = self.catalog.expired(cutoff_date.timestamp())
+            if not expired:
+                return
             
-            # Cleanup remote backups
-            remote_backup_dir = self.config['backup']['remote_dir']
-            stdin, stdout, stderr = self.ssh_client.exec_command(f"ls {remote_backup_dir}")
-            remote_files = stdout.read().decode().splitlines()
-            
-            for file in remote_files:
-                if file.startswith('backup_'):
-                    try:
-                        file_date = datetime.strptime(file.split('_')[2], '%Y%m%d')
-                        if file_date < cutoff_date:
-                            self.ssh_client.exec_command(f"rm {remote_backup_dir}/{file}")
-                            logger.info(f"Removed old remote backup: {file}")
-                    except ValueError:
-                        continue
-            
-            # Cleanup local backups
-            local_backup_dir = Path(self.config['backup']['local_dir'])
-            for file in local_backup_dir.glob('backup_*.tar.gz'):
-                try:
-                    file_date = datetime.strptime(file.stem.split('_')[2], '%Y%m%d')
-                    if file_date < cutoff_date:
-                        file.unlink()
-                        logger.info(f"Removed old local backup: {file.name}")
-                except ValueError:
-                    continue
+            # Delete all expired remote archives in one round trip
+            removal = self.ssh_client.batch(stop_on_error=False)
+            for entry in expired:
+                if entry['mode'] != 'snapshot' and entry.get('remote_path'):
+                    removal.add(f"rm -f {entry['remote_path']}", entry['name'])
+            failed = set()
+            if removal.steps:
+                for step in removal.run():
+                    if step.ok:
+                        logger.info(f"Removed old remote backup: {step.name}")
+                    else:
+                        failed.add(step.name)
+                        logger.warning(f"Failed to remove remote backup {step.name}: {step.stderr.strip()}")
+            
+            # Expired snapshots are dropped together, then their unreferenced chunks are garbage-collected
+            snapshots = [entry['name'] for entry in expired if entry['mode'] == 'snapshot']
+            if snapshots:
+                result = self.run_snapshot_command('delete', self.remote_store, *snapshots)
+                logger.info(
+                    f"Removed {len(result['deleted'])} old remote snapshots, freed {result['deleted_chunks']} chunks "
+                    f"({result['freed_bytes'] / 1024:.1f} KB)"
+                )
+                result = snapshot_store.delete(self.local_store, snapshots)
+                logger.info(
+                    f"Removed {len(result['deleted'])} old local snapshots, freed {result['deleted_chunks']} chunks "
+                    f"({result['freed_bytes'] / 1024:.1f} KB)"
+                )
+            
+            for entry in expired:
+                if entry['mode'] != 'snapshot' and entry.get('local_path'):
+                    local_file = Path(entry['local_path'])
+                    if local_file.exists():
+                        local_file.unlink()
+                        logger.info(f"Removed old local backup: {local_file.name}")
+                # A backup whose remote copy could not be deleted stays listed
+                if entry['name'] in failed:
+                    entry['local_path'] = None
+                else:
+                    self.catalog.remove(entry['name'])
+            self.save_catalog()
                     
         except Exception as e:
             logger.error(f"Backup cleanup failed: {str(e)}")
             sys.exit(1)
 
+    def restore_target(self, restore_type: str) -> str:
+        if restore_type == 'full':
+            # Restore entire application
+            return f"{self.config['server']['app_dir']}/"
+        elif restore_type == 'data':
+            # Restore only data
+            return f"{self.config['server']['app_dir']}/data/"
+        elif restore_type == 'config':
+            # Restore only configuration
+            return f"{self.config['server']['app_dir']}/config/"
+
+    def find_remote_archive(self, backup_name: str) -> Optional[str]:
+        for suffix in ARCHIVE_SUFFIXES:
+            remote_path = f"{self.config['backup']['remote_dir']}/{backup_name}{suffix}"
+            try:
+                self.sftp_client.stat(remote_path)
+                return remote_path
+            except FileNotFoundError:
+                continue
+        return None
+
+    def selective_restore(self, backup_name: str, restore_type: str = 'full', paths: Optional[List[str]] = None,
+                          dry_run: bool = False) -> Dict:
+        """
+        Restore in place only the files of a backup that differ from the live tree (by size, mtime, then hash),
+        optionally limited to paths; a dry run only prints the diff. See selective_restore.py.
+        """
+        try:
+            target_dir = self.restore_target(restore_type)
+            entry = self.catalog.get(backup_name) or {}
+            options = (['--dry-run'] if dry_run else []) + list(paths or [])
+            
+            if entry.get('mode') == 'snapshot' or (not entry and self.snapshot_exists(backup_name)):
+                diff = self.run_remote_script(
+                    SELECTIVE_RESTORE_SCRIPT, 'snapshot', self.remote_store, backup_name, target_dir, *options
+                )
+            else:
+                archive = entry.get('remote_path') or self.find_remote_archive(backup_name)
+                uploaded = None
+                if archive is None:
+                    # Streamed backups may only exist locally; the comparison needs the archive on the server
+                    local_archive = self.find_local_archive(backup_name)
+                    if local_archive is None:
+                        raise Exception(f"Backup not found: {backup_name}")
+                    archive = uploaded = f"{self.config['server']['temp_dir']}/{local_archive.name}"
+                    self.sftp_client.put(str(local_archive), uploaded)
+                try:
+                    diff = self.run_remote_script(
+                        SELECTIVE_RESTORE_SCRIPT, 'archive', archive, target_dir, *options
+                    )
+                finally:
+                    if uploaded:
+                        self.sftp_client.remove(uploaded)
+            
+            for status, marker in (('added', '+'), ('changed', '~')):
+                for path in diff[status]:
+                    print(f"{marker} {path}")
+            logger.info(
+                f"{'Dry run of selective restore' if dry_run else 'Selectively restored'} {backup_name}: "
+                f"{len(diff['added'])} added, {len(diff['changed'])} changed, {diff['unchanged']} unchanged, "
+                f"{diff['written_bytes'] / 1024:.1f} KB written in {diff['seconds']}s"
+            )
+            if not dry_run:
+                self.catalog.record_restore(backup_name)
+                self.save_catalog()
+            return diff
+            
+        except Exception as e:
+            logger.error(f"Selective restore failed: {str(e)}")
+            sys.exit(1)
+
     def restore_backup(self, backup_name: str, restore_type: str = 'full') -> None:
         """Restore from a backup."""
         try:
             remote_backup_dir = self.config['backup']['remote_dir']
             backup_path = f"{remote_backup_dir}/{backup_name}.tar.gz"
             
-            # Verify backup exists
-            stdin, stdout, stderr = self.ssh_client.exec_command(f"test -f {backup_path} && echo 'exists'")
-            if not stdout.read().strip():
-                raise Exception(f"Backup not found: {backup_name}")
-            
-            # Create temporary restore directory
             temp_dir = f"{self.config['server']['temp_dir']}/restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            self.ssh_client.exec_command(f"mkdir -p {temp_dir}")
-            
-            # Extract backup
-            self.ssh_client.exec_command(f"tar -xzf {backup_path} -C {temp_dir}")
+            target_dir = self.restore_target(restore_type)
             
-            if restore_type == 'full':
-                # Restore entire application
-                self.ssh_client.exec_command(f"rsync -av --delete {temp_dir}/ {self.config['server']['app_dir']}/")
-            elif restore_type == 'data':
-                # Restore only data
-                self.ssh_client.exec_command(f"rsync -av --delete {temp_dir}/ {self.config['server']['app_dir']}/data/")
-            elif restore_type == 'config':
-                # Restore only configuration
-                self.ssh_client.exec_command(f"rsync -av --delete {temp_dir}/ {self.config['server']['app_dir']}/config/")
+            if self.snapshot_exists(backup_name):
+                # Reassemble the snapshot from its chunks, then sync it into place like an extracted archive
+                try:
+                    stats = self.run_snapshot_command('restore', self.remote_store, backup_name, temp_dir)
+                except Exception:
+                    self.ssh_client.run(f"rm -rf {temp_dir}")
+                    raise
+                logger.info(f"Reassembled snapshot {backup_name}: {stats['files']} files")
+                result = self.ssh_client.batch() \
+                    .add(f"rsync -a --delete {temp_dir}/ {target_dir}", 'sync') \
+                    .add(f"rm -rf {temp_dir}", 'cleanup', always=True) \
+                    .run()
+                result.raise_for_status()
+                logger.info(f"Remote steps: {result.describe()}")
+                self.catalog.record_restore(backup_name)
+                self.save_catalog()
+                logger.info(f"Successfully restored backup: {backup_name}")
+                return
             
-            # Cleanup
-            self.ssh_client.exec_command(f"rm -rf {temp_dir}")
+            # Verify, extract, sync and clean up in one round trip; each step waits for the previous one
+            zstd_path = f"{remote_backup_dir}/{backup_name}.tar.zst"
+            result = self.ssh_client.batch() \
+                .add(f"test -f {backup_path} || test -f {zstd_path}", 'verify') \
+                .add(f"mkdir -p {temp_dir}", 'prepare') \
+                .add(f"if [ -f {zstd_path} ]; then zstd -dc {zstd_path} | tar -xf - -C {temp_dir}; "
+                     f"else tar -xzf {backup_path} -C {temp_dir}; fi", 'extract') \
+                .add(f"rsync -a --delete {temp_dir}/ {target_dir}", 'sync') \
+                .add(f"rm -rf {temp_dir}", 'cleanup', always=True) \
+                .run()
+            if not result['verify'].ok:
+                # Streamed backups may only exist locally; send the archive back to be extracted
+                local_archive = self.find_local_archive(backup_name)
+                if local_archive is None:
+                    raise Exception(f"Backup not found: {backup_name}")
+                try:
+                    self.upload_archive_extract(local_archive, temp_dir)
+                except Exception:
+                    self.ssh_client.run(f"rm -rf {temp_dir}")
+                    raise
+                result = self.ssh_client.batch() \
+                    .add(f"rsync -a --delete {temp_dir}/ {target_dir}", 'sync') \
+                    .add(f"rm -rf {temp_dir}", 'cleanup', always=True) \
+                    .run()
+            result.raise_for_status()
+            logger.info(f"Remote steps: {result.describe()}")
+            self.catalog.record_restore(backup_name)
+            self.save_catalog()
             
             logger.info(f"Successfully restored backup: {backup_name}")
             
@@ -177,40 +604,34 @@ class BackupManager:
             logger.error(f"Backup restoration failed: {str(e)}")
             sys.exit(1)
 
-    def list_backups(self) -> List[str]:
-        """List all available backups."""
-        try:
-            remote_backup_dir = self.config['backup']['remote_dir']
-            stdin, stdout, stderr = self.ssh_client.exec_command(f"ls {remote_backup_dir}")
-            remote_files = stdout.read().decode().splitlines()
-            
-            local_backup_dir = Path(self.config['backup']['local_dir'])
-            local_files = [f.name for f in local_backup_dir.glob('backup_*.tar.gz')]
-            
-            all_backups = set(remote_files + local_files)
-            return sorted(list(all_backups))
-            
-        except Exception as e:
-            logger.error(f"Failed to list backups: {str(e)}")
-            return []
+    def list_backups(self) -> List[Dict]:
+        """List all available backups from the catalog, oldest first."""
+        return self.catalog.entries()
 
     def cleanup(self) -> None:
         """Cleanup resources."""
-        if self.sftp_client:
-            self.sftp_client.close()
-        if self.ssh_client:
-            self.ssh_client.close()
+        close_all()
 
 def main():
     parser = argparse.ArgumentParser(description='Backup Manager')
     parser.add_argument('--config', default='tools/config.json', help='Path to configuration file')
     parser.add_argument('--type', choices=['full', 'data', 'config'], default='full', help='Type of backup to create')
+    parser.add_argument('--mode', choices=['archive', 'stream', 'snapshot'], help='Override backup.mode from the configuration')
     parser.add_argument('--restore', help='Name of backup to restore')
+    parser.add_argument('--selective', action='store_true',
+                        help='Restore only files that differ from the live tree, in place')
+    parser.add_argument('--only', action='append', metavar='PATH',
+                        help='Limit a selective restore to this file, directory or glob (repeatable)')
+    parser.add_argument('--dry-run', action='store_true', help='Print what a selective restore would change')
+    parser.add_argument('--fetch', help='Download (or resume downloading) an existing remote backup archive')
     parser.add_argument('--list', action='store_true', help='List available backups')
     parser.add_argument('--cleanup', action='store_true', help='Cleanup old backups')
+    parser.add_argument('--reindex', action='store_true', help='Rebuild the backup catalog from the backup directories')
     args = parser.parse_args()
 
     manager = BackupManager(args.config)
+    if args.mode:
+        manager.mode = args.mode
     
     try:
         manager.connect_ssh()
@@ -218,9 +639,17 @@ def main():
         if args.list:
             backups = manager.list_backups()
             print("\nAvailable backups:")
-            for backup in backups:
-                print(f"- {backup}")
+            print(format_entries(backups))
                 
+        elif args.reindex:
+            manager.rebuild_catalog()
+            
+        elif args.fetch:
+            manager.fetch_backup(args.fetch)
+            
+        elif args.restore and (args.selective or args.only or args.dry_run):
+            manager.selective_restore(args.restore, args.type, args.only, args.dry_run)
+            
         elif args.restore:
             manager.restore_backup(args.restore, args.type)
             
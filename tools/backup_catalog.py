@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Catalog of backups kept as a JSON file next to the local backups and mirrored into the remote backup directory.
+Every backup has one entry (name, type, mode, size, SHA-256, creation time, local and remote location), so
+listing and retention decisions are index lookups instead of parsing `ls` output and file names.
+"""
+
+import os
+import json
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+CATALOG_FILE = 'catalog.json'
+CATALOG_VERSION = 1
+
+
+def parse_backup_name(name: str) -> Dict:
+    """Type and creation time encoded in a `backup_<type>_<YYYYmmdd_HHMMSS>` name (used for legacy backups)."""
+    _, backup_type, stamp = name.split('.')[0].split('_', 2)
+    return {'type': backup_type, 'created': datetime.strptime(stamp[:15], '%Y%m%d_%H%M%S').timestamp()}
+
+
+class BackupCatalog:
+    def __init__(self, path: str):
+        """Load the catalog at path; a missing file is an empty catalog."""
+        self.path = path
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.backups: Dict[str, Dict] = data.get('backups', {})
+            self.exists = True
+        except FileNotFoundError:
+            self.backups = {}
+            self.exists = False
+
+    def add(self, name: str, backup_type: str, mode: str, size: int, sha256: Optional[str],
+            local_path: Optional[str] = None, remote_path: Optional[str] = None,
+            created: Optional[float] = None, **extra) -> Dict:
+        entry = {
+            'name': name,
+            'type': backup_type,
+            'mode': mode,
+            'size': size,
+            'sha256': sha256,
+            'created': created or time.time(),
+            'local_path': local_path,
+            'remote_path': remote_path,
+        }
+        entry.update(extra)
+        self.backups[name] = entry
+        return entry
+
+    def get(self, name: str) -> Optional[Dict]:
+        return self.backups.get(name)
+
+    def remove(self, name: str) -> Optional[Dict]:
+        return self.backups.pop(name, None)
+
+    def record_restore(self, name: str) -> None:
+        entry = self.backups.get(name)
+        if entry is not None:
+            entry['restored'] = entry.get('restored', 0) + 1
+            entry['last_restored'] = time.time()
+
+    def entries(self) -> List[Dict]:
+        """All entries, oldest first."""
+        return sorted(self.backups.values(), key=lambda entry: entry['created'])
+
+    def expired(self, cutoff: float) -> List[Dict]:
+        return [entry for entry in self.entries() if entry['created'] < cutoff]
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_file = f"{self.path}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump({'version': CATALOG_VERSION, 'updated': time.time(), 'backups': self.backups}, f, indent=2)
+        os.replace(temp_file, self.path)
+        self.exists = True
+
+
+def format_entries(entries: List[Dict]) -> str:
+    lines = [f"{'NAME':<36} {'TYPE':<7} {'MODE':<9} {'SIZE':>10} {'CREATED':<19} {'WHERE':<13} SHA-256"]
+    for entry in entries:
+        where = '+'.join(side for side in ('local', 'remote') if entry.get(f"{side}_path")) or '-'
+        lines.append(
+            f"{entry['name']:<36} {entry['type']:<7} {entry['mode']:<9} {entry['size'] / 1024 / 1024:>8.1f}MB "
+            f"{datetime.fromtimestamp(entry['created']).strftime('%Y-%m-%d %H:%M:%S'):<19} {where:<13} "
+            f"{(entry.get('sha256') or '-')[:16]}"
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Build script that stages the deployable static files into a build directory.
+Minifies and concatenates configured JS/CSS bundles under content-hash names and rewrites the HTML references;
+bundles that no HTML page loads are skipped. `--check` verifies the minifiers against the source files.
+Writes precompressed .gz (and .br when brotli is installed) variants next to HTML/JS/CSS files.
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import shutil
+import fnmatch
+import logging
+import argparse
+import tempfile
+import posixpath
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from pipeline import DEFAULT_TIMINGS_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Same rules as the original `tar --exclude` list used for deployment packages
+EXCLUDE_PATTERNS = [
+    'node_modules',
+    '.git',
+    '*.log',
+    '.DS_Store',
+    'backup',
+    '*.tar.gz',
+    'tools',
+    '*.py',
+    # SQLite metrics store of health_check.py (metrics.db_path) and its journal files
+    '*.db',
+    '*.db-*',
+]
+
+# Only these file types are deployed (overridable with build.include); everything else in the project directory
+# (logs, archives, backups, databases, scripts, docs) stays out of the web root even when it is not excluded
+INCLUDE_SUFFIXES = ['.html', '.js', '.css', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp',
+                    '.woff', '.woff2', '.ttf']
+
+COMPRESSIBLE_SUFFIXES = ('.html', '.js', '.css')
+
+# Bump when the minifiers change so cached bundles are rebuilt
+MINIFIER_VERSION = 2
+
+# Previous tokens after which a `/` starts a regular expression literal rather than a division
+REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^}')
+REGEX_KEYWORDS = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case', 'do',
+                  'else', 'yield', 'await'}
+
+CSS_TOKEN = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.DOTALL)
+
+# Lexer for --check, deliberately simpler than the minifiers: strings, comments, whitespace, words, single characters
+CHECK_TOKEN = {
+    '.js': re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`|/\*.*?\*/|//[^\n]*|\s+|[\w$.]+|.',
+                 re.DOTALL),
+    '.css': re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|/\*.*?\*/|\s+|[\w$.#%-]+|.', re.DOTALL),
+}
+
+# Optional indentation and line end are part of the match so removed tags leave no blank line
+SCRIPT_TAG = re.compile(
+    r'(?P<indent>[ \t]*)(?P<tag><script\b[^>]*?\bsrc=["\'](?P<url>[^"\']+)["\'][^>]*>\s*</script>)(?P<eol>[ \t]*\r?\n?)',
+    re.IGNORECASE
+)
+STYLESHEET_TAG = re.compile(
+    r'(?P<indent>[ \t]*)(?P<tag><link\b(?=[^>]*\brel=["\']?stylesheet)[^>]*?\bhref=["\'](?P<url>[^"\']+)["\'][^>]*>)'
+    r'(?P<eol>[ \t]*\r?\n?)',
+    re.IGNORECASE
+)
+
+
+def is_excluded(relative_path: Path, patterns: List[str]) -> bool:
+    """Match every path component against the exclude patterns, like tar --exclude."""
+    return any(fnmatch.fnmatch(part, pattern) for part in relative_path.parts for pattern in patterns)
+
+
+def _is_word(char: str) -> bool:
+    return char.isalnum() or char in '_$' or ord(char) > 127
+
+
+def _skip_quoted(source: str, start: int) -> int:
+    """Index just past the string or template literal starting at start."""
+    quote = source[start]
+    i = start + 1
+    while i < len(source):
+        char = source[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == quote or (char == '\n' and quote != '`'):
+            return i + 1
+        if quote == '`' and source.startswith('${', i):
+            # Template substitution: skip to the matching brace, including nested literals
+            depth = 1
+            i += 2
+            while i < len(source) and depth:
+                if source[i] in '\'"`':
+                    i = _skip_quoted(source, i)
+                    continue
+                depth += {'{': 1, '}': -1}.get(source[i], 0)
+                i += 1
+            continue
+        i += 1
+    return i
+
+
+def _skip_regex(source: str, start: int) -> int:
+    """Index just past the closing slash of the regular expression literal starting at start."""
+    i = start + 1
+    in_class = False
+    while i < len(source) and source[i] != '\n':
+        char = source[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            return i + 1
+        i += 1
+    return i
+
+
+def minify_js(source: str) -> str:
+    """
+    Remove comments and redundant whitespace from JavaScript.
+    Line breaks are kept (collapsed to one), so automatic semicolon insertion behaves exactly as before.
+    """
+    out: List[str] = []
+    pending = ''
+
+    def emit(chunk: str) -> None:
+        nonlocal pending
+        if pending and out:
+            previous, following = out[-1][-1], chunk[0]
+            if pending == '\n':
+                out.append('\n')
+            elif (_is_word(previous) and _is_word(following)) or (previous in '+-/' and following == previous):
+                # Keep the space only where the two tokens would otherwise merge
+                out.append(' ')
+        out.append(chunk)
+        pending = ''
+
+    i = 0
+    length = len(source)
+    while i < length:
+        char = source[i]
+        if char in '\'"`':
+            end = _skip_quoted(source, i)
+            emit(source[i:end])
+            i = end
+        elif source.startswith('//', i):
+            while i < length and source[i] != '\n':
+                i += 1
+        elif source.startswith('/*', i) or char.isspace():
+            if char.isspace():
+                end = i
+                while end < length and source[end].isspace():
+                    end += 1
+            else:
+                end = source.find('*/', i + 2)
+                end = length if end < 0 else end + 2
+            # Whitespace or a comment spanning lines still separates statements
+            pending = '\n' if pending == '\n' or '\n' in source[i:end] else ' '
+            i = end
+        elif char == '/' and _regex_allowed(out):
+            end = _skip_regex(source, i)
+            emit(source[i:end])
+            i = end
+        else:
+            emit(char)
+            i += 1
+    return ''.join(out) + '\n'
+
+
+def _regex_allowed(out: List[str]) -> bool:
+    """Whether a `/` after the emitted tokens starts a regex literal."""
+    text = ''.join(out[-20:]).rstrip()
+    if not text:
+        return True
+    if text[-1] in REGEX_PRECEDERS:
+        return True
+    match = re.search(r'[\w$]+$', text)
+    return bool(match) and match.group(0) in REGEX_KEYWORDS
+
+
+def significant_tokens(source: str, suffix: str) -> List[str]:
+    """Tokens of a JS/CSS source other than whitespace and comments (a CSS `;` before `}` is optional)."""
+    tokens = [token for token in CHECK_TOKEN[suffix].findall(source)
+              if not token.isspace() and not token.startswith(('/*', '//'))]
+    if suffix == '.css':
+        tokens = [token for token, following in zip(tokens, tokens[1:] + ['']) if token != ';' or following != '}']
+    return tokens
+
+
+def node_syntax_error(node: str, source: str) -> Optional[str]:
+    """First line of `node --check` output for source, or None when it parses."""
+    with tempfile.NamedTemporaryFile('w', suffix='.js', encoding='utf-8', delete=False) as f:
+        f.write(source)
+    try:
+        result = subprocess.run([node, '--check', f.name], capture_output=True, text=True)
+    finally:
+        os.unlink(f.name)
+    if result.returncode == 0:
+        return None
+    lines = [line for line in result.stderr.splitlines() if 'Error' in line]
+    return lines[0] if lines else result.stderr.strip()
+
+
+def minify_css(source: str) -> str:
+    """Remove comments and redundant whitespace from CSS, leaving string literals untouched."""
+    parts = []
+    text = ''
+    last = 0
+    for match in CSS_TOKEN.finditer(source):
+        text += source[last:match.start()]
+        # Strings are kept verbatim; comments are dropped and the text around them compacted as one piece
+        if match.group(1):
+            parts += [_compact_css(text), match.group(1)]
+            text = ''
+        last = match.end()
+    parts.append(_compact_css(text + source[last:]))
+    return ''.join(parts).strip() + '\n'
+
+
+def _compact_css(text: str) -> str:
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}')
+
+
+class AssetBuilder:
+    def __init__(self, config: Dict, source_dir: str = '.'):
+        """Initialize the builder from the `build` section of the configuration."""
+        build_config = config.get('build', {})
+        self.source_dir = Path(source_dir)
+        self.output_dir = Path(build_config.get('output_dir', 'build'))
+        self.compress_min_bytes = build_config.get('compress_min_bytes', 1024)
+        # Bundle path -> member files in dependency order
+        self.bundles = build_config.get('bundles', {})
+        self.minify = build_config.get('minify', True)
+        self.cache_dir = Path(build_config.get('cache_dir', '.build_cache'))
+        self.exclude_patterns = EXCLUDE_PATTERNS + [self.output_dir.name, self.cache_dir.name]
+        self.include_suffixes = tuple(suffix.lower() for suffix in build_config.get('include', INCLUDE_SUFFIXES))
+        # Directories the other tools write into (local backups with their catalog and snapshot mirror, deploy timings)
+        self.exclude_dirs = self.source_relative([
+            config.get('backup', {}).get('local_dir'),
+            config.get('deploy', {}).get('timings_dir', DEFAULT_TIMINGS_DIR),
+        ])
+
+    def source_relative(self, paths: List[Optional[str]]) -> List[Path]:
+        """The given paths that lie inside the source directory, relative to it."""
+        relative = []
+        for path in paths:
+            if not path:
+                continue
+            try:
+                relative.append(Path(path).resolve().relative_to(self.source_dir.resolve()))
+            except ValueError:
+                continue
+        return relative
+
+    def iter_source_files(self) -> Iterator[Path]:
+        """Yield deployable files (allowed type, not excluded) relative to the source directory."""
+        for root, dirs, files in os.walk(self.source_dir):
+            root_path = Path(root).relative_to(self.source_dir)
+            dirs[:] = sorted(d for d in dirs if not is_excluded(root_path / d, self.exclude_patterns)
+                             and root_path / d not in self.exclude_dirs)
+            for name in sorted(files):
+                relative = root_path / name
+                if relative.suffix.lower() in self.include_suffixes \
+                        and not is_excluded(relative, self.exclude_patterns):
+                    yield relative
+
+    def build_bundle(self, name: str, members: List[str]) -> Tuple[Path, str]:
+        """
+        Minify and concatenate members into a content-hash named file in the output directory.
+        Returns the file and the cache key; the key covers every input, so unchanged bundles are not rebuilt.
+        """
+        suffix = Path(name).suffix
+        sources = [(self.source_dir / member).read_bytes() for member in members]
+        digest = hashlib.sha256(f"{MINIFIER_VERSION}:{self.minify}:{name}".encode())
+        for member, data in zip(members, sources):
+            digest.update(member.encode() + b'\0' + hashlib.sha256(data).digest())
+        key = digest.hexdigest()
+
+        cached = self.cache_dir / f"{key}{suffix}"
+        hit = cached.exists()
+        if hit:
+            content = cached.read_bytes()
+        else:
+            minify = {'.js': minify_js, '.css': minify_css}.get(suffix) if self.minify else None
+            texts = [data.decode('utf-8') for data in sources]
+            if minify:
+                texts = [minify(text) for text in texts]
+            # The semicolon keeps a file without a trailing one from running into the next
+            separator = ';\n' if suffix == '.js' else '\n'
+            content = (separator.join(text.rstrip() for text in texts) + '\n').encode('utf-8')
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            temp_file = cached.with_name(cached.name + '.tmp')
+            temp_file.write_bytes(content)
+            os.replace(temp_file, cached)
+
+        relative = Path(name)
+        relative = relative.with_name(f"{relative.stem}.{hashlib.sha256(content).hexdigest()[:10]}{suffix}")
+        target = self.output_dir / relative
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(content)
+
+        original = sum(len(data) for data in sources)
+        logger.info(
+            f"Bundled {len(members)} files into {relative.as_posix()}: {original / 1024:.1f} KB -> "
+            f"{len(content) / 1024:.1f} KB{' (cached)' if hit else ''}"
+        )
+        return relative, key
+
+    @staticmethod
+    def resolve_reference(page_dir: str, url: str) -> Optional[str]:
+        """Source-relative path a page reference points to, or None for external URLs."""
+        if re.match(r'([a-z][a-z0-9+.-]*:|//)', url, re.IGNORECASE):
+            return None
+        url = url.split('#')[0].split('?')[0]
+        if url.startswith('/'):
+            return posixpath.normpath(url.lstrip('/'))
+        return posixpath.normpath(posixpath.join(page_dir, url))
+
+    def member_tags(self, page: Path, text: str, name: str, members: List[str]) -> List[re.Match]:
+        """Tags of page loading members of bundle name; empty unless the page loads all of them."""
+        page_dir = posixpath.dirname(page.as_posix())
+        pattern = SCRIPT_TAG if name.endswith('.js') else STYLESHEET_TAG
+        matches = [
+            match for match in pattern.finditer(text)
+            if self.resolve_reference(page_dir, match.group('url')) in members
+        ]
+        if {self.resolve_reference(page_dir, match.group('url')) for match in matches} != set(members):
+            return []
+        return matches
+
+    def rewrite_html(self, page: Path, text: str, bundles: Dict[str, Tuple[List[str], Path]]) -> str:
+        """
+        Replace the tags of bundle members with one tag for the bundle, at the position of the first member.
+        Pages that load only some members of a bundle are left alone.
+        """
+        page_dir = posixpath.dirname(page.as_posix())
+        for name, (members, output) in bundles.items():
+            matches = self.member_tags(page, text, name, members)
+            if not matches:
+                continue
+            for match in reversed(matches[1:]):
+                text = text[:match.start()] + text[match.end():]
+            first = matches[0]
+            url = posixpath.relpath(output.as_posix(), page_dir or '.')
+            tag = first.group('tag').replace(first.group('url'), url, 1)
+            text = text[:first.start()] + first.group('indent') + tag + first.group('eol') + text[first.end():]
+        return text
+
+    def bundle(self) -> Tuple[List[Path], Dict[Path, str]]:
+        """
+        Build the configured bundles that at least one HTML page loads all members of (any other bundle would
+        ship unreferenced); returns the bundle files and the rewritten HTML pages.
+        """
+        pages = {}
+        if self.bundles:
+            for relative in self.iter_source_files():
+                if relative.suffix == '.html':
+                    pages[relative] = (self.source_dir / relative).read_text(encoding='utf-8')
+
+        bundles = {}
+        keys = set()
+        for name, members in self.bundles.items():
+            normalized = [posixpath.normpath(member) for member in members]
+            if not any(self.member_tags(page, text, name, normalized) for page, text in pages.items()):
+                logger.info(f"Skipped bundle {name}: no HTML page loads all of its members")
+                continue
+            output, key = self.build_bundle(name, members)
+            bundles[name] = (normalized, output)
+            keys.add(key)
+
+        rewrites = {}
+        if bundles:
+            for relative, text in pages.items():
+                rewritten = self.rewrite_html(relative, text, bundles)
+                if rewritten != text:
+                    rewrites[relative] = rewritten
+            logger.info(f"Rewrote bundle references in {len(rewrites)} HTML pages")
+
+        # Drop cache entries of inputs that no longer exist
+        if self.cache_dir.exists():
+            for path in self.cache_dir.iterdir():
+                if path.stem not in keys:
+                    path.unlink()
+        return [output for _, output in bundles.values()], rewrites
+
+    def stage(self, rewrites: Optional[Dict[Path, str]] = None) -> Tuple[List[Path], Set[Path]]:
+        """
+        Copy new or changed files into the output directory; pages in rewrites get the rewritten text.
+        Returns all staged files and the ones written by this run.
+        """
+        rewrites = rewrites or {}
+        staged = []
+        updated = set()
+        for relative in self.iter_source_files():
+            source = self.source_dir / relative
+            target = self.output_dir / relative
+            source_stat = source.stat()
+            if relative in rewrites:
+                data = rewrites[relative].encode('utf-8')
+                if not target.exists() or target.read_bytes() != data:
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    target.write_bytes(data)
+                    updated.add(relative)
+            elif not target.exists() or target.stat().st_size != source_stat.st_size \
+                    or target.stat().st_mtime_ns != source_stat.st_mtime_ns:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(source, target)
+                updated.add(relative)
+            staged.append(relative)
+
+        logger.info(f"Staged {len(staged)} files into {self.output_dir} ({len(updated)} updated)")
+        return staged, updated
+
+    def precompress(self, files: List[Path], updated: Optional[Set[Path]] = None) -> List[Path]:
+        """
+        Write .gz/.br variants for compressible files above the size threshold.
+        Each variant carries the mtime of the file it was compressed from and is rewritten when that no longer
+        matches exactly, or when the file is in updated: copy2 keeps the source mtime, so a restaged file can be
+        older than its previous variants (git checkout, cp -p, restores).
+        """
+        updated = updated or set()
+        variants = []
+        original_total = compressed_total = 0
+        for relative in files:
+            if relative.suffix not in COMPRESSIBLE_SUFFIXES:
+                continue
+            target = self.output_dir / relative
+            target_stat = target.stat()
+            if target_stat.st_size < self.compress_min_bytes:
+                continue
+            data = None
+            for suffix, compress in self._compressors():
+                variant = target.with_name(target.name + suffix)
+                if relative in updated or not variant.exists() \
+                        or variant.stat().st_mtime_ns != target_stat.st_mtime_ns:
+                    if data is None:
+                        data = target.read_bytes()
+                    compressed = compress(data)
+                    if len(compressed) >= len(data):
+                        continue
+                    variant.write_bytes(compressed)
+                    os.utime(variant, ns=(target_stat.st_atime_ns, target_stat.st_mtime_ns))
+                variants.append(relative.with_name(relative.name + suffix))
+                if suffix == '.gz':
+                    original_total += target_stat.st_size
+                    compressed_total += variant.stat().st_size
+
+        if original_total:
+            logger.info(
+                f"Precompressed {len(variants)} variants: gzip {original_total / 1024:.1f} KB -> "
+                f"{compressed_total / 1024:.1f} KB{'' if brotli else ' (brotli not installed, .br skipped)'}"
+            )
+        return variants
+
+    @staticmethod
+    def _compressors():
+        yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            yield '.br', lambda data: brotli.compress(data, quality=11)
+
+    def remove_stale(self, keep: List[Path]) -> None:
+        """Delete files in the output directory that are no longer produced."""
+        keep = {str(path) for path in keep}
+        for path in sorted(self.output_dir.rglob('*'), reverse=True):
+            relative = path.relative_to(self.output_dir)
+            if path.is_dir():
+                if not any(path.iterdir()):
+                    path.rmdir()
+            elif str(relative) not in keep:
+                path.unlink()
+
+    def manifest(self) -> Dict[str, Dict]:
+        """Content-hash manifest of the output directory: relative path -> sha256 and size."""
+        files = {}
+        for path in sorted(self.output_dir.rglob('*')):
+            if path.is_file():
+                data = path.read_bytes()
+                files[path.relative_to(self.output_dir).as_posix()] = {
+                    'sha256': hashlib.sha256(data).hexdigest(),
+                    'size': len(data),
+                }
+        return files
+
+    def check_minifiers(self) -> List[str]:
+        """
+        Minify every JS/CSS source file and compare the result with the original: it must keep the same significant
+        tokens, minifying it again must not change it and, for JS when node is installed, it must still parse.
+        Returns the problems found.
+        """
+        node = shutil.which('node')
+        problems = []
+        checked = 0
+        for relative in self.iter_source_files():
+            minify = {'.js': minify_js, '.css': minify_css}.get(relative.suffix)
+            if minify is None:
+                continue
+            checked += 1
+            source = (self.source_dir / relative).read_text(encoding='utf-8')
+            minified = minify(source)
+            expected = significant_tokens(source, relative.suffix)
+            actual = significant_tokens(minified, relative.suffix)
+            if actual != expected:
+                index = next((i for i, (a, b) in enumerate(zip(expected, actual)) if a != b),
+                             min(len(expected), len(actual)))
+                problems.append(f"{relative.as_posix()}: token {index} changed from "
+                                f"{expected[index:index + 1]} to {actual[index:index + 1]}")
+            if minify(minified) != minified:
+                problems.append(f"{relative.as_posix()}: minifying the output again changes it")
+            if node and relative.suffix == '.js':
+                error = node_syntax_error(node, minified)
+                if error and not node_syntax_error(node, source):
+                    problems.append(f"{relative.as_posix()}: minified output does not parse: {error}")
+            logger.info(f"Checked {relative.as_posix()}: {len(source) / 1024:.1f} KB -> {len(minified) / 1024:.1f} KB")
+        logger.info(f"Checked the minifiers against {checked} files"
+                    f"{'' if node else ' (node not installed, JS syntax check skipped)'}")
+        return problems
+
+    def build(self) -> Path:
+        """Run all build stages and return the output directory."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        bundles, rewrites = self.bundle()
+        staged, updated = self.stage(rewrites)
+        files = staged + bundles
+        variants = self.precompress(files, updated)
+        self.remove_stale(files + variants)
+        return self.output_dir
+
+
+def main():
+    # Configure logging here so that importing this module keeps the caller's logging setup
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+
+    parser = argparse.ArgumentParser(description='Static asset build')
+    parser.add_argument('--config', default='tools/config.json', help='Path to configuration file')
+    parser.add_argument('--check', action='store_true',
+                        help='Verify the JS/CSS minifiers against the source files instead of building')
+    args = parser.parse_args()
+
+    try:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        logger.error(f"Configuration file not found: {args.config}")
+        sys.exit(1)
+
+    if args.check:
+        problems = AssetBuilder(config).check_minifiers()
+        for problem in problems:
+            logger.error(problem)
+        if problems:
+            sys.exit(1)
+        logger.info("Minifier check passed")
+        return
+
+    output_dir = AssetBuilder(config).build()
+    logger.info(f"Build completed: {output_dir}")
+
+
+if __name__ == '__main__':
+    main()
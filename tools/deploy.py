@@ -7,8 +7,10 @@ Stable Deploy - Using Nginx + Backend HTTP Server (Like 5001 site)
 
 import os
 import sys
+import json
 import logging
-import paramiko
+from releases import ReleaseManager
+from remote import close_all, get_host, wait_until
 
 # Configure logging
 logging.basicConfig(
@@ -18,31 +20,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+SERVER = {
+    'host': 'op.gaowei.com',
+    'username': 'root',
+    'key_path': '~/.ssh/id_rsa'
+}
+
+APP_DIR = '/var/www/fangcheng'
+
+# Uploaded as the backend that answers /health and /metrics behind nginx
+BACKEND_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'game_server.py')
+# Written as backend_config.json next to it (server_config.json format of game_server.py)
+BACKEND_SETTINGS = {
+    'port': 9000,
+    'directory': f"{APP_DIR}/current",
+    'server_mode': 'threaded',
+    'max_workers': 8,
+}
+
 def deploy_stable_https():
     """Deploy stable HTTPS using nginx + backend server"""
     try:
         logger.info("Starting stable nginx HTTPS deployment...")
         
-        # SSH connection
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect('op.gaowei.com', username='root', 
-                   key_filename=os.path.expanduser('~/.ssh/id_rsa'))
+        # SSH connection (shared pool)
+        ssh = get_host(SERVER).connect()
         
         logger.info("SSH connected successfully")
         
-        # Step 1: Stop old unstable python https servers
-        ssh.exec_command("pkill -f 'python3.*https_server'")
-        logger.info("Stopped old unstable python HTTPS servers")
+        # nginx and the backend serve {APP_DIR}/current; on a server still using the flat layout every page would
+        # become a 404 after the reload, so stop before touching anything
+        exit_status, _, _ = ssh.run(f"test -L {APP_DIR}/current && test -d {APP_DIR}/current/")
+        if exit_status != 0:
+            logger.error(f"{APP_DIR}/current is missing or does not point to a release directory; "
+                         f"deploy a release first (python tools/simple_deploy.py) and run this again")
+            return False
         
-        # Step 2: Start stable HTTP backend server (port 9000)
-        stdin, stdout, stderr = ssh.exec_command("cd /var/www/fangcheng && pkill -f 'python3.*http.server.*9000' || true")
-        stdin, stdout, stderr = ssh.exec_command("cd /var/www/fangcheng && nohup python3 -m http.server 9000 > backend.log 2>&1 & echo $!")
-        backend_pid = stdout.read().decode().strip()
+        # Step 1-2: Stop old unstable python https servers and start the backend (port 9000)
+        # nginx serves the static files itself; the backend (tools/game_server.py) only answers /health and /metrics
+        sftp = ssh.open_sftp()
+        sftp.put(BACKEND_SCRIPT, f"{APP_DIR}/backend.py")
+        with sftp.open(f"{APP_DIR}/backend_config.json", 'w') as f:
+            f.write(json.dumps(BACKEND_SETTINGS, indent=4))
+        result = ssh.batch(stop_on_error=False) \
+            .add("pkill -f 'python3.*https_server' || true", 'stop_https') \
+            .add(f"cd {APP_DIR} && pkill -f 'python3.*(http.server.*9000|backend.py)' || true", 'stop_backend') \
+            .add(f"cd {APP_DIR} && nohup python3 backend.py --config backend_config.json --single "
+                 f"> backend.log 2>&1 & echo $!", 'start_backend') \
+            .run()
+        logger.info("Stopped old unstable python HTTPS servers")
+        backend_pid = result['start_backend'].stdout.strip()
         logger.info(f"Started HTTP backend server on port 9000 (PID: {backend_pid})")
         
         # Step 3: Create nginx server block for port 8888
-        nginx_config = '''
+        nginx_config = r'''
     server {
         listen 8888 ssl;
         server_name op.gaowei.com;
@@ -54,13 +85,49 @@ def deploy_stable_https():
         ssl_ciphers HIGH:!aNULL:!MD5;
         ssl_prefer_server_ciphers on;
         
+        # Static files are served from disk; only /health and /metrics reach the backend
+        root /var/www/fangcheng/current;
+        index index.html;
+        
+        sendfile on;
+        tcp_nopush on;
+        
+        # Precompressed .gz variants are written next to HTML/JS/CSS files by tools/build.py
+        gzip_static on;
+        gzip_vary on;
+        
+        # Fingerprinted bundles (app.<content hash>.js/css from tools/build.py) never change, so only their
+        # descriptors are cached; cached HTML or unversioned files would outlive a switch of the `current` symlink
+        location ~* "\.[0-9a-f]{8,}\.(js|css)$" {
+            add_header Cache-Control "public, max-age=31536000, immutable";
+            open_file_cache max=1000 inactive=60s;
+            open_file_cache_valid 30s;
+            open_file_cache_min_uses 2;
+            open_file_cache_errors on;
+        }
+        
+        # HTML and unversioned files are revalidated with ETag/Last-Modified on every use
         location / {
+            add_header Cache-Control "no-cache";
+            try_files $uri $uri/ =404;
+        }
+        
+        location = /health {
             proxy_pass http://localhost:9000;
             proxy_set_header Host $host;
             proxy_set_header X-Real-IP $remote_addr;
             proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
             proxy_set_header X-Forwarded-Proto $scheme;
-            proxy_read_timeout 600s;
+        }
+        
+        # Prometheus metrics are for scrapers on this host only (add `allow` lines for others)
+        location = /metrics {
+            allow 127.0.0.1;
+            allow ::1;
+            deny all;
+            proxy_pass http://localhost:9000;
+            proxy_set_header Host $host;
+            proxy_set_header X-Real-IP $remote_addr;
         }
         
         access_log /var/log/nginx/fangcheng_8888.log;
@@ -68,65 +135,102 @@ def deploy_stable_https():
     }
 '''
         
-        # Step 4: Add server block to nginx config
-        stdin, stdout, stderr = ssh.exec_command(f"""
-        # Backup original config
-        cp /usr/local/nginx/conf/nginx.conf /usr/local/nginx/conf/nginx.conf.backup
-        
-        # Remove old 8888 server block if exists
-        sed -i '/# Fangcheng 8888 server/,/# End Fangcheng 8888/d' /usr/local/nginx/conf/nginx.conf
-        
-        # Add new server block before the last closing brace
-        sed -i '$i\\    # Fangcheng 8888 server' /usr/local/nginx/conf/nginx.conf
-        sed -i '$i\\{nginx_config}' /usr/local/nginx/conf/nginx.conf
-        sed -i '$i\\    # End Fangcheng 8888' /usr/local/nginx/conf/nginx.conf
-        """)
-        
+        # Step 4-5: Add server block to nginx config and test it, in one round trip
+        # The block is uploaded as a file and spliced in before the closing brace of the http block; passing it
+        # through `sed i\` would strip the backslashes of the location regex
+        nginx_conf = '/usr/local/nginx/conf/nginx.conf'
+        block_file = f"{nginx_conf}.fangcheng_8888"
+        with sftp.open(block_file, 'w') as f:
+            f.write(f"    # Fangcheng 8888 server{nginx_config}    # End Fangcheng 8888\n")
+        result = ssh.batch() \
+            .add(f"cp {nginx_conf} {nginx_conf}.backup", 'backup') \
+            .add(f"sed -i '/# Fangcheng 8888 server/,/# End Fangcheng 8888/d' {nginx_conf}", 'remove_old') \
+            .add(f"{{ head -n -1 {nginx_conf}; cat {block_file}; tail -n 1 {nginx_conf}; }} > {nginx_conf}.new "
+                 f"&& cat {nginx_conf}.new > {nginx_conf} && rm -f {nginx_conf}.new {block_file}", 'server_block') \
+            .add("/usr/local/nginx/sbin/nginx -t", 'test') \
+            .run()
+        logger.info(f"Remote steps: {result.describe()}")
+        
+        if result['test'].skipped:
+            logger.error(f"Updating nginx configuration failed: {result.describe()}")
+            return False
         logger.info("Added nginx server block for port 8888")
         
-        # Step 5: Test and reload nginx
-        stdin, stdout, stderr = ssh.exec_command("/usr/local/nginx/sbin/nginx -t")
-        test_result = stdout.read().decode() + stderr.read().decode()
+        test_result = result['test'].stdout + result['test'].stderr
         
         if "syntax is ok" in test_result and "test is successful" in test_result:
             logger.info("Nginx configuration test passed")
             
             # Reload nginx
-            stdin, stdout, stderr = ssh.exec_command("/usr/local/nginx/sbin/nginx -s reload")
+            exit_status, _, error = ssh.run("/usr/local/nginx/sbin/nginx -s reload")
+            if exit_status != 0:
+                logger.error(f"Nginx reload failed: {error.strip()}")
+                return False
             logger.info("Nginx reloaded successfully")
             
-            # Step 6: Verify services
-            import time
-            time.sleep(3)
+            # Step 6: Verify services, polling with backoff instead of a fixed sleep
+            listening = {}
+            
+            def services_listening():
+                checks = ssh.batch(stop_on_error=False) \
+                    .add("netstat -tlnp | grep :9000", 'backend') \
+                    .add("netstat -tlnp | grep :8888", 'nginx') \
+                    .run()
+                listening.update({step.name: bool(step.stdout.strip()) for step in checks})
+                return all(listening.values())
+            
+            wait_until(services_listening, timeout=10)
             
             # Check backend
-            stdin, stdout, stderr = ssh.exec_command("netstat -tlnp | grep :9000")
-            if stdout.read().strip():
+            if listening.get('backend'):
                 logger.info("✅ Backend HTTP server (9000) is running")
             else:
                 logger.warning("⚠️ Backend HTTP server (9000) not detected")
             
             # Check nginx
-            stdin, stdout, stderr = ssh.exec_command("netstat -tlnp | grep :8888")
-            if stdout.read().strip():
+            if listening.get('nginx'):
                 logger.info("✅ Nginx HTTPS proxy (8888) is running")
             else:
                 logger.warning("⚠️ Nginx HTTPS proxy (8888) not detected")
             
             logger.info("🎉 Stable HTTPS deployment completed!")
             logger.info("Access URL: https://op.gaowei.com:8888")
-            logger.info("Architecture: Nginx (HTTPS:8888) -> Backend (HTTP:9000)")
+            logger.info("Architecture: Nginx (HTTPS:8888, static files) -> Backend (HTTP:9000, /health and /metrics)")
             
         else:
             logger.error(f"Nginx configuration test failed: {test_result}")
             return False
         
-        ssh.close()
+        close_all()
         return True
         
     except Exception as e:
         logger.error(f"Stable deployment failed: {e}")
         return False
 
+def rollback_release(release=None):
+    """Point the `current` symlink back to the previous (or given) release"""
+    try:
+        ssh = get_host(SERVER).connect()
+        
+        release = ReleaseManager(ssh, '/var/www/fangcheng').rollback(release)
+        logger.info(f"Rolled back to release {release}")
+        
+        close_all()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Rollback failed: {e}")
+        return False
+
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Stable nginx HTTPS deployment')
+    parser.add_argument('--rollback', nargs='?', const='', metavar='RELEASE',
+                        help='Point current back to the previous release (or the given one) and exit')
+    args = parser.parse_args()
+    
+    if args.rollback is not None:
+        sys.exit(0 if rollback_release(args.rollback or None) else 1)
     deploy_stable_https() 
\ No newline at end of file
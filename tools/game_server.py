@@ -0,0 +1,1118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+游戏静态文件服务器 - 由 SimpleDeploy.create_server_script 上传为 server.py
+支持两种并发模式：有界线程池（threaded）和 asyncio 事件循环（asyncio）
+按 Accept-Encoding 直接返回构建阶段生成的 .br/.gz 预压缩文件
+/metrics 以 Prometheus 文本格式输出请求数、响应时间直方图、缓存命中率和进程内存
+大文件用 sendfile 零拷贝发送；支持 Range 请求和 HTTP/1.1 keep-alive
+POSIX 平台上由主进程预派生多个 worker 共享同一个监听 socket，收到 SIGHUP 时平滑替换全部 worker
+"""
+
+import os
+import re
+import sys
+import json
+import stat
+import time
+import bisect
+import signal
+import socket
+import select
+import shutil
+import hashlib
+import asyncio
+import argparse
+import mimetypes
+import posixpath
+import threading
+import tempfile
+import subprocess
+import http.server
+from http import HTTPStatus
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, mktime_tz, parsedate_tz
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SETTINGS_FILE = os.path.join(SCRIPT_DIR, 'server_config.json')
+
+DEFAULT_SETTINGS = {
+    'port': 88,
+    'directory': SCRIPT_DIR,
+    'server_mode': 'threaded',
+    'max_workers': 32,
+    'cache_max_bytes': 32 * 1024 * 1024,
+    # 不小于此大小的文件不读入内存，直接用 sendfile 从文件发送
+    'sendfile_min_bytes': 256 * 1024,
+    # keep-alive 连接的空闲超时（秒）
+    'keepalive_timeout': 5,
+    # worker 进程数，0 表示每个CPU一个
+    'workers': 0,
+    # 主进程写入的 PID 文件和状态文件（JSON：代数、worker PID），为空则不写
+    'pid_file': None,
+    'status_file': None,
+}
+
+SERVER_MODES = ('threaded', 'asyncio')
+
+# 等待新 worker 就绪、旧 worker 处理完已有请求的最长时间（秒）
+WORKER_START_TIMEOUT = 10
+WORKER_DRAIN_TIMEOUT = 30
+
+# 构建阶段（tools/build.py）为这些文件生成预压缩变体，按优先级排列
+COMPRESSIBLE_SUFFIXES = ('.html', '.js', '.css')
+ENCODING_SUFFIXES = OrderedDict([('br', '.br'), ('gzip', '.gz')])
+
+# 构建阶段生成的带内容哈希的文件名（如 app.f3f16767e6.js）内容永不变化，可长期缓存；其余文件每次使用前重新验证
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{8,}\.(?:js|css)$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# 响应时间直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def load_settings(path: str = SETTINGS_FILE) -> dict:
+    """加载服务器配置，缺失的键使用默认值"""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        with open(path, 'r') as f:
+            settings.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    return settings
+
+
+class Response:
+    """一次HTTP响应：状态码、响应头，以及内存中的响应体或待 sendfile 的文件区间 (路径, 偏移, 长度)"""
+
+    __slots__ = ('status', 'headers', 'body', 'file_range')
+
+    def __init__(self, status: int, headers: Optional[List[Tuple[str, str]]] = None, body: bytes = b'',
+                 file_range: Optional[Tuple[str, int, int]] = None):
+        self.status = status
+        self.headers = headers or []
+        self.body = body
+        self.file_range = file_range
+
+    @property
+    def length(self) -> int:
+        return self.file_range[2] if self.file_range else len(self.body)
+
+
+class Asset:
+    """一个静态文件及预先计算的强ETag；body 为 None 时文件不在内存中，发送时走 sendfile"""
+
+    __slots__ = ('fs_path', 'body', 'size', 'etag', 'signature', 'mtime', 'last_modified', 'content_type')
+
+    def __init__(self, fs_path: str, body: Optional[bytes], etag: str, st: os.stat_result):
+        self.fs_path = fs_path
+        self.body = body
+        self.size = st.st_size
+        self.etag = etag
+        self.signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        self.mtime = int(st.st_mtime)
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        # 预压缩变体（xxx.js.gz）使用原文件的类型
+        base_path, suffix = os.path.splitext(fs_path)
+        self.content_type = StaticSite.guess_type(base_path if suffix in ENCODING_SUFFIXES.values() else fs_path)
+
+
+class AssetCache:
+    """按路径缓存文件内容和ETag，通过 mtime/大小/inode 发现文件变化，总大小超过上限时按LRU淘汰
+
+    大文件（不小于 sendfile_min_bytes 或超过缓存上限）只缓存元数据和ETag，不占用缓存容量
+    """
+
+    def __init__(self, max_bytes: int, sendfile_min_bytes: int = 256 * 1024):
+        self.max_bytes = max_bytes
+        self.sendfile_min_bytes = sendfile_min_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fs_path: str) -> Asset:
+        """返回文件对应的 Asset；目录抛出 IsADirectoryError，其余错误同 open()"""
+        st = os.stat(fs_path)
+        if stat.S_ISDIR(st.st_mode):
+            raise IsADirectoryError(fs_path)
+
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._lock:
+            asset = self._entries.get(fs_path)
+            if asset is not None and asset.signature == signature:
+                self._entries.move_to_end(fs_path)
+                self.hits += 1
+                return asset
+            self.misses += 1
+
+        with open(fs_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size >= self.sendfile_min_bytes or st.st_size > self.max_bytes:
+                digest = hashlib.blake2b(digest_size=16)
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+                asset = Asset(fs_path, None, '"%s"' % digest.hexdigest(), st)
+            else:
+                body = f.read()
+                asset = Asset(fs_path, body, '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest(), st)
+
+        with self._lock:
+            old = self._entries.pop(fs_path, None)
+            if old is not None:
+                self.size -= self.cost(old)
+            self._entries[fs_path] = asset
+            self.size += self.cost(asset)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= self.cost(evicted)
+        return asset
+
+    @staticmethod
+    def cost(asset: Asset) -> int:
+        return len(asset.body) if asset.body is not None else 0
+
+
+class MetricsShard:
+    """单个线程独占的计数器，只有所属线程写入，因此不需要加锁"""
+
+    __slots__ = ('requests', 'buckets', 'seconds', 'bytes_sent', 'opened', 'closed')
+
+    def __init__(self):
+        self.requests = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.seconds = 0.0
+        self.bytes_sent = 0
+        self.opened = 0
+        self.closed = 0
+
+
+class ServerMetrics:
+    """请求指标：每个线程写自己的 MetricsShard，抓取 /metrics 时再汇总
+
+    预派生模式下每个 worker 各有一份计数器。shared_dir 为主进程创建的指标目录时，
+    worker 把自己的快照写入 worker-<pid>.json（计数变化时每 METRICS_PUBLISH_INTERVAL 秒一次，
+    且每次抓取前立即写一次），/metrics 汇总目录中全部 worker 的快照和主进程保存的已退出 worker 计数
+    （retired.json），因此无论由哪个 worker 响应，计数器都是整个服务器的累计值，且不会回退；
+    其他 worker 的计数最多滞后一个 METRICS_PUBLISH_INTERVAL。
+    """
+
+    def __init__(self, shared_dir: Optional[str] = None):
+        self.started = time.time()
+        self.shared_dir = shared_dir
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._published: Optional[dict] = None
+
+    def _shard(self) -> MetricsShard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            # 每个线程只在第一次使用时加锁登记一次
+            shard = self._local.shard = MetricsShard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def connection_opened(self) -> None:
+        self._shard().opened += 1
+
+    def connection_closed(self) -> None:
+        self._shard().closed += 1
+
+    def observe(self, path: str, status: int, seconds: float, bytes_sent: int) -> None:
+        shard = self._shard()
+        # 404 的路径不作为标签，避免扫描器造成标签数量无限增长
+        key = (path if status != 404 else '<unmatched>', status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        shard.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        shard.seconds += seconds
+        shard.bytes_sent += bytes_sent
+
+    def snapshot(self, cache: AssetCache) -> dict:
+        """汇总本进程所有线程的计数器，返回可写成 JSON 的快照"""
+        with self._shards_lock:
+            shards = list(self._shards)
+        requests = {}
+        buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        seconds = 0.0
+        bytes_sent = opened = closed = 0
+        for shard in shards:
+            for key, count in shard.requests.copy().items():
+                requests[key] = requests.get(key, 0) + count
+            for index, count in enumerate(list(shard.buckets)):
+                buckets[index] += count
+            seconds += shard.seconds
+            bytes_sent += shard.bytes_sent
+            opened += shard.opened
+            closed += shard.closed
+        return {
+            'pid': os.getpid(),
+            'requests': [[path, status, count] for (path, status), count in sorted(requests.items())],
+            'buckets': buckets,
+            'seconds': seconds,
+            'bytes_sent': bytes_sent,
+            'cache_hits': cache.hits,
+            'cache_misses': cache.misses,
+            'started': self.started,
+            'active': opened - closed,
+            'cache_bytes': cache.size,
+            'rss': process_rss_bytes(),
+        }
+
+    def publish(self, cache: AssetCache, force: bool = True) -> None:
+        """把本 worker 的快照写入共享指标目录；force 为 False 时计数没有变化就不写"""
+        with self._publish_lock:
+            snapshot = self.snapshot(cache)
+            unchanged = dict(snapshot, rss=None) == self._published
+            if force or not unchanged:
+                write_json(worker_metrics_path(self.shared_dir, os.getpid()), snapshot)
+                self._published = dict(snapshot, rss=None)
+
+    def render(self, cache: AssetCache) -> bytes:
+        """输出 Prometheus 文本格式；预派生模式下为全部 worker 的合计"""
+        if self.shared_dir:
+            self.publish(cache)
+            return render_metrics(collect_metrics(self.shared_dir))
+        totals = merge_metrics([self.snapshot(cache)])
+        totals['workers'] = 1
+        return render_metrics(totals)
+
+
+# 按 worker 相加的累计值；已退出 worker 的这些计数由主进程并入 retired.json
+METRICS_COUNTERS = ('seconds', 'bytes_sent', 'cache_hits', 'cache_misses')
+# 只统计在运行的 worker 的瞬时值
+METRICS_GAUGES = ('active', 'cache_bytes', 'rss')
+# worker 写指标快照的间隔（秒）
+METRICS_PUBLISH_INTERVAL = 0.5
+RETIRED_METRICS_FILE = 'retired.json'
+
+
+def write_json(path: str, data) -> None:
+    """先写临时文件再 rename，读取方不会看到写了一半的文件"""
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_file, path)
+
+
+def read_json(path: str):
+    """读取 JSON 文件，不存在或无法解析时返回 None"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def worker_metrics_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"worker-{pid}.json")
+
+
+def merge_metrics(snapshots: List[dict], gauges: bool = True) -> dict:
+    """合并多个指标快照：请求数和直方图按标签/桶相加；gauges 为 False 时丢弃瞬时值（已退出的 worker）"""
+    requests = {}
+    merged = {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'started': None, 'rss': None}
+    for field in METRICS_COUNTERS + METRICS_GAUGES:
+        merged.setdefault(field, 0)
+    for snapshot in snapshots:
+        for path, status, count in snapshot['requests']:
+            requests[(path, status)] = requests.get((path, status), 0) + count
+        for index, count in enumerate(snapshot['buckets']):
+            merged['buckets'][index] += count
+        for field in METRICS_COUNTERS:
+            merged[field] += snapshot[field]
+        if snapshot.get('started') is not None:
+            merged['started'] = min(merged['started'] or snapshot['started'], snapshot['started'])
+        if gauges:
+            merged['active'] += snapshot['active']
+            merged['cache_bytes'] += snapshot['cache_bytes']
+            if snapshot.get('rss') is not None:
+                merged['rss'] = (merged['rss'] or 0) + snapshot['rss']
+    if not gauges:
+        merged['active'] = merged['cache_bytes'] = 0
+        merged['rss'] = None
+    merged['requests'] = [[path, status, count] for (path, status), count in sorted(requests.items())]
+    return merged
+
+
+def collect_metrics(directory: str) -> dict:
+    """汇总指标目录中在运行的 worker 快照和已退出 worker 的累计值"""
+    live = []
+    # 先读 worker 快照再读 retired.json：主进程先更新 retired.json 再删除快照，
+    # 所以刚退出的 worker 要么只在快照里，要么已在 retired.json 的 pids 中（此时跳过快照），不会重复或漏算
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('worker-') and name.endswith('.json'):
+            snapshot = read_json(os.path.join(directory, name))
+            if snapshot is not None:
+                live.append(snapshot)
+    retired = read_json(os.path.join(directory, RETIRED_METRICS_FILE)) or {'pids': [], 'totals': None}
+    live = [snapshot for snapshot in live if snapshot['pid'] not in retired['pids']]
+    totals = merge_metrics(live)
+    if retired['totals']:
+        counters = merge_metrics([totals, retired['totals']], gauges=False)
+        for field in ('requests', 'buckets', 'started') + METRICS_COUNTERS:
+            totals[field] = counters[field]
+    totals['workers'] = len(live)
+    return totals
+
+
+def render_metrics(totals: dict) -> bytes:
+    """把 merge_metrics 的结果输出为 Prometheus 文本格式"""
+    lines = [
+        '# HELP fangcheng_http_requests_total HTTP requests by path and status.',
+        '# TYPE fangcheng_http_requests_total counter',
+    ]
+    for path, status, count in totals['requests']:
+        label = path.replace('\\', '\\\\').replace('"', '\\"')
+        lines.append(f'fangcheng_http_requests_total{{path="{label}",status="{status}"}} {count}')
+
+    lines += [
+        '# HELP fangcheng_http_request_duration_seconds Time to build and send a response.',
+        '# TYPE fangcheng_http_request_duration_seconds histogram',
+    ]
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), totals['buckets']):
+        cumulative += count
+        lines.append(f'fangcheng_http_request_duration_seconds_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f'fangcheng_http_request_duration_seconds_sum {totals["seconds"]:.6f}')
+    lines.append(f'fangcheng_http_request_duration_seconds_count {cumulative}')
+
+    hits, misses = totals['cache_hits'], totals['cache_misses']
+    lookups = hits + misses
+    gauges = [
+        ('fangcheng_http_response_bytes_total', 'counter', 'Response body bytes sent.', totals['bytes_sent']),
+        ('fangcheng_http_active_connections', 'gauge', 'Connections being served.', totals['active']),
+        ('fangcheng_cache_hits_total', 'counter', 'Asset cache hits.', hits),
+        ('fangcheng_cache_misses_total', 'counter', 'Asset cache misses.', misses),
+        ('fangcheng_cache_hit_ratio', 'gauge', 'Asset cache hit ratio.', hits / lookups if lookups else 0.0),
+        ('fangcheng_cache_bytes', 'gauge', 'Bytes held in the asset caches.', totals['cache_bytes']),
+        ('fangcheng_workers', 'gauge', 'Worker processes reporting metrics.', totals['workers']),
+        ('fangcheng_process_start_time_seconds', 'gauge', 'Server start time (unix seconds).', totals['started']),
+    ]
+    if totals['rss'] is not None:
+        gauges.append(('fangcheng_process_resident_memory_bytes', 'gauge', 'Resident set size of all workers.',
+                       totals['rss']))
+    for name, kind, description, value in gauges:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', f'{name} {value}']
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def process_rss_bytes() -> Optional[int]:
+    """当前进程常驻内存（Linux 读 /proc，其余平台返回 None）"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class StaticSite:
+    """与传输层无关的请求处理：/health 路由和静态文件"""
+
+    def __init__(self, directory: str, cache_max_bytes: int = 0, sendfile_min_bytes: int = 256 * 1024,
+                 metrics_dir: Optional[str] = None):
+        self.directory = directory
+        self.assets = AssetCache(cache_max_bytes, sendfile_min_bytes)
+        self.metrics = ServerMetrics(metrics_dir)
+
+    def translate_path(self, path: str) -> str:
+        """把URL路径映射到文件系统路径（与 SimpleHTTPRequestHandler 相同的规则）"""
+        trailing_slash = path.endswith('/')
+        path = posixpath.normpath(unquote(path))
+        fs_path = self.directory
+        for part in path.split('/'):
+            if not part or part in (os.curdir, os.pardir) or os.path.dirname(part):
+                continue
+            fs_path = os.path.join(fs_path, part)
+        if trailing_slash:
+            fs_path += '/'
+        return fs_path
+
+    def handle(self, method: str, target: str, headers: Dict[str, str]) -> Response:
+        """处理 GET/HEAD 请求，headers 的键为小写"""
+        path = urlsplit(target).path
+        if path == '/health':
+            return Response(200, [('Content-Type', 'text/plain'), ('Content-Length', '8')], b'healthy\n')
+        if path == '/metrics':
+            body = self.metrics.render(self.assets)
+            return Response(200, [('Content-Type', 'text/plain; version=0.0.4'),
+                                  ('Content-Length', str(len(body)))], body)
+
+        fs_path = self.translate_path(path)
+        try:
+            try:
+                asset = self.assets.get(fs_path)
+            except IsADirectoryError:
+                if not path.endswith('/'):
+                    return Response(301, [('Location', path + '/'), ('Content-Length', '0')])
+                fs_path = os.path.join(fs_path, 'index.html')
+                asset = self.assets.get(fs_path)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return self.error(404)
+        except PermissionError:
+            return self.error(403)
+
+        extra_headers = []
+        if fs_path.endswith(COMPRESSIBLE_SUFFIXES):
+            extra_headers.append(('Vary', 'Accept-Encoding'))
+            encoding, variant = self.negotiate_variant(fs_path, headers.get('accept-encoding', ''))
+            if variant is not None:
+                asset = variant
+                extra_headers.append(('Content-Encoding', encoding))
+
+        validators = [
+            ('ETag', asset.etag),
+            ('Last-Modified', asset.last_modified),
+            ('Cache-Control', self.cache_control(fs_path)),
+        ]
+        if self.not_modified(asset, headers):
+            return Response(304, validators + extra_headers)
+
+        status, start, length = 200, 0, asset.size
+        extra_headers.append(('Accept-Ranges', 'bytes'))
+        if method == 'GET' and 'range' in headers and self.if_range_matches(asset, headers):
+            byte_range = self.parse_range(headers['range'], asset.size)
+            if byte_range == 'unsatisfiable':
+                return Response(416, [('Content-Range', f'bytes */{asset.size}'), ('Content-Length', '0')]
+                                + validators + extra_headers)
+            if byte_range is not None:
+                status, (start, length) = 206, byte_range
+                extra_headers.append(('Content-Range', f'bytes {start}-{start + length - 1}/{asset.size}'))
+
+        headers_out = [
+            ('Content-Type', asset.content_type),
+            ('Content-Length', str(length)),
+        ] + validators + extra_headers
+        if asset.body is None:
+            return Response(status, headers_out, file_range=(asset.fs_path, start, length))
+        body = asset.body if status == 200 else memoryview(asset.body)[start:start + length]
+        return Response(status, headers_out, body)
+
+    @staticmethod
+    def cache_control(fs_path: str) -> str:
+        return IMMUTABLE_CACHE_CONTROL if FINGERPRINTED.search(fs_path) else REVALIDATE_CACHE_CONTROL
+
+    @staticmethod
+    def parse_range(value: str, size: int):
+        """解析单个字节区间，返回 (起点, 长度)；多区间或格式错误返回 None（按完整响应处理），
+        无法满足时返回 'unsatisfiable'"""
+        unit, _, spec = value.partition('=')
+        if unit.strip().lower() != 'bytes' or ',' in spec:
+            return None
+        first, _, last = spec.strip().partition('-')
+        try:
+            if not first:
+                suffix = int(last)
+                if suffix <= 0:
+                    return 'unsatisfiable'
+                start = max(size - suffix, 0)
+                end = size - 1
+            else:
+                start = int(first)
+                if last and int(last) < start:
+                    return None
+                end = min(int(last), size - 1) if last else size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            return 'unsatisfiable'
+        return start, end - start + 1
+
+    @staticmethod
+    def if_range_matches(asset: Asset, headers: Dict[str, str]) -> bool:
+        """没有 If-Range，或其中的强ETag/日期与当前文件一致时才按 Range 返回部分内容"""
+        if_range = headers.get('if-range')
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"'):
+            return if_range == asset.etag
+        parsed = parsedate_tz(if_range)
+        return parsed is not None and asset.mtime <= mktime_tz(parsed)
+
+    def negotiate_variant(self, fs_path: str, accept_encoding: str) -> Tuple[Optional[str], Optional[Asset]]:
+        """按 Accept-Encoding 选择预压缩变体，没有可用变体时返回 (None, None)"""
+        accepted = set()
+        for item in accept_encoding.split(','):
+            coding, _, params = item.strip().partition(';')
+            params = params.replace(' ', '')
+            try:
+                if params.startswith('q=') and float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+            accepted.add(coding.strip().lower())
+
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            if encoding in accepted or '*' in accepted:
+                try:
+                    return encoding, self.assets.get(fs_path + suffix)
+                except (FileNotFoundError, NotADirectoryError, PermissionError):
+                    continue
+        return None, None
+
+    @staticmethod
+    def not_modified(asset: Asset, headers: Dict[str, str]) -> bool:
+        """If-None-Match 优先于 If-Modified-Since（RFC 7232）"""
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag == '*' or tag == asset.etag:
+                    return True
+            return False
+
+        if_modified_since = headers.get('if-modified-since')
+        if if_modified_since:
+            parsed = parsedate_tz(if_modified_since)
+            if parsed is not None:
+                return asset.mtime <= mktime_tz(parsed)
+        return False
+
+    @staticmethod
+    def guess_type(fs_path: str) -> str:
+        content_type, _ = mimetypes.guess_type(fs_path)
+        if not content_type:
+            return 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            return f'{content_type}; charset=utf-8'
+        return content_type
+
+    @staticmethod
+    def error(status: int) -> Response:
+        body = f'{status} {HTTPStatus(status).phrase}\n'.encode()
+        return Response(status, [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))], body)
+
+
+class GameRequestHandler(http.server.BaseHTTPRequestHandler):
+    """线程模式下的请求处理器，具体逻辑委托给 StaticSite"""
+
+    server_version = 'FangchengServer/1.0'
+    protocol_version = 'HTTP/1.1'
+    # keep-alive 空闲超时，serve() 按配置覆盖
+    timeout = 5
+    site: StaticSite = None
+    # 收到 SIGTERM 后置位：处理完当前请求即关闭连接
+    draining = False
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_HEAD(self):
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        started = time.perf_counter()
+        headers = {key.lower(): value for key, value in self.headers.items()}
+        response = self.site.handle(self.command, self.path, headers)
+        self.send_response(response.status)
+        for key, value in response.headers:
+            self.send_header(key, value)
+        if self.draining:
+            self.send_header('Connection', 'close')
+        elif not self.close_connection and self.request_version == 'HTTP/1.0':
+            self.send_header('Connection', 'keep-alive')
+        self.end_headers()
+        sent = 0
+        if self.command != 'HEAD':
+            if response.file_range:
+                sent = self._sendfile(*response.file_range)
+            elif response.body:
+                self.wfile.write(response.body)
+                sent = len(response.body)
+        self.site.metrics.observe(urlsplit(self.path).path, response.status, time.perf_counter() - started, sent)
+
+
+    def _sendfile(self, fs_path: str, offset: int, count: int) -> int:
+        """socket.sendfile 在内核中直接把文件写入连接（不支持时自动退回普通读写）"""
+        with open(fs_path, 'rb') as f:
+            sent = self.connection.sendfile(f, offset, count)
+        if sent != count:
+            # 文件在发送过程中被截断，Content-Length 已不可信，只能断开连接
+            self.close_connection = True
+        return sent
+
+
+class ThreadPoolHTTPServer(http.server.HTTPServer):
+    """有界线程池HTTP服务器：最多 max_workers 个连接同时处理，其余在监听队列中等待"""
+
+    allow_reuse_address = True
+    request_queue_size = 256
+
+    def __init__(self, server_address, handler_class, max_workers: int, listen_fd: Optional[int] = None):
+        if listen_fd is None:
+            super().__init__(server_address, handler_class)
+        else:
+            # 使用主进程传入的监听 socket；它是非阻塞的，被其他 worker 抢先 accept 时
+            # get_request 抛出 BlockingIOError，由 _handle_request_noblock 忽略
+            super().__init__(server_address, handler_class, bind_and_activate=False)
+            self.socket.close()
+            self.socket = socket.socket(fileno=listen_fd)
+            self.socket.setblocking(False)
+            self.server_address = self.socket.getsockname()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http')
+        self._slots = threading.Semaphore(max_workers)
+
+    def process_request(self, request, client_address):
+        # 线程池满时阻塞在这里，不再accept，新连接留在内核监听队列
+        self._slots.acquire()
+        self._executor.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        metrics = self.RequestHandlerClass.site.metrics
+        metrics.connection_opened()
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            metrics.connection_closed()
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+
+class AsyncHTTPServer:
+    """asyncio 事件循环模式：单线程处理所有连接"""
+
+    max_header_lines = 100
+
+    def __init__(self, site: StaticSite, port: int, keepalive_timeout: float = 5, listen_fd: Optional[int] = None):
+        self.site = site
+        self.port = port
+        self.keepalive_timeout = keepalive_timeout
+        self.listen_fd = listen_fd
+        self.draining = False
+        self.active = 0
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.site.metrics.connection_opened()
+        self.active += 1
+        try:
+            keep_alive = True
+            while keep_alive and not self.draining:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.keepalive_timeout)
+                except asyncio.TimeoutError:
+                    break
+                request_line = request_line.decode('iso-8859-1').rstrip('\r\n')
+                if not request_line:
+                    break
+                keep_alive = await self.handle_request(request_line, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.active -= 1
+            self.site.metrics.connection_closed()
+            writer.close()
+
+    async def handle_request(self, request_line: str, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter) -> bool:
+        """处理连接上的一个请求，返回连接是否保持"""
+        started = time.perf_counter()
+        headers = {}
+        for _ in range(self.max_header_lines):
+            line = (await reader.readline()).decode('iso-8859-1').rstrip('\r\n')
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        parts = request_line.split()
+        connection = headers.get('connection', '').lower()
+        if len(parts) != 3:
+            response, method, target, keep_alive = StaticSite.error(400), 'GET', '-', False
+        else:
+            method, target, version = parts
+            if version == 'HTTP/1.1':
+                keep_alive = connection != 'close'
+            else:
+                keep_alive = connection == 'keep-alive'
+            if method in ('GET', 'HEAD'):
+                response = self.site.handle(method, target, headers)
+            else:
+                # 与线程模式（send_error）一致，响应后关闭连接
+                response = StaticSite.error(501)
+                keep_alive = False
+            if headers.get('content-length', '0').strip() not in ('', '0') or 'transfer-encoding' in headers:
+                # 请求体不会被读取，保持连接会把它当作下一个请求行解析
+                keep_alive = False
+        keep_alive = keep_alive and not self.draining
+
+        head = [f'HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}',
+                f'Server: {GameRequestHandler.server_version}',
+                f'Date: {formatdate(usegmt=True)}',
+                f'Connection: {"keep-alive" if keep_alive else "close"}']
+        head.extend(f'{key}: {value}' for key, value in response.headers)
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        sent = 0
+        if method != 'HEAD':
+            if response.file_range:
+                fs_path, offset, count = response.file_range
+                await writer.drain()
+                with open(fs_path, 'rb') as f:
+                    # loop.sendfile 使用 os.sendfile 零拷贝发送，不支持时自动退回普通读写
+                    sent = await asyncio.get_running_loop().sendfile(writer.transport, f, offset, count)
+                if sent != count:
+                    keep_alive = False
+            elif response.body:
+                writer.write(response.body)
+                sent = len(response.body)
+        await writer.drain()
+        self.site.metrics.observe(urlsplit(target).path, response.status, time.perf_counter() - started, sent)
+        self.log_request(writer, request_line, response.status)
+        return keep_alive
+
+    @staticmethod
+    def log_request(writer: asyncio.StreamWriter, request_line: str, status: int) -> None:
+        peer = writer.get_extra_info('peername') or ('-',)
+        sys.stderr.write(f'{peer[0]} - - [{formatdate(localtime=True)}] "{request_line}" {status} -\n')
+
+    async def serve_forever(self, on_ready=None) -> None:
+        """运行到收到 SIGTERM 为止，然后停止监听并等待已有连接处理完"""
+        if self.listen_fd is None:
+            server = await asyncio.start_server(self.handle_connection, '', self.port,
+                                                reuse_address=True, backlog=256)
+        else:
+            server = await asyncio.start_server(self.handle_connection, sock=socket.socket(fileno=self.listen_fd),
+                                                backlog=256)
+        if on_ready:
+            on_ready()
+        loop = asyncio.get_running_loop()
+        stopping = loop.create_future()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, lambda: stopping.done() or stopping.set_result(None))
+        except (NotImplementedError, AttributeError):
+            # Windows 没有 add_signal_handler，只能直接结束进程
+            pass
+
+        async with server:
+            await stopping
+            self.draining = True
+            server.close()
+            deadline = loop.time() + WORKER_DRAIN_TIMEOUT
+            while self.active and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+
+
+def serve(settings: dict, listen_fd: Optional[int] = None, ready_fd: Optional[int] = None,
+          metrics_dir: Optional[str] = None) -> None:
+    """
+    按 server_mode 启动服务器；listen_fd 为主进程传入的监听 socket，ready_fd 为就绪管道（就绪后写入 ready），
+    metrics_dir 为主进程的共享指标目录
+    """
+    port = int(settings['port'])
+    mode = settings['server_mode']
+    site = StaticSite(settings['directory'], int(settings['cache_max_bytes']), int(settings['sendfile_min_bytes']),
+                      metrics_dir)
+    keepalive_timeout = float(settings['keepalive_timeout'])
+
+    if metrics_dir:
+        def publish_metrics():
+            while True:
+                time.sleep(METRICS_PUBLISH_INTERVAL)
+                try:
+                    site.metrics.publish(site.assets, force=False)
+                except OSError:
+                    pass
+
+        threading.Thread(target=publish_metrics, daemon=True).start()
+
+    if ready_fd is not None and hasattr(signal, 'SIGHUP'):
+        # 平滑重启由主进程负责，worker 忽略 SIGHUP
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    def on_ready():
+        if ready_fd is not None:
+            os.write(ready_fd, b'ready')
+            os.close(ready_fd)
+        else:
+            announce(settings)
+
+    if mode == 'asyncio':
+        asyncio.run(AsyncHTTPServer(site, port, keepalive_timeout, listen_fd).serve_forever(on_ready))
+    else:
+        GameRequestHandler.site = site
+        GameRequestHandler.timeout = keepalive_timeout
+        with ThreadPoolHTTPServer(('', port), GameRequestHandler, int(settings['max_workers']),
+                                  listen_fd) as httpd:
+            def stop(signum, frame):
+                # shutdown() 会等待 serve_forever 退出，不能在运行 serve_forever 的主线程里直接调用
+                GameRequestHandler.draining = True
+                threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+            signal.signal(signal.SIGTERM, stop)
+            on_ready()
+            httpd.serve_forever()
+        # 退出 with 时关闭监听 socket 并等待线程池中的请求处理完
+
+    if metrics_dir:
+        # 最终计数，主进程回收本 worker 时并入 retired.json
+        site.metrics.publish(site.assets)
+
+
+def announce(settings: dict, workers: int = 1) -> None:
+    port = int(settings['port'])
+    print(f"服务器运行在端口 {port}（模式: {settings['server_mode']}，worker: {workers}）")
+    print(f"访问地址: http://localhost:{port}")
+    sys.stdout.flush()
+
+
+def supports_prefork() -> bool:
+    return hasattr(signal, 'SIGHUP') and hasattr(os, 'set_inheritable')
+
+
+def open_listener(port: int) -> socket.socket:
+    """主进程创建的监听 socket，由所有 worker 继承共享"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        # 允许另一个主进程（例如全新启动的服务器）在交接期间绑定同一端口
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    listener.bind(('', port))
+    listener.listen(256)
+    listener.set_inheritable(True)
+    return listener
+
+
+class Supervisor:
+    """预派生多进程模式的主进程：只管理 worker，不处理请求
+
+    每个 worker 是重新执行本脚本的子进程（因此 SIGHUP 后会加载部署上传的新 server.py），
+    从主进程继承同一个监听 socket。SIGHUP 时先启动一整代新 worker，全部就绪后再让旧 worker
+    停止 accept 并处理完已有请求（SIGTERM）。连接排队在主进程持有的共享队列里，
+    不会因为某个 worker 退出而被重置（各自用 SO_REUSEPORT 绑定时，关闭的 socket 队列中的连接会被内核重置）。
+    """
+
+    def __init__(self, config_path: str, worker_args: List[str]):
+        self.config_path = config_path
+        self.worker_args = worker_args
+        self.workers: List[subprocess.Popen] = []
+        self.listener: Optional[socket.socket] = None
+        self.generation = 0
+        self.reload_requested = False
+        self.stop_requested = False
+        # worker 写指标快照的共享目录，/metrics 汇总其中所有 worker 的计数
+        self.metrics_dir = tempfile.mkdtemp(prefix='fangcheng-metrics-')
+        self.retired_metrics: Optional[dict] = None
+
+    def settings(self) -> dict:
+        return apply_overrides(load_settings(self.config_path), parse_args(self.worker_args))
+
+    def spawn(self, listener: Optional[socket.socket] = None) -> Optional[subprocess.Popen]:
+        """启动一个 worker 并等待它开始 accept；失败返回 None"""
+        listen_fd = (listener or self.listener).fileno()
+        read_fd, write_fd = os.pipe()
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--config', self.config_path, '--worker',
+             '--listen-fd', str(listen_fd), '--ready-fd', str(write_fd), '--metrics-dir', self.metrics_dir]
+            + self.worker_args,
+            pass_fds=(listen_fd, write_fd)
+        )
+        os.close(write_fd)
+        try:
+            readable, _, _ = select.select([read_fd], [], [], WORKER_START_TIMEOUT)
+            ready = bool(readable) and os.read(read_fd, 16) == b'ready'
+        finally:
+            os.close(read_fd)
+        if not ready:
+            process.kill()
+            process.wait()
+            self.retire_metrics([process])
+            return None
+        return process
+
+    def start_generation(self) -> bool:
+        """启动新一代 worker，成功后平滑停止旧的；失败时保留旧 worker 继续服务"""
+        settings = self.settings()
+        count = int(settings['workers']) or os.cpu_count() or 1
+        listener = self.listener
+        if listener is None or listener.getsockname()[1] != int(settings['port']):
+            # 首次启动或端口变更
+            try:
+                listener = open_listener(int(settings['port']))
+            except OSError as e:
+                print(f"无法监听端口 {settings['port']}: {e}", file=sys.stderr)
+                return False
+
+        started = []
+        for _ in range(count):
+            process = self.spawn(listener)
+            if process is None:
+                print("worker 启动失败，保留当前 worker", file=sys.stderr)
+                self.stop_workers(started)
+                if listener is not self.listener:
+                    listener.close()
+                return False
+            started.append(process)
+
+        old_workers, self.workers = self.workers, started
+        old_listener, self.listener = self.listener, listener
+        self.generation += 1
+        self.write_status(settings)
+        announce(settings, count)
+        self.stop_workers(old_workers)
+        self.retire_metrics(old_workers)
+        if old_listener is not None and old_listener is not listener:
+            old_listener.close()
+        return True
+
+    @staticmethod
+    def stop_workers(workers: List[subprocess.Popen]) -> None:
+        """SIGTERM：worker 停止监听并处理完已有请求后退出，超时则强制结束"""
+        for process in workers:
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + WORKER_DRAIN_TIMEOUT
+        for process in workers:
+            try:
+                process.wait(timeout=max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def retire_metrics(self, workers: List[subprocess.Popen]) -> None:
+        """把已退出 worker 的最后一份指标快照并入 retired.json，再删除快照，保证汇总的计数器不回退"""
+        snapshots = []
+        for process in workers:
+            snapshot = read_json(worker_metrics_path(self.metrics_dir, process.pid))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        if not snapshots:
+            return
+        previous = [self.retired_metrics] if self.retired_metrics else []
+        self.retired_metrics = merge_metrics(previous + snapshots, gauges=False)
+        write_json(os.path.join(self.metrics_dir, RETIRED_METRICS_FILE),
+                   {'pids': [snapshot['pid'] for snapshot in snapshots], 'totals': self.retired_metrics})
+        for snapshot in snapshots:
+            try:
+                os.remove(worker_metrics_path(self.metrics_dir, snapshot['pid']))
+            except OSError:
+                pass
+
+    def write_status(self, settings: dict) -> None:
+        if settings.get('pid_file'):
+            with open(settings['pid_file'], 'w') as f:
+                f.write(f"{os.getpid()}\n")
+        if settings.get('status_file'):
+            status = {
+                'pid': os.getpid(),
+                'generation': self.generation,
+                'workers': [process.pid for process in self.workers],
+                'reloaded_at': time.time(),
+            }
+            write_json(settings['status_file'], status)
+
+    def remove_status(self) -> None:
+        settings = self.settings()
+        for key in ('pid_file', 'status_file'):
+            if settings.get(key):
+                try:
+                    os.remove(settings[key])
+                except OSError:
+                    pass
+
+    def run(self) -> None:
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        def request_stop(signum, frame):
+            self.stop_requested = True
+
+        signal.signal(signal.SIGHUP, request_reload)
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        if not self.start_generation():
+            sys.exit(1)
+        try:
+            while not self.stop_requested:
+                time.sleep(0.5)
+                if self.reload_requested:
+                    self.reload_requested = False
+                    print("收到 SIGHUP，平滑重启 worker")
+                    sys.stdout.flush()
+                    self.start_generation()
+                # 意外退出的 worker 立即补上
+                for index, process in enumerate(self.workers):
+                    if process.poll() is not None and not self.stop_requested:
+                        print(f"worker {process.pid} 意外退出（{process.returncode}），重新启动", file=sys.stderr)
+                        self.retire_metrics([process])
+                        replacement = self.spawn()
+                        if replacement is not None:
+                            self.workers[index] = replacement
+        finally:
+            self.stop_workers(self.workers)
+            self.remove_status()
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+            if self.listener is not None:
+                self.listener.close()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Fangcheng static game server')
+    parser.add_argument('--config', default=SETTINGS_FILE, help='Path to server_config.json')
+    parser.add_argument('--port', type=int, help='Override listening port')
+    parser.add_argument('--directory', help='Override document root')
+    parser.add_argument('--mode', choices=SERVER_MODES, help='Override server_mode')
+    parser.add_argument('--workers', type=int, help='Override number of worker processes (0: one per CPU)')
+    parser.add_argument('--single', action='store_true', help='Serve from this process without forking workers')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--listen-fd', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--ready-fd', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--metrics-dir', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def apply_overrides(settings: dict, args: argparse.Namespace) -> dict:
+    if args.port is not None:
+        settings['port'] = args.port
+    if args.directory:
+        settings['directory'] = os.path.abspath(args.directory)
+    if args.mode:
+        settings['server_mode'] = args.mode
+    if args.workers is not None:
+        settings['workers'] = args.workers
+    return settings
+
+
+def main():
+    args = parse_args()
+    settings = apply_overrides(load_settings(args.config), args)
+
+    try:
+        if args.worker:
+            serve(settings, listen_fd=args.listen_fd, ready_fd=args.ready_fd, metrics_dir=args.metrics_dir)
+        elif args.single or not supports_prefork():
+            serve(settings)
+        else:
+            # 传给 worker 的覆盖参数（目录已转为绝对路径）
+            worker_args = []
+            for flag, value in (('--port', args.port), ('--mode', args.mode), ('--workers', args.workers)):
+                if value is not None:
+                    worker_args += [flag, str(value)]
+            if args.directory:
+                worker_args += ['--directory', settings['directory']]
+            Supervisor(os.path.abspath(args.config), worker_args).run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
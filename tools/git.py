@@ -13,6 +13,9 @@ import logging
 from datetime import datetime
 from pathlib import Path
 
+from deploy import deploy_stable_https
+from pipeline import DEFAULT_TIMINGS_DIR, Pipeline, run_pipeline
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -121,49 +124,53 @@ class GitDeploy:
             return False
 
     def deploy(self) -> bool:
-        """Run the deployment script"""
+        """Run the deployment (tools/deploy.py) in this process, sharing its SSH connection pool"""
         try:
-            deploy_script = self.project_root / 'tools' / 'deploy.py'
-            
-            if not deploy_script.exists():
-                logger.error("Deployment script not found: tools/deploy.py")
-                return False
-            
             logger.info("Starting deployment process...")
             
-            # Run deployment
-            result = subprocess.run([sys.executable, str(deploy_script)])
-            
-            if result.returncode == 0:
+            if deploy_stable_https():
                 logger.info("Deployment completed successfully!")
                 return True
             else:
-                logger.error(f"Deployment failed with exit code: {result.returncode}")
+                logger.error("Deployment failed")
                 return False
                 
         except Exception as e:
             logger.error(f"Deployment execution failed: {e}")
             return False
 
+    @staticmethod
+    def _require(ok: bool, message: str) -> None:
+        """Turn a failed step's False into an exception so the pipeline stops"""
+        if not ok:
+            raise Exception(message)
+
     def full_workflow(self, commit_message: str = None, skip_git: bool = False) -> None:
         """Execute complete Git + Deploy workflow"""
         try:
             logger.info("=== GIT AUTO-DEPLOY WORKFLOW STARTING ===")
             
+            # Stages run as soon as the ones they depend on are done
+            pipeline = Pipeline('git_deploy')
+            
             # Step 1: Update deployment timestamp
-            self.update_timestamp()
+            pipeline.add('timestamp', self.update_timestamp)
             
             if not skip_git:
                 # Step 2: Git add, commit and push
-                if not self.git_commit_push(commit_message):
-                    logger.error("Git operations failed, stopping workflow")
-                    return
+                pipeline.add('git', lambda: self._require(self.git_commit_push(commit_message), "Git operations failed"),
+                             after=['timestamp'])
             else:
                 logger.info("Skipping Git operations as requested")
             
-            # Step 3: Deploy
-            if not self.deploy():
-                logger.error("Deployment failed")
+            # Step 3: Deploy, only once the changes are committed and pushed
+            pipeline.add('deploy', lambda: self._require(self.deploy(), "Deployment failed"),
+                         after=['timestamp'] if skip_git else ['git'])
+            
+            try:
+                run_pipeline(pipeline, self.config.get('deploy', {}).get('timings_dir', DEFAULT_TIMINGS_DIR))
+            except Exception as e:
+                logger.error(f"{e}, stopping workflow")
                 return
             
             # Step 4: Final status
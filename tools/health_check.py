@@ -7,16 +7,23 @@ Supports HTTP checks, process monitoring, and resource usage tracking.
 """
 
 import os
+import re
 import sys
 import json
+import shlex
 import time
 import logging
 import argparse
+import threading
 import requests
 import psutil
-import paramiko
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+import log_scanner
+from metrics_store import MetricsStore, format_report, parse_window
+from remote import close_all, get_host, wait_until
 
 # Configure logging
 logging.basicConfig(
@@ -29,11 +36,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Sent over stdin to `python3 -` on the server; standard library only
+PROBE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'probe.py')
+LOG_SCANNER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log_scanner.py')
+DEFAULT_PROCESS_PATTERN = r'python.*server\.py'
+# Logs written by the nginx server block from deploy.py
+DEFAULT_NGINX_LOGS = [
+    {'name': 'fangcheng_8888.log', 'path': '/var/log/nginx/fangcheng_8888.log', 'pattern': r'" 5\d\d '},
+    {'name': 'fangcheng_8888_error.log', 'path': '/var/log/nginx/fangcheng_8888_error.log',
+     'pattern': r'\[(error|crit|alert|emerg)\]'},
+]
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+PROMETHEUS_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})?\s+(\S+)')
+PROMETHEUS_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+# Seconds; overridable per check via health_check.check_timeouts and health_check.overall_timeout
+DEFAULT_CHECK_TIMEOUT = 10
+DEFAULT_OVERALL_TIMEOUT = 15
+
 class HealthChecker:
-    def __init__(self, config_path: str = 'tools/config.json'):
-        """Initialize health checker with configuration."""
-        self.config = self._load_config(config_path)
+    def __init__(self, config_path: str = 'tools/config.json', config: Optional[Dict] = None):
+        """Initialize health checker from a configuration file, or an already loaded configuration."""
+        self.config = config if config is not None else self._load_config(config_path)
         self.ssh_client = None
+        # Full result of the latest resource probe (see probe.py for the layout)
+        self.last_resources: Optional[Dict] = None
+        # Per-log results of the latest incremental log scan (see log_scanner.py)
+        self.last_log_scan: Optional[Dict[str, Dict]] = None
+        # Parsed /metrics of the game server from the latest process check
+        self.last_server_metrics: Optional[Dict[str, List[Tuple[Dict[str, str], float]]]] = None
+        # Id of the concurrent pass in progress; check threads carry the id of the pass that started them
+        self._pass_id = 0
+        self._open_pass: Optional[int] = None
+        self._check_pass = threading.local()
+        self._record_lock = threading.Lock()
 
     def _load_config(self, config_path: str) -> Dict:
         """Load configuration from JSON file."""
@@ -50,25 +85,29 @@ class HealthChecker:
     def connect_ssh(self) -> None:
         """Establish SSH connection to the server."""
         try:
-            self.ssh_client = paramiko.SSHClient()
-            self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.ssh_client.connect(
-                hostname=self.config['server']['host'],
-                username=self.config['server']['username'],
-                key_filename=self.config['server']['key_path']
-            )
+            # Pooled keepalive connection; reconnects on demand during --continuous runs
+            self.ssh_client = get_host(self.config['server']).connect()
             logger.info("SSH connection established successfully")
         except Exception as e:
             logger.error(f"Failed to establish SSH connection: {str(e)}")
             sys.exit(1)
 
+    def server_url(self) -> str:
+        """
+        Base URL of the game server itself (app.port), which serves /health and /metrics to any client; the nginx
+        block of deploy.py only lets local scrapers reach /metrics. health_check.server_url overrides it.
+        """
+        return self.config.get('health_check', {}).get(
+            'server_url', f"http://{self.config['server']['domain']}:{self.config['app']['port']}"
+        ).rstrip('/')
+
+    def metrics_url(self) -> str:
+        return self.config.get('health_check', {}).get('metrics_url', f"{self.server_url()}/metrics")
+
     def check_http_health(self) -> Tuple[bool, str]:
         """Check HTTP health of the application."""
         try:
-            response = requests.get(
-                f"http://{self.config['server']['domain']}/health",
-                timeout=5
-            )
+            response = requests.get(f"{self.server_url()}/health", timeout=5)
             if response.status_code == 200:
                 return True, "HTTP health check passed"
             else:
@@ -76,64 +115,180 @@ class HealthChecker:
         except requests.RequestException as e:
             return False, f"HTTP health check failed: {str(e)}"
 
+    def scrape_metrics(self) -> Dict[str, List[Tuple[Dict[str, str], float]]]:
+        """Fetch the game server's /metrics endpoint (Prometheus text format) in one HTTP call."""
+        response = requests.get(self.metrics_url(), timeout=5)
+        response.raise_for_status()
+        return parse_prometheus(response.text)
+
+    def _record(self, attribute: str, value) -> None:
+        """
+        Store a detail result of a check (last_resources, ...). Checks that missed the deadline of their pass keep
+        running in the background; what they return afterwards is discarded so it cannot overwrite a later pass.
+        """
+        pass_id = getattr(self._check_pass, 'id', None)
+        with self._record_lock:
+            if pass_id is None or pass_id == self._open_pass:
+                setattr(self, attribute, value)
+
     def check_process_health(self) -> Tuple[bool, str]:
         """Check if the application process is running."""
+        try:
+            metrics = self.scrape_metrics()
+            self._record('last_server_metrics', metrics)
+            if metrics:
+                return True, f"Server is running - {describe_server_metrics(metrics)}"
+        except (requests.RequestException, ValueError) as e:
+            # Servers without /metrics: fall back to the process list over SSH
+            logger.warning(f"Scraping {self.metrics_url()} failed ({e}); checking the process list over SSH instead")
+            self._record('last_server_metrics', None)
+
         try:
             # Get process list
-            stdin, stdout, stderr = self.ssh_client.exec_command(
+            exit_status, output, _ = self.ssh_client.run(
                 f"ps aux | grep {self.config['app']['name']} | grep -v grep"
             )
-            processes = stdout.read().decode().strip()
+            processes = output.strip()
             
             if processes:
-                return True, "Process is running"
+                return True, "Process is running (no /metrics, checked with ps)"
             else:
                 return False, "Process is not running"
         except Exception as e:
             return False, f"Process check failed: {str(e)}"
 
+    def _is_local_target(self) -> bool:
+        return self.config['server']['host'] in LOCAL_HOSTS
+
+    def probe_resources(self) -> Dict:
+        """Collect CPU, memory, disk, load, open files and game server RSS in one invocation."""
+        health_config = self.config.get('health_check', {})
+        disk_path = self.config['server']['app_dir']
+        pattern = health_config.get('process_pattern', DEFAULT_PROCESS_PATTERN)
+        interval = health_config.get('cpu_sample_seconds', 0.25)
+
+        if self._is_local_target():
+            return self._probe_local(disk_path, pattern, interval)
+
+        with open(PROBE_SCRIPT, 'r') as f:
+            script = f.read()
+        exit_status, output, error = self.ssh_client.run(
+            f"python3 - {shlex.quote(disk_path)} {shlex.quote(pattern)} {interval}",
+            timeout=30,
+            input=script
+        )
+        if exit_status != 0:
+            raise Exception(f"Remote probe failed: {error.strip()}")
+        return json.loads(output)
+
+    @staticmethod
+    def _probe_local(disk_path: str, pattern: str, interval: float) -> Dict:
+        """psutil equivalent of probe.py for a server running on this machine."""
+        regex = re.compile(pattern)
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(disk_path)
+        processes = []
+        for process in psutil.process_iter(['pid', 'cmdline', 'memory_info']):
+            cmdline = ' '.join(process.info['cmdline'] or [])
+            if process.pid == os.getpid() or not cmdline or not regex.search(cmdline):
+                continue
+            try:
+                fds = process.num_fds()
+            except (psutil.Error, AttributeError):
+                fds = None
+            rss = process.info['memory_info'].rss if process.info['memory_info'] else 0
+            processes.append({'pid': process.pid, 'rss': rss, 'fds': fds, 'cmdline': cmdline})
+
+        try:
+            with open('/proc/sys/fs/file-nr') as f:
+                open_files = int(f.read().split()[0])
+        except OSError:
+            open_files = None
+
+        return {
+            'timestamp': time.time(),
+            'cpu_percent': psutil.cpu_percent(interval=interval),
+            'memory': {'total': memory.total, 'available': memory.available, 'percent': memory.percent},
+            'disk': {'path': disk_path, 'total': disk.total, 'used': disk.used, 'free': disk.free,
+                     'percent': disk.percent},
+            'load': list(psutil.getloadavg()),
+            'open_files': open_files,
+            'processes': processes,
+        }
+
     def check_resource_usage(self) -> Tuple[bool, str]:
         """Check server resource usage."""
         try:
-            # Get CPU and memory usage
-            stdin, stdout, stderr = self.ssh_client.exec_command(
-                "top -bn1 | grep 'Cpu(s)' | awk '{print $2}'"
-            )
-            cpu_usage = float(stdout.read().decode().strip())
-            
-            stdin, stdout, stderr = self.ssh_client.exec_command(
-                "free | grep Mem | awk '{print $3/$2 * 100.0}'"
-            )
-            memory_usage = float(stdout.read().decode().strip())
-            
-            # Get disk usage
-            stdin, stdout, stderr = self.ssh_client.exec_command(
-                f"df -h {self.config['server']['app_dir']} | tail -1 | awk '{{print $5}}'"
-            )
-            disk_usage = float(stdout.read().decode().strip().rstrip('%'))
+            resources = self.probe_resources()
+            self._record('last_resources', resources)
+            cpu_usage = resources['cpu_percent']
+            memory_usage = resources['memory']['percent']
+            disk_usage = resources['disk']['percent']
+            load_1m = resources['load'][0]
+            server_rss = sum(process['rss'] for process in resources['processes']) / (1024 * 1024)
+            details = (f"CPU: {cpu_usage}%, Memory: {memory_usage}%, Disk: {disk_usage}%, "
+                       f"Load: {load_1m:.2f}, Open files: {resources['open_files']}, "
+                       f"Server RSS: {server_rss:.1f} MB ({len(resources['processes'])} processes)")
             
             # Check if any resource usage is too high
             if cpu_usage > 90 or memory_usage > 90 or disk_usage > 90:
-                return False, f"High resource usage detected - CPU: {cpu_usage}%, Memory: {memory_usage}%, Disk: {disk_usage}%"
+                return False, f"High resource usage detected - {details}"
             else:
-                return True, f"Resource usage normal - CPU: {cpu_usage}%, Memory: {memory_usage}%, Disk: {disk_usage}%"
+                return True, f"Resource usage normal - {details}"
                 
         except Exception as e:
             return False, f"Resource check failed: {str(e)}"
 
+    def _log_specs(self) -> List[Dict]:
+        health_config = self.config.get('health_check', {})
+        if 'logs' in health_config:
+            return health_config['logs']
+        return [
+            {'name': 'app.log', 'path': f"{self.config['server']['app_dir']}/logs/app.log"},
+        ] + DEFAULT_NGINX_LOGS
+
+    def scan_logs(self) -> Dict[str, Dict]:
+        """Read only what was appended to each log since the previous pass (see log_scanner.py)."""
+        logs = self._log_specs()
+        state_file = self.config.get('health_check', {}).get(
+            'log_state_file', f"{self.config['server']['app_dir']}/.log_scan_state.json"
+        )
+
+        if self._is_local_target():
+            return log_scanner.scan(state_file, logs)
+
+        with open(LOG_SCANNER_SCRIPT, 'r') as f:
+            script = f.read()
+        exit_status, output, error = self.ssh_client.run(
+            f"python3 - {shlex.quote(state_file)} {shlex.quote(json.dumps(logs))}",
+            timeout=30,
+            input=script
+        )
+        if exit_status != 0:
+            raise Exception(f"Remote log scan failed: {error.strip()}")
+        return json.loads(output)
+
     def check_log_health(self) -> Tuple[bool, str]:
         """Check application logs for errors."""
         try:
-            # Get recent error logs
-            stdin, stdout, stderr = self.ssh_client.exec_command(
-                f"tail -n 100 {self.config['server']['app_dir']}/logs/app.log | grep -i 'error\|exception\|fail'"
-            )
-            errors = stdout.read().decode().strip()
+            scanned = self.scan_logs()
+            self._record('last_log_scan', scanned)
+            summaries = []
+            samples = []
+            for name, result in scanned.items():
+                if result.get('missing'):
+                    continue
+                summaries.append(
+                    f"{name}: {result['new_matches']} new ({result['total_matches']} total"
+                    f"{', rotated' if result['rotated'] else ''})"
+                )
+                samples.extend(f"{name}: {line}" for line in result['samples'])
+            summary = '; '.join(summaries) or 'no log files found'
             
-            if errors:
-                return False, f"Found errors in logs:\n{errors}"
+            if samples:
+                return False, f"Found errors in logs - {summary}\n" + '\n'.join(samples)
             else:
-                return True, "No recent errors found in logs"
+                return True, f"No new errors found in logs - {summary}"
                 
         except Exception as e:
             return False, f"Log check failed: {str(e)}"
@@ -141,20 +296,17 @@ class HealthChecker:
     def restart_application(self) -> Tuple[bool, str]:
         """Restart the application if health checks fail."""
         try:
-            # Stop the application
-            self.ssh_client.exec_command(
-                f"cd {self.config['server']['app_dir']} && ./stop.sh"
-            )
-            time.sleep(5)  # Wait for process to stop
+            restart_timeout = self.config['app'].get('start_timeout', 15)
             
-            # Start the application
-            self.ssh_client.exec_command(
-                f"cd {self.config['server']['app_dir']} && ./start.sh"
-            )
-            time.sleep(10)  # Wait for process to start
+            # Stop the application and poll until the process is gone
+            self.ssh_client.run(f"cd {self.config['server']['app_dir']} && ./stop.sh")
+            wait_until(lambda: not self.check_process_health()[0], timeout=restart_timeout)
+            
+            # Start the application and poll until it is up, instead of fixed sleeps
+            self.ssh_client.run(f"cd {self.config['server']['app_dir']} && ./start.sh")
             
             # Verify restart
-            if self.check_process_health()[0]:
+            if wait_until(lambda: self.check_process_health()[0], timeout=restart_timeout):
                 return True, "Application restarted successfully"
             else:
                 return False, "Application failed to restart"
@@ -162,38 +314,252 @@ class HealthChecker:
         except Exception as e:
             return False, f"Restart failed: {str(e)}"
 
-    def run_health_checks(self, auto_restart: bool = False) -> Dict[str, Tuple[bool, str]]:
-        """Run all health checks and optionally restart if needed."""
-        results = {
-            'http': self.check_http_health(),
-            'process': self.check_process_health(),
-            'resources': self.check_resource_usage(),
-            'logs': self.check_log_health()
+    def _check_functions(self) -> Dict[str, Callable[[], Tuple[bool, str]]]:
+        return {
+            'http': self.check_http_health,
+            'process': self.check_process_health,
+            'resources': self.check_resource_usage,
+            'logs': self.check_log_health
         }
+
+    def run_checks_concurrently(self) -> Dict[str, Tuple[bool, str, float]]:
+        """Run every check in parallel; each gets its own deadline and the whole pass an overall one.
+
+        Returns check name -> (passed, message, seconds taken).
+        """
+        health_config = self.config.get('health_check', {})
+        check_timeouts = health_config.get('check_timeouts', {})
+        overall_timeout = health_config.get('overall_timeout', DEFAULT_OVERALL_TIMEOUT)
+        checks = self._check_functions()
+        with self._record_lock:
+            self._pass_id += 1
+            self._open_pass = pass_id = self._pass_id
+            self.last_resources = self.last_log_scan = self.last_server_metrics = None
+
+        def timed(check: Callable[[], Tuple[bool, str]]) -> Tuple[bool, str, float]:
+            self._check_pass.id = pass_id
+            started = time.monotonic()
+            status, message = check()
+            return status, message, time.monotonic() - started
+
+        executor = ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix='health-check')
+        started = time.monotonic()
+        futures = {name: executor.submit(timed, check) for name, check in checks.items()}
+        results = {}
+        try:
+            for name, future in futures.items():
+                check_deadline = started + check_timeouts.get(name, DEFAULT_CHECK_TIMEOUT)
+                wait_seconds = max(min(check_deadline, started + overall_timeout) - time.monotonic(), 0)
+                try:
+                    results[name] = future.result(timeout=wait_seconds)
+                except FutureTimeoutError:
+                    elapsed = time.monotonic() - started
+                    results[name] = (False, f"Check timed out after {elapsed:.1f}s", elapsed)
+                except Exception as e:
+                    results[name] = (False, f"Check failed: {str(e)}", time.monotonic() - started)
+        finally:
+            # Do not block on checks that missed their deadline; they finish in the background and their
+            # detail results are discarded from here on
+            with self._record_lock:
+                self._open_pass = None
+            executor.shutdown(wait=False)
+
+        logger.debug(f"Health check pass took {time.monotonic() - started:.2f}s")
+        return results
+
+    def run_health_checks(self, auto_restart: bool = False) -> Dict[str, Tuple[bool, str, float]]:
+        """Run all health checks and optionally restart if needed."""
+        results = self.run_checks_concurrently()
         
         # Check if any checks failed
-        failed_checks = [check for check, (status, _) in results.items() if not status]
+        failed_checks = [check for check, (status, _, _) in results.items() if not status]
         
         if failed_checks and auto_restart:
             logger.warning(f"Health checks failed: {', '.join(failed_checks)}. Attempting restart...")
+            restart_started = time.monotonic()
             restart_success, restart_message = self.restart_application()
-            results['restart'] = (restart_success, restart_message)
+            results['restart'] = (restart_success, restart_message, time.monotonic() - restart_started)
             
             if restart_success:
                 # Run checks again after restart
-                results.update({
-                    'http': self.check_http_health(),
-                    'process': self.check_process_health(),
-                    'resources': self.check_resource_usage(),
-                    'logs': self.check_log_health()
-                })
+                results.update(self.run_checks_concurrently())
         
         return results
 
+    def metric_samples(self, results: Dict[str, Tuple[bool, str, float]]) -> Dict[str, float]:
+        """Numeric values of a health pass for the metrics store."""
+        samples = {f"check_seconds.{check}": duration for check, (_, _, duration) in results.items()}
+        samples.update({f"check_ok.{check}": float(status) for check, (status, _, _) in results.items()})
+        if 'http' in results:
+            samples['http_latency_ms'] = results['http'][2] * 1000
+        resources = self.last_resources
+        if resources:
+            samples.update({
+                'cpu_percent': resources['cpu_percent'],
+                'memory_percent': resources['memory']['percent'],
+                'disk_percent': resources['disk']['percent'],
+                'load_1m': resources['load'][0],
+                'open_files': resources['open_files'],
+                'server_rss_mb': sum(process['rss'] for process in resources['processes']) / (1024 * 1024),
+            })
+        metrics = self.last_server_metrics
+        if metrics:
+            requests_total = metric_sum(metrics, 'fangcheng_http_requests_total')
+            duration_count = metric_sum(metrics, 'fangcheng_http_request_duration_seconds_count')
+            samples.update({
+                'server_requests_total': requests_total,
+                'server_5xx_total': metric_sum(
+                    metrics, 'fangcheng_http_requests_total', lambda labels: labels.get('status', '').startswith('5')
+                ),
+                'server_active_connections': metric_sum(metrics, 'fangcheng_http_active_connections'),
+                'server_cache_hit_ratio': metric_sum(metrics, 'fangcheng_cache_hit_ratio'),
+            })
+            if duration_count:
+                samples['server_avg_response_ms'] = \
+                    metric_sum(metrics, 'fangcheng_http_request_duration_seconds_sum') / duration_count * 1000
+            if 'server_rss_mb' not in samples and 'fangcheng_process_resident_memory_bytes' in metrics:
+                samples['server_rss_mb'] = metric_sum(metrics, 'fangcheng_process_resident_memory_bytes') / (1024 * 1024)
+        if self.last_log_scan:
+            for name, scanned in self.last_log_scan.items():
+                if not scanned.get('missing'):
+                    samples[f"log_errors.{name}"] = scanned['new_matches']
+        return samples
+
     def cleanup(self) -> None:
         """Cleanup resources."""
-        if self.ssh_client:
-            self.ssh_client.close()
+        close_all()
+
+def parse_prometheus(text: str) -> Dict[str, List[Tuple[Dict[str, str], float]]]:
+    """Metric name -> [(labels, value), ...] from the Prometheus text exposition format."""
+    metrics: Dict[str, List[Tuple[Dict[str, str], float]]] = {}
+    for line in text.splitlines():
+        match = PROMETHEUS_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        metrics.setdefault(name, []).append(
+            (dict(PROMETHEUS_LABEL.findall(labels or '')), float(value))
+        )
+    return metrics
+
+def metric_sum(metrics: Dict[str, List[Tuple[Dict[str, str], float]]], name: str,
+               where: Optional[Callable[[Dict[str, str]], bool]] = None) -> float:
+    return sum(value for labels, value in metrics.get(name, []) if where is None or where(labels))
+
+def describe_server_metrics(metrics: Dict[str, List[Tuple[Dict[str, str], float]]]) -> str:
+    uptime = time.time() - metric_sum(metrics, 'fangcheng_process_start_time_seconds')
+    rss = metric_sum(metrics, 'fangcheng_process_resident_memory_bytes') / (1024 * 1024)
+    errors = metric_sum(metrics, 'fangcheng_http_requests_total', lambda labels: labels.get('status', '').startswith('5'))
+    return (f"uptime {uptime / 3600:.1f}h, RSS {rss:.1f} MB, "
+            f"{metric_sum(metrics, 'fangcheng_http_requests_total'):.0f} requests ({errors:.0f} 5xx), "
+            f"{metric_sum(metrics, 'fangcheng_http_active_connections'):.0f} active connections, "
+            f"cache hit ratio {metric_sum(metrics, 'fangcheng_cache_hit_ratio'):.1%}")
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+class FleetHealthChecker:
+    def __init__(self, config: Dict):
+        """
+        Build one HealthChecker per entry of fleet.targets; each entry overrides keys of `server`.
+        A target without its own `domain` is checked over HTTP at its `host`, not at the primary domain.
+        """
+        fleet_config = config.get('fleet', {})
+        self.max_workers = fleet_config.get('max_workers', 8)
+        self.checkers: Dict[str, HealthChecker] = {}
+        for target in fleet_config.get('targets', []):
+            target = dict(target)
+            name = target.pop('name', target.get('host'))
+            if 'host' in target:
+                target.setdefault('domain', target['host'])
+            target_config = dict(config)
+            target_config['server'] = {**config['server'], **target}
+            self.checkers[name] = HealthChecker(config=target_config)
+        if not self.checkers:
+            raise Exception("No fleet targets configured (fleet.targets)")
+
+    @staticmethod
+    def _check_host(checker: HealthChecker, auto_restart: bool) -> Tuple[Dict[str, Tuple[bool, str, float]], float]:
+        started = time.monotonic()
+        try:
+            checker.ssh_client = get_host(checker.config['server']).connect()
+            results = checker.run_health_checks(auto_restart)
+        except Exception as e:
+            results = {'ssh': (False, f"SSH connection failed: {str(e)}", time.monotonic() - started)}
+        return results, time.monotonic() - started
+
+    def run(self, auto_restart: bool = False) -> Dict:
+        """Check every host in parallel (at most max_workers at once) and aggregate the results."""
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='fleet') as executor:
+            futures = {name: executor.submit(self._check_host, checker, auto_restart)
+                       for name, checker in self.checkers.items()}
+            hosts = {}
+            for name, future in futures.items():
+                results, seconds = future.result()
+                hosts[name] = {
+                    'healthy': all(status for status, _, _ in results.values()),
+                    'seconds': seconds,
+                    'results': results,
+                }
+        return self.aggregate(hosts, time.monotonic() - started)
+
+    @staticmethod
+    def aggregate(hosts: Dict[str, Dict], seconds: float) -> Dict:
+        """Summary across hosts: slowest host, failures per check and host/check latency percentiles."""
+        failures: Dict[str, int] = {}
+        check_latencies: Dict[str, List[float]] = {}
+        for host in hosts.values():
+            for check, (status, _, duration) in host['results'].items():
+                check_latencies.setdefault(check, []).append(duration)
+                if not status:
+                    failures[check] = failures.get(check, 0) + 1
+
+        host_latencies = [host['seconds'] for host in hosts.values()]
+        slowest = max(hosts, key=lambda name: hosts[name]['seconds']) if hosts else None
+        return {
+            'seconds': seconds,
+            'hosts': hosts,
+            'healthy_hosts': sum(1 for host in hosts.values() if host['healthy']),
+            'slowest_host': slowest,
+            'failures': failures,
+            'latency': {pct: percentile(host_latencies, pct) for pct in (50, 95, 99)},
+            'check_latency': {
+                check: {pct: percentile(values, pct) for pct in (50, 95, 99)}
+                for check, values in check_latencies.items()
+            },
+        }
+
+    def cleanup(self) -> None:
+        close_all()
+
+def log_fleet_report(report: Dict) -> None:
+    hosts = report['hosts']
+    latency = report['latency']
+    logger.info(
+        f"FLEET: {report['healthy_hosts']}/{len(hosts)} hosts healthy in {report['seconds']:.2f}s - "
+        f"slowest {report['slowest_host']} ({hosts[report['slowest_host']]['seconds']:.2f}s), "
+        f"host latency p50 {latency[50] * 1000:.0f} ms / p95 {latency[95] * 1000:.0f} ms / "
+        f"p99 {latency[99] * 1000:.0f} ms"
+    )
+    for check, values in report['check_latency'].items():
+        logger.info(
+            f"  {check}: {report['failures'].get(check, 0)} failures, "
+            f"p50 {values[50] * 1000:.0f} ms / p95 {values[95] * 1000:.0f} ms / p99 {values[99] * 1000:.0f} ms"
+        )
+    for name, host in hosts.items():
+        for check, (status, message, _) in host['results'].items():
+            if not status:
+                logger.warning(f"  {name} {check.upper()}: FAIL - {message}")
+
+def log_results(results: Dict[str, Tuple[bool, str, float]]) -> None:
+    for check, (status, message, duration) in results.items():
+        logger.info(f"{check.upper()}: {'PASS' if status else 'FAIL'} - {message} ({duration * 1000:.0f} ms)")
 
 def main():
     parser = argparse.ArgumentParser(description='Health Check Manager')
@@ -201,24 +567,49 @@ def main():
     parser.add_argument('--auto-restart', action='store_true', help='Automatically restart on failure')
     parser.add_argument('--continuous', action='store_true', help='Run checks continuously')
     parser.add_argument('--interval', type=int, default=300, help='Check interval in seconds (default: 300)')
+    parser.add_argument('--fleet', action='store_true', help='Check every host listed in fleet.targets')
+    parser.add_argument('--metrics-db', help='Metrics store path (default: metrics.db_path)')
+    parser.add_argument('--no-metrics', action='store_true', help='Do not record samples in the metrics store')
+    parser.add_argument('--report', action='store_true', help='Print percentiles and trends from the metrics store')
+    parser.add_argument('--window', default='24h', help='Report window, e.g. 90m, 24h, 7d (default: 24h)')
     args = parser.parse_args()
 
     checker = HealthChecker(args.config)
     
+    if args.report:
+        store = MetricsStore.from_config(checker.config, args.metrics_db)
+        print(format_report(store.report(parse_window(args.window))))
+        store.close()
+        return
+    
+    store = None if args.no_metrics else MetricsStore.from_config(checker.config, args.metrics_db)
+    
     try:
-        checker.connect_ssh()
+        if args.fleet:
+            fleet = FleetHealthChecker(checker.config)
+            
+            def run_once():
+                report = fleet.run(args.auto_restart)
+                log_fleet_report(report)
+                if store:
+                    for name, host in report['hosts'].items():
+                        store.record(name, fleet.checkers[name].metric_samples(host['results']))
+        else:
+            checker.connect_ssh()
+            
+            def run_once():
+                results = checker.run_health_checks(args.auto_restart)
+                log_results(results)
+                if store:
+                    store.record(checker.config['server']['host'], checker.metric_samples(results))
         
         if args.continuous:
             logger.info(f"Starting continuous health checks (interval: {args.interval}s)")
             while True:
-                results = checker.run_health_checks(args.auto_restart)
-                for check, (status, message) in results.items():
-                    logger.info(f"{check.upper()}: {'PASS' if status else 'FAIL'} - {message}")
+                run_once()
                 time.sleep(args.interval)
         else:
-            results = checker.run_health_checks(args.auto_restart)
-            for check, (status, message) in results.items():
-                logger.info(f"{check.upper()}: {'PASS' if status else 'FAIL'} - {message}")
+            run_once()
                 
     except KeyboardInterrupt:
         logger.info("Health check interrupted by user")
@@ -227,6 +618,8 @@ def main():
         sys.exit(1)
     finally:
         checker.cleanup()
+        if store:
+            store.close()
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
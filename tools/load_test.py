@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Load test and benchmark for the game server.
+Replays the page-load mix (index.html, then every JS and CSS file it references, or every JS and CSS file in the
+project when the page inlines them) from many concurrent clients
+and reports throughput, latency percentiles, error rate and bytes transferred, optionally saved as JSON.
+"""
+
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+import statistics
+import subprocess
+from datetime import datetime
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import requests
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SERVER_SCRIPT = Path(__file__).resolve().parent / 'game_server.py'
+
+
+def default_assets(root: Path = PROJECT_ROOT) -> List[str]:
+    """index.html followed by every JS and CSS file in the project."""
+    assets = ['/index.html']
+    assets += sorted(f"/js/{p.name}" for p in (root / 'js').glob('*.js'))
+    assets += sorted(f"/css/{p.name}" for p in (root / 'css').glob('*.css'))
+    return assets
+
+
+class AssetReferenceParser(HTMLParser):
+    """Collects the script and stylesheet URLs a page references, in document order."""
+
+    def __init__(self):
+        super().__init__()
+        self.references: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'script' and attrs.get('src'):
+            self.references.append(attrs['src'])
+        elif tag == 'link' and 'stylesheet' in (attrs.get('rel') or '').lower() and attrs.get('href'):
+            self.references.append(attrs['href'])
+
+
+def page_assets(base_url: str, page: str = '/index.html', timeout: float = 30) -> List[str]:
+    """The page followed by every same-origin JS/CSS file it references, as fetched from the server."""
+    page_url = base_url.rstrip('/') + page
+    response = requests.get(page_url, timeout=timeout)
+    response.raise_for_status()
+    parser = AssetReferenceParser()
+    parser.feed(response.text)
+
+    origin = urlsplit(page_url).netloc
+    assets = [page]
+    for reference in parser.references:
+        url = urlsplit(urljoin(page_url, reference))
+        if url.netloc != origin or not url.path.endswith(('.js', '.css')):
+            continue
+        asset = url.path + (f"?{url.query}" if url.query else '')
+        if asset not in assets:
+            assets.append(asset)
+    return assets
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """Milliseconds: mean, p50/p90/p95/p99 and max of latencies given in seconds."""
+    if not samples:
+        return {}
+    if len(samples) == 1:
+        cuts = samples * 99
+    else:
+        cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {
+        'mean': statistics.fmean(samples) * 1000,
+        'p50': cuts[49] * 1000,
+        'p90': cuts[89] * 1000,
+        'p95': cuts[94] * 1000,
+        'p99': cuts[98] * 1000,
+        'max': max(samples) * 1000,
+    }
+
+
+class LoadTest:
+    def __init__(self, base_url: str, assets: List[str], clients: int = 200, timeout: float = 30,
+                 page_loads: int = 1):
+        """Initialize load test against base_url; each client loads the asset list page_loads times."""
+        self.base_url = base_url.rstrip('/')
+        self.assets = assets
+        self.clients = clients
+        self.timeout = timeout
+        self.page_loads = page_loads
+        self._lock = threading.Lock()
+        # (asset, seconds, ok, bytes) per request and seconds per complete page load
+        self._samples: List[Tuple[str, float, bool, int]] = []
+        self._page_times: List[float] = []
+
+    def _client(self, barrier: threading.Barrier) -> None:
+        """One simulated student: load the page and all of its assets, page_loads times."""
+        session = requests.Session()
+        samples = []
+        page_times = []
+        barrier.wait()
+        for _ in range(self.page_loads):
+            page_started = time.perf_counter()
+            for asset in self.assets:
+                started = time.perf_counter()
+                try:
+                    response = session.get(self.base_url + asset, timeout=self.timeout)
+                    samples.append((asset, time.perf_counter() - started, response.status_code == 200,
+                                    len(response.content)))
+                except requests.RequestException:
+                    samples.append((asset, time.perf_counter() - started, False, 0))
+            page_times.append(time.perf_counter() - page_started)
+        session.close()
+        with self._lock:
+            self._samples.extend(samples)
+            self._page_times.extend(page_times)
+
+    def run(self) -> Dict:
+        """Start all clients simultaneously and measure throughput and latency."""
+        barrier = threading.Barrier(self.clients + 1)
+        threads = [threading.Thread(target=self._client, args=(barrier,), daemon=True)
+                   for _ in range(self.clients)]
+        for thread in threads:
+            thread.start()
+
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        request_count = len(self._samples)
+        errors = sum(1 for _, _, ok, _ in self._samples if not ok)
+        received = sum(size for _, _, _, size in self._samples)
+        per_asset = {}
+        for asset in self.assets:
+            samples = [sample for sample in self._samples if sample[0] == asset]
+            per_asset[asset] = {
+                'requests': len(samples),
+                'errors': sum(1 for _, _, ok, _ in samples if not ok),
+                'bytes': sum(size for _, _, _, size in samples),
+                'latency_ms': latency_summary([seconds for _, seconds, _, _ in samples]),
+            }
+
+        return {
+            'clients': self.clients,
+            'page_loads': len(self._page_times),
+            'requests': request_count,
+            'errors': errors,
+            'error_rate': errors / request_count if request_count else 0.0,
+            'bytes': received,
+            'elapsed': elapsed,
+            'requests_per_second': request_count / elapsed if elapsed else 0.0,
+            'mbytes_per_second': received / elapsed / 1e6 if elapsed else 0.0,
+            'latency_ms': latency_summary([seconds for _, seconds, _, _ in self._samples]),
+            'page_load_ms': latency_summary(self._page_times),
+            'assets': per_asset,
+        }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(mode: str, directory: Path = PROJECT_ROOT) -> Tuple[subprocess.Popen, str]:
+    """Launch game_server.py locally in the given mode and wait until /health answers."""
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, str(SERVER_SCRIPT), '--port', str(port),
+         '--directory', str(directory), '--mode', mode],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Local server ({mode}) did not start")
+
+
+def report(label: str, result: Dict) -> None:
+    latency = result['latency_ms']
+    page_load = result['page_load_ms']
+    logger.info(
+        f"{label}: {result['clients']} clients, {result['page_loads']} page loads, {result['requests']} requests, "
+        f"{result['errors']} errors ({result['error_rate']:.2%}), {result['bytes'] / 1e6:.2f} MB in "
+        f"{result['elapsed']:.2f}s, {result['requests_per_second']:.1f} req/s, "
+        f"{result['mbytes_per_second']:.2f} MB/s"
+    )
+    logger.info(
+        f"{label}: request latency p50 {latency['p50']:.1f} ms / p95 {latency['p95']:.1f} ms / "
+        f"p99 {latency['p99']:.1f} ms / max {latency['max']:.1f} ms; "
+        f"page load p50 {page_load['p50']:.1f} ms / p95 {page_load['p95']:.1f} ms"
+    )
+
+
+def compare(label: str, previous: Dict, current: Dict) -> None:
+    """Log how a run differs from a saved run (e.g. the previous deployment)."""
+    def change(old: float, new: float) -> str:
+        return f"{old:.1f} -> {new:.1f} ({(new - old) / old:+.1%})" if old else f"{old:.1f} -> {new:.1f}"
+
+    logger.info(
+        f"{label} vs {previous.get('label', 'previous')}: "
+        f"req/s {change(previous['requests_per_second'], current['requests_per_second'])}, "
+        f"p95 ms {change(previous['latency_ms']['p95'], current['latency_ms']['p95'])}, "
+        f"error rate {previous['error_rate']:.2%} -> {current['error_rate']:.2%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Game server load test')
+    parser.add_argument('--url', help='Base URL of a running server (e.g. http://op.gaowei.com:88)')
+    parser.add_argument('--modes', nargs='+', choices=['threaded', 'asyncio'], default=['threaded', 'asyncio'],
+                        help='Server modes to launch locally when --url is not given')
+    parser.add_argument('--clients', type=int, default=200, help='Number of concurrent clients (default: 200)')
+    parser.add_argument('--page-loads', type=int, default=1, help='Page loads per client (default: 1)')
+    parser.add_argument('--mix', choices=['page', 'files'], default='page',
+                        help='page: index.html plus the JS/CSS it references (files when it references none); '
+                             'files: every js/*.js and css/*.css')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--label', help='Name stored with the results (default: URL or mode)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)
+
+    def benchmark(base_url: str, label: str) -> Dict:
+        if args.mix == 'page':
+            assets = page_assets(base_url, timeout=args.timeout)
+            if len(assets) == 1:
+                # The page inlines its scripts and styles; still load the static assets as the files mix does
+                logger.info(f"{label}: {assets[0]} references no JS/CSS files, using the files mix")
+                assets = default_assets()
+        else:
+            assets = default_assets()
+        logger.info(f"{label}: page-load mix {', '.join(assets)}")
+        result = LoadTest(base_url, assets, args.clients, args.timeout, args.page_loads).run()
+        result.update(label=label, url=base_url, mix=assets, timestamp=datetime.now().isoformat())
+        report(label, result)
+        if previous:
+            runs = previous.get('runs', [previous])
+            match = next((run for run in runs if run.get('label') == label), runs[0])
+            compare(label, match, result)
+        return result
+
+    if args.url:
+        runs = [benchmark(args.url, args.label or args.url)]
+    else:
+        runs = []
+        for mode in args.modes:
+            process, base_url = start_local_server(mode)
+            try:
+                runs.append(benchmark(base_url, f"{args.label or 'local'} {mode}"))
+            finally:
+                process.terminate()
+                process.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'runs': runs} if len(runs) > 1 else runs[0], f, indent=2)
+        logger.info(f"Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Incremental log scanner that runs on the monitored server and prints one JSON document.
+Remembers the byte offset and inode of every log in a state file, reads only bytes appended since the last
+pass, follows rotation and keeps running totals of lines matching each log's error pattern.
+Uses only the standard library, so health_check.py can pipe this file into a remote `python3 -`.
+
+Usage: python3 log_scanner.py STATE_FILE LOGS_JSON
+  LOGS_JSON: [{"name": ..., "path": ..., "pattern": ...}, ...]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+from typing import Dict, List, Optional
+
+# Upper bound of bytes read per log and pass, so a runaway log cannot stall a health check
+MAX_READ_BYTES = 64 * 1024 * 1024
+MAX_SAMPLES = 5
+
+
+def load_state(state_file: str) -> Dict:
+    try:
+        with open(state_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state_file: str, state: Dict) -> None:
+    directory = os.path.dirname(state_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_file = f"{state_file}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_file, state_file)
+
+
+def find_rotated(path: str, inode: int) -> Optional[str]:
+    """The renamed predecessor of path (logrotate's path.1 or path-YYYYMMDD) if it still has the old inode."""
+    directory, name = os.path.split(path)
+    try:
+        candidates = sorted(entry for entry in os.listdir(directory or '.') if entry.startswith(name) and entry != name)
+    except OSError:
+        return None
+    for entry in candidates:
+        candidate = os.path.join(directory, entry)
+        try:
+            if os.stat(candidate).st_ino == inode:
+                return candidate
+        except OSError:
+            continue
+    return None
+
+
+def read_new_lines(path: str, offset: int, limit: int):
+    """Complete lines appended after offset (at most limit bytes) and the offset following the last one."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(limit)
+    end = data.rfind(b'\n') + 1
+    if end == 0 and len(data) < limit:
+        # Only a partial line so far; wait for the writer to finish it
+        return [], offset
+    if end == 0:
+        end = len(data)
+    return data[:end].decode(errors='replace').splitlines(), offset + end
+
+
+def scan_log(spec: Dict, entry: Dict) -> Dict:
+    """Advance one log's state entry in place and return what this pass found."""
+    path = spec['path']
+    regex = re.compile(spec.get('pattern', 'error|exception|fail'), re.IGNORECASE)
+    result = {'path': path, 'new_bytes': 0, 'new_lines': 0, 'new_matches': 0, 'rotated': False, 'samples': []}
+    try:
+        st = os.stat(path)
+    except OSError:
+        result['missing'] = True
+        return result
+
+    lines: List[str] = []
+    if 'inode' not in entry:
+        # First sighting: start at the current end instead of re-reporting history
+        entry.update(inode=st.st_ino, offset=st.st_size, lines=0, matches=0, since=time.time())
+    elif entry['inode'] != st.st_ino or st.st_size < entry['offset']:
+        result['rotated'] = True
+        if entry['inode'] != st.st_ino:
+            # Finish the tail of the rotated file before switching to the new one
+            rotated = find_rotated(path, entry['inode'])
+            if rotated:
+                old_lines, _ = read_new_lines(rotated, entry['offset'], MAX_READ_BYTES)
+                lines.extend(old_lines)
+        entry.update(inode=st.st_ino, offset=0)
+
+    if st.st_size > entry['offset']:
+        new_lines, new_offset = read_new_lines(path, entry['offset'], MAX_READ_BYTES)
+        result['new_bytes'] = new_offset - entry['offset']
+        entry['offset'] = new_offset
+        lines.extend(new_lines)
+
+    for line in lines:
+        if regex.search(line):
+            result['new_matches'] += 1
+            if len(result['samples']) < MAX_SAMPLES:
+                result['samples'].append(line[:500])
+
+    result['new_lines'] = len(lines)
+    entry['lines'] += len(lines)
+    entry['matches'] += result['new_matches']
+    result['total_lines'] = entry['lines']
+    result['total_matches'] = entry['matches']
+    result['since'] = entry['since']
+    return result
+
+
+def scan(state_file: str, logs: List[Dict]) -> Dict[str, Dict]:
+    state = load_state(state_file)
+    results = {}
+    for spec in logs:
+        name = spec.get('name', os.path.basename(spec['path']))
+        results[name] = scan_log(spec, state.setdefault(spec['path'], {}))
+    save_state(state_file, state)
+    return results
+
+
+if __name__ == '__main__':
+    print(json.dumps(scan(sys.argv[1], json.loads(sys.argv[2]))))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Local time-series store for health check samples.
+Numeric samples go into a SQLite file; samples older than the raw retention are downsampled into fixed-size
+buckets (count/sum/min/max). Reports compute percentiles and trends inside SQLite, so the history is never
+loaded into memory.
+"""
+
+import re
+import time
+import sqlite3
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    host TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    ts REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (host, metric, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    host TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    minimum REAL NOT NULL,
+    maximum REAL NOT NULL,
+    PRIMARY KEY (host, metric, bucket)
+) WITHOUT ROWID;
+"""
+
+# Raw samples and bucket averages of one metric within a window
+SERIES = """
+WITH series(ts, value) AS (
+    SELECT ts, value FROM samples WHERE host = :host AND metric = :metric AND ts >= :since
+    UNION ALL
+    SELECT bucket, total / count FROM rollups WHERE host = :host AND metric = :metric AND bucket >= :since
+)
+"""
+
+WINDOW_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_window(window: str) -> int:
+    """Seconds in a window such as '90m', '24h' or '7d' (a bare number is seconds)."""
+    match = re.fullmatch(r'(\d+)([smhd]?)', window.strip())
+    if not match:
+        raise ValueError(f"Invalid window: {window}")
+    return int(match.group(1)) * WINDOW_UNITS[match.group(2) or 's']
+
+
+class MetricsStore:
+    def __init__(self, path: str, raw_retention_hours: float = 48, rollup_seconds: int = 300,
+                 rollup_retention_days: float = 90):
+        """Open (creating if needed) the store at path."""
+        self.path = path
+        self.raw_retention = raw_retention_hours * 3600
+        self.rollup_seconds = int(rollup_seconds)
+        self.rollup_retention = rollup_retention_days * 86400
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self._last_downsample = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict, path: Optional[str] = None) -> 'MetricsStore':
+        """Create the store from the `metrics` section of the tools configuration."""
+        metrics_config = config.get('metrics', {})
+        return cls(
+            path or metrics_config.get('db_path', 'health_metrics.db'),
+            raw_retention_hours=metrics_config.get('raw_retention_hours', 48),
+            rollup_seconds=metrics_config.get('rollup_seconds', 300),
+            rollup_retention_days=metrics_config.get('rollup_retention_days', 90)
+        )
+
+    def record(self, host: str, values: Dict[str, float], timestamp: Optional[float] = None) -> None:
+        """Append one sample per metric; downsamples old data at most once per rollup interval."""
+        timestamp = timestamp or time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO samples (host, metric, ts, value) VALUES (?, ?, ?, ?)",
+                [(host, metric, timestamp, float(value)) for metric, value in values.items() if value is not None]
+            )
+        if timestamp - self._last_downsample >= self.rollup_seconds:
+            self.downsample(timestamp)
+
+    def downsample(self, now: Optional[float] = None) -> None:
+        """Fold raw samples older than the raw retention into buckets and expire old buckets."""
+        now = now or time.time()
+        cutoff = int(now - self.raw_retention) // self.rollup_seconds * self.rollup_seconds
+        with self.db:
+            self.db.execute(
+                """
+                INSERT INTO rollups (host, metric, bucket, count, total, minimum, maximum)
+                SELECT host, metric, CAST(ts / :size AS INTEGER) * :size, COUNT(*), SUM(value), MIN(value), MAX(value)
+                FROM samples WHERE ts < :cutoff
+                GROUP BY host, metric, CAST(ts / :size AS INTEGER)
+                ON CONFLICT (host, metric, bucket) DO UPDATE SET
+                    count = count + excluded.count,
+                    total = total + excluded.total,
+                    minimum = MIN(minimum, excluded.minimum),
+                    maximum = MAX(maximum, excluded.maximum)
+                """,
+                {'size': self.rollup_seconds, 'cutoff': cutoff}
+            )
+            self.db.execute("DELETE FROM samples WHERE ts < ?", (cutoff,))
+            self.db.execute("DELETE FROM rollups WHERE bucket < ?", (now - self.rollup_retention,))
+        self._last_downsample = now
+
+    def series_names(self, since: float) -> List[tuple]:
+        """(host, metric) pairs that have data since the given time."""
+        return self.db.execute(
+            """
+            SELECT host, metric FROM samples WHERE ts >= :since
+            UNION
+            SELECT host, metric FROM rollups WHERE bucket >= :since
+            ORDER BY host, metric
+            """,
+            {'since': since}
+        ).fetchall()
+
+    def summarize(self, host: str, metric: str, since: float) -> Dict[str, float]:
+        """Count, min/max/avg, p50/p95/p99 and linear trend (change per hour) of one metric since a time."""
+        params = {'host': host, 'metric': metric, 'since': since}
+        count, minimum, maximum, average, sum_x, sum_xx, sum_xy = self.db.execute(
+            SERIES + """
+            SELECT COUNT(*), MIN(value), MAX(value), AVG(value),
+                   SUM(ts - :since), SUM((ts - :since) * (ts - :since)), SUM((ts - :since) * value)
+            FROM series
+            """,
+            params
+        ).fetchone()
+        summary = {'count': count, 'min': minimum, 'max': maximum, 'avg': average}
+        if not count:
+            return summary
+
+        for pct in (50, 95, 99):
+            # Nearest rank; SQLite sorts on disk, only the selected row comes back
+            rank = max(-(-pct * count // 100) - 1, 0)
+            summary[f"p{pct}"] = self.db.execute(
+                SERIES + "SELECT value FROM series ORDER BY value LIMIT 1 OFFSET :rank",
+                dict(params, rank=rank)
+            ).fetchone()[0]
+
+        # Least-squares slope from the aggregates above
+        denominator = count * sum_xx - sum_x * sum_x
+        sum_y = average * count
+        summary['per_hour'] = (count * sum_xy - sum_x * sum_y) / denominator * 3600 if denominator else 0.0
+        return summary
+
+    def report(self, window_seconds: int) -> List[Dict]:
+        since = time.time() - window_seconds
+        return [
+            dict(host=host, metric=metric, **self.summarize(host, metric, since))
+            for host, metric in self.series_names(since)
+        ]
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def format_report(rows: List[Dict]) -> str:
+    lines = [f"{'HOST':<20} {'METRIC':<28} {'N':>6} {'P50':>10} {'P95':>10} {'P99':>10} {'MAX':>10} {'/HOUR':>10}"]
+    for row in rows:
+        if not row['count']:
+            continue
+        lines.append(
+            f"{row['host']:<20} {row['metric']:<28} {row['count']:>6} {row['p50']:>10.2f} {row['p95']:>10.2f} "
+            f"{row['p99']:>10.2f} {row['max']:>10.2f} {row['per_hour']:>+10.2f}"
+        )
+    return '\n'.join(lines)
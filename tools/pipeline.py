@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Dependency-graph runner for the multi-step tools (deploys).
+Each stage names the stages it runs after and starts on a thread pool as soon as all of them have finished,
+so independent work (packaging and the SSH handshake, two uploads) overlaps. After the first failure no new
+stage starts; the running ones finish and the original exception is re-raised. Every run ends with a
+per-stage timing table, and the timings can be written as JSON to compare runs.
+"""
+
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Where the deploy tools write timing files unless deploy.timings_dir says otherwise
+DEFAULT_TIMINGS_DIR = 'deploy_timings'
+
+
+class Stage:
+    def __init__(self, name: str, func: Callable[[], Any], after: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.after = list(after)
+        self.status = 'pending'
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def seconds(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+class Pipeline:
+    def __init__(self, name: str, max_workers: int = 4):
+        self.name = name
+        self.max_workers = max_workers
+        self.stages: Dict[str, Stage] = {}
+        self.results: Dict[str, Any] = {}
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.created = datetime.now()
+
+    def add(self, name: str, func: Callable[[], Any], after: Iterable[str] = ()) -> 'Pipeline':
+        """Add a stage running func once every stage in after has succeeded; its return value goes to results."""
+        for dependency in after:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage {name} runs after unknown stage {dependency}")
+        self.stages[name] = Stage(name, func, after)
+        return self
+
+    def _run_stage(self, stage: Stage) -> Any:
+        stage.started = time.perf_counter()
+        try:
+            return stage.func()
+        finally:
+            stage.finished = time.perf_counter()
+
+    def run(self) -> Dict[str, Any]:
+        """Run all stages in dependency order, overlapping independent ones; returns their results."""
+        self.started = time.perf_counter()
+        failure: Optional[BaseException] = None
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        try:
+            while True:
+                if failure is None:
+                    for stage in self.stages.values():
+                        if stage.status == 'pending' and \
+                                all(self.stages[name].status == 'ok' for name in stage.after):
+                            stage.status = 'running'
+                            running[executor.submit(self._run_stage, stage)] = stage
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        self.results[stage.name] = future.result()
+                        stage.status = 'ok'
+                    except BaseException as e:
+                        stage.status = 'failed'
+                        stage.error = str(e) or type(e).__name__
+                        logger.error(f"Stage {stage.name} failed after {stage.seconds:.2f}s: {stage.error}")
+                        failure = failure or e
+        finally:
+            executor.shutdown(wait=True)
+            self.finished = time.perf_counter()
+            for stage in self.stages.values():
+                if stage.status == 'pending':
+                    stage.status = 'skipped'
+            logger.info(f"Pipeline {self.name} timings:\n{self.report()}")
+        if failure is not None:
+            raise failure
+        return self.results
+
+    def report(self) -> str:
+        """Per-stage timing table; START and END are seconds since the run began."""
+        total = (self.finished or time.perf_counter()) - self.started
+        lines = [f"{'STAGE':<16} {'AFTER':<24} {'START':>7} {'END':>7} {'SECONDS':>8}  STATUS"]
+        for stage in self.stages.values():
+            if stage.started is None:
+                start = end = '-'
+            else:
+                start = f"{stage.started - self.started:.2f}"
+                end = f"{stage.finished - self.started:.2f}"
+            lines.append(
+                f"{stage.name:<16} {','.join(stage.after) or '-':<24} {start:>7} {end:>7} "
+                f"{stage.seconds:>8.2f}  {stage.status}"
+            )
+        busy = sum(stage.seconds for stage in self.stages.values())
+        lines.append(f"{'total':<16} {'':<24} {'':>7} {total:>7.2f} {busy:>8.2f}  "
+                     f"(stage time; {max(busy - total, 0.0):.2f}s overlapped)")
+        return '\n'.join(lines)
+
+    def timings(self) -> Dict:
+        return {
+            'pipeline': self.name,
+            'created': self.created.isoformat(),
+            'seconds': round((self.finished or time.perf_counter()) - self.started, 3),
+            'ok': all(stage.status == 'ok' for stage in self.stages.values()),
+            'stages': [
+                {
+                    'name': stage.name,
+                    'after': stage.after,
+                    'status': stage.status,
+                    'start': round(stage.started - self.started, 3) if stage.started is not None else None,
+                    'seconds': round(stage.seconds, 3),
+                    'error': stage.error,
+                }
+                for stage in self.stages.values()
+            ],
+        }
+
+    def write_timings(self, directory: str) -> str:
+        """Write the timings to <directory>/<pipeline>_<timestamp>.json and return the path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.name}_{self.created.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, 'w') as f:
+            json.dump(self.timings(), f, indent=2)
+        logger.info(f"Pipeline timings written to {path}")
+        return path
+
+
+def run_pipeline(pipeline: Pipeline, timings_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Run pipeline and, when timings_dir is set, write its timings there whether or not it succeeded."""
+    try:
+        return pipeline.run()
+    finally:
+        if timings_dir and pipeline.started is not None:
+            try:
+                pipeline.write_timings(timings_dir)
+            except OSError as e:
+                logger.warning(f"Failed to write pipeline timings: {e}")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Resource probe that runs on the monitored server and prints one JSON document.
+Uses only the standard library and /proc, so health_check.py can pipe this file into a remote `python3 -`.
+
+Usage: python3 probe.py [disk_path] [process_pattern] [cpu_interval]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+from typing import Dict, List, Tuple
+
+
+def read_cpu_times() -> Tuple[int, int]:
+    """(idle, total) jiffies from the aggregate cpu line of /proc/stat."""
+    with open('/proc/stat') as f:
+        fields = [int(value) for value in f.readline().split()[1:]]
+    # idle + iowait count as idle, like top does
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    return idle, sum(fields)
+
+
+def cpu_percent(interval: float) -> float:
+    idle_before, total_before = read_cpu_times()
+    time.sleep(interval)
+    idle_after, total_after = read_cpu_times()
+    total = total_after - total_before
+    return round(100.0 * (1 - (idle_after - idle_before) / total), 1) if total > 0 else 0.0
+
+
+def memory_usage() -> Dict:
+    values = {}
+    with open('/proc/meminfo') as f:
+        for line in f:
+            key, value = line.split(':', 1)
+            values[key] = int(value.split()[0]) * 1024
+    total = values['MemTotal']
+    available = values.get('MemAvailable', values.get('MemFree', 0) + values.get('Cached', 0))
+    return {
+        'total': total,
+        'available': available,
+        'percent': round(100.0 * (total - available) / total, 1) if total else 0.0,
+    }
+
+
+def disk_usage(path: str) -> Dict:
+    """Same arithmetic as df: used / (used + available to unprivileged users)."""
+    st = os.statvfs(path)
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    return {
+        'path': path,
+        'total': total,
+        'used': used,
+        'free': free,
+        'percent': round(100.0 * used / (used + free), 1) if used + free else 0.0,
+    }
+
+
+def open_files() -> int:
+    """System-wide allocated file handles."""
+    with open('/proc/sys/fs/file-nr') as f:
+        return int(f.read().split()[0])
+
+
+def matching_processes(pattern: str) -> List[Dict]:
+    """PID, resident memory and descriptor count of processes whose command line matches pattern."""
+    regex = re.compile(pattern)
+    own_pid = os.getpid()
+    processes = []
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit() or int(pid) == own_pid:
+            continue
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode(errors='replace').strip()
+            if not cmdline or not regex.search(cmdline):
+                continue
+            rss = 0
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss = int(line.split()[1]) * 1024
+                        break
+            try:
+                fds = len(os.listdir(f'/proc/{pid}/fd'))
+            except OSError:
+                fds = None
+        except (OSError, ValueError):
+            # Process exited while being inspected
+            continue
+        processes.append({'pid': int(pid), 'rss': rss, 'fds': fds, 'cmdline': cmdline})
+    return processes
+
+
+def collect(path: str = '/', process_pattern: str = r'python.*server\.py', interval: float = 0.25) -> Dict:
+    return {
+        'timestamp': time.time(),
+        'cpu_percent': cpu_percent(interval),
+        'memory': memory_usage(),
+        'disk': disk_usage(path),
+        'load': list(os.getloadavg()),
+        'open_files': open_files(),
+        'processes': matching_processes(process_pattern),
+    }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    print(json.dumps(collect(
+        args[0] if len(args) > 0 else '/',
+        args[1] if len(args) > 1 else r'python.*server\.py',
+        float(args[2]) if len(args) > 2 else 0.25
+    )))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Release directory management for atomic deployments.
+Each deployment is extracted into releases/<timestamp> and published by swapping the `current` symlink.
+"""
+
+import shlex
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from remote import RemoteHost
+
+logger = logging.getLogger(__name__)
+
+
+class ReleaseManager:
+    def __init__(self, ssh_client: RemoteHost, app_dir: str, keep: int = 5):
+        """Manage releases under app_dir over a pooled SSH connection."""
+        self.ssh_client = ssh_client
+        self.app_dir = app_dir.rstrip('/')
+        self.releases_dir = f"{self.app_dir}/releases"
+        self.current_link = f"{self.app_dir}/current"
+        self.keep = max(keep, 1)
+
+    def _run(self, command: str) -> str:
+        """Run a remote command, wait for it and raise on a non-zero exit status."""
+        exit_status, output, error = self.ssh_client.run(command)
+        if exit_status != 0:
+            raise Exception(f"Remote command failed: {command}: {error.strip()}")
+        return output
+
+    def release_path(self, release: str) -> str:
+        return f"{self.releases_dir}/{release}"
+
+    def new_release(self, seed_from_current: bool = False) -> str:
+        """Create an empty release directory, or a hard-linked copy of the current release."""
+        existing = set(self.list_releases())
+        base = datetime.now().strftime('%Y%m%d_%H%M%S')
+        release, suffix = base, 0
+        while release in existing:
+            suffix += 1
+            release = f"{base}_{suffix}"
+        path = shlex.quote(self.release_path(release))
+        self._run(f"mkdir -p {path}")
+        if seed_from_current and self.current_release():
+            # Hard links make the copy cheap; uploads replace files by rename, so old releases stay intact
+            self._run(f"cp -al {shlex.quote(self.current_link)}/. {path}/")
+        return release
+
+    def discard(self, release: str) -> None:
+        """Remove a release that was never activated."""
+        self._run(f"rm -rf {shlex.quote(self.release_path(release))}")
+
+    def activate(self, release: str) -> None:
+        """Atomically point `current` at the release (rename(2) over the old symlink)."""
+        temp_link = shlex.quote(f"{self.current_link}.tmp")
+        self._run(
+            f"test -d {shlex.quote(self.release_path(release))} && "
+            f"ln -sfn releases/{shlex.quote(release)} {temp_link} && "
+            f"mv -Tf {temp_link} {shlex.quote(self.current_link)}"
+        )
+        logger.info(f"Activated release {release}")
+
+    def list_releases(self) -> List[str]:
+        """Release names, oldest first."""
+        output = self._run(f"mkdir -p {shlex.quote(self.releases_dir)} && ls -1 {shlex.quote(self.releases_dir)}")
+        return sorted(name for name in output.split() if name)
+
+    def current_release(self) -> Optional[str]:
+        """Name of the release `current` points to, or None before the first release."""
+        output = self._run(f"readlink {shlex.quote(self.current_link)} || true").strip()
+        return output.rsplit('/', 1)[-1] if output else None
+
+    def prune(self) -> None:
+        """Delete all but the newest `keep` releases, never the active one."""
+        current = self.current_release()
+        stale = [name for name in self.list_releases()[:-self.keep] if name != current]
+        if stale:
+            self._run("rm -rf " + ' '.join(shlex.quote(self.release_path(name)) for name in stale))
+            logger.info(f"Removed {len(stale)} old releases: {', '.join(stale)}")
+
+    def rollback(self, release: Optional[str] = None) -> str:
+        """Point `current` at the given release, or at the one before the active release."""
+        releases = self.list_releases()
+        if release is None:
+            current = self.current_release()
+            older = [name for name in releases if current is None or name < current]
+            if not older:
+                raise Exception("No previous release to roll back to")
+            release = older[-1]
+        elif release not in releases:
+            raise Exception(f"Release not found: {release}")
+
+        self.activate(release)
+        return release
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared SSH connection layer for the deployment tools.
+Hands out one pooled, keepalive-enabled SSH transport per host and multiplexes
+command channels and SFTP sessions over it, reconnecting automatically.
+"""
+
+import os
+import time
+import base64
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteHost:
+    def __init__(self, host: str, username: str, key_path: Optional[str] = None, port: int = 22,
+                 keepalive: int = 30, allow_password_prompt: bool = False):
+        """Describe a remote host; the connection is opened lazily on first use."""
+        self.host = host
+        self.username = username
+        self.key_path = os.path.expanduser(key_path) if key_path else None
+        self.port = port
+        self.keepalive = keepalive
+        self.allow_password_prompt = allow_password_prompt
+        self._password = None
+        self._client = None
+        self._sftp = None
+        self._lock = threading.RLock()
+        self.stats = {
+            'handshakes': 0,
+            'handshake_seconds': 0.0,
+            'reconnects': 0,
+            'channels': 0,
+            'commands': 0,
+            'command_seconds': 0.0,
+            'sftp_sessions': 0,
+        }
+
+    @property
+    def is_connected(self) -> bool:
+        transport = self._client.get_transport() if self._client else None
+        return bool(transport and transport.is_active())
+
+    def connect(self) -> 'RemoteHost':
+        """Open the SSH transport if it is not already up (reconnecting after a drop)."""
+        with self._lock:
+            if self.is_connected:
+                return self
+            if self._client is not None:
+                self.stats['reconnects'] += 1
+                logger.info(f"Reconnecting to {self.host}")
+                self._close_client()
+
+            started = time.perf_counter()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                client.connect(
+                    hostname=self.host,
+                    port=self.port,
+                    username=self.username,
+                    key_filename=self.key_path,
+                    password=self._password
+                )
+            except (paramiko.AuthenticationException, paramiko.SSHException, IOError):
+                if not self.allow_password_prompt or self._password is not None:
+                    raise
+                self._password = input(f"Password for {self.username}@{self.host}: ")
+                client.connect(hostname=self.host, port=self.port, username=self.username, password=self._password)
+
+            client.get_transport().set_keepalive(self.keepalive)
+            self._client = client
+            self.stats['handshakes'] += 1
+            self.stats['handshake_seconds'] += time.perf_counter() - started
+            return self
+
+    def get_transport(self) -> paramiko.Transport:
+        return self.connect()._client.get_transport()
+
+    def exec_command(self, command: str, timeout: Optional[float] = None):
+        """Open a new channel on the shared transport; same return value as SSHClient.exec_command."""
+        self.stats['channels'] += 1
+        try:
+            return self.connect()._client.exec_command(command, timeout=timeout)
+        except (paramiko.SSHException, EOFError):
+            # The transport died between the liveness check and the channel open
+            self._close_client()
+            return self.connect()._client.exec_command(command, timeout=timeout)
+
+    def run(self, command: str, timeout: Optional[float] = None,
+            input: Optional[str] = None) -> Tuple[int, str, str]:
+        """Run a command (feeding `input` to its stdin), wait for it and return (exit status, stdout, stderr)."""
+        started = time.perf_counter()
+        stdin, stdout, stderr = self.exec_command(command, timeout=timeout)
+        if input is not None:
+            stdin.write(input)
+            stdin.flush()
+            stdin.channel.shutdown_write()
+        output = stdout.read().decode(errors='replace')
+        error = stderr.read().decode(errors='replace')
+        exit_status = stdout.channel.recv_exit_status()
+        self.stats['commands'] += 1
+        self.stats['command_seconds'] += time.perf_counter() - started
+        return exit_status, output, error
+
+    def batch(self, stop_on_error: bool = True) -> 'CommandBatch':
+        """Start a group of commands that will run as one script over a single channel."""
+        return CommandBatch(self, stop_on_error)
+
+    def open_sftp(self, new: bool = False) -> paramiko.SFTPClient:
+        """Return the shared SFTP session, or a separate one over the same transport when new=True."""
+        with self._lock:
+            if not new and self._sftp is not None and self.is_connected \
+                    and not self._sftp.sock.closed:
+                return self._sftp
+            sftp = self.connect()._client.open_sftp()
+            self.stats['sftp_sessions'] += 1
+            if not new:
+                self._sftp = sftp
+            return sftp
+
+    def describe_stats(self) -> str:
+        stats = self.stats
+        average = stats['command_seconds'] / stats['commands'] * 1000 if stats['commands'] else 0.0
+        return (f"{self.host}: {stats['handshakes']} handshakes ({stats['handshake_seconds']:.2f}s), "
+                f"{stats['reconnects']} reconnects, {stats['channels']} channels, "
+                f"{stats['commands']} awaited commands (avg {average:.0f} ms), "
+                f"{stats['sftp_sessions']} SFTP sessions")
+
+    def _close_client(self) -> None:
+        if self._sftp is not None:
+            try:
+                self._sftp.close()
+            except Exception:
+                pass
+            self._sftp = None
+        if self._client is not None:
+            self._client.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_client()
+            self._client = None
+
+
+class StepResult:
+    """Outcome of one command in a CommandBatch."""
+
+    __slots__ = ('name', 'command', 'exit_status', 'stdout', 'stderr', 'seconds')
+
+    def __init__(self, name: str, command: str, exit_status: Optional[int] = None,
+                 stdout: str = '', stderr: str = '', seconds: float = 0.0):
+        self.name = name
+        self.command = command
+        self.exit_status = exit_status
+        self.stdout = stdout
+        self.stderr = stderr
+        self.seconds = seconds
+
+    @property
+    def skipped(self) -> bool:
+        return self.exit_status is None
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_status == 0
+
+
+class BatchResult:
+    """Per-step results of a CommandBatch, addressable by index or step name."""
+
+    def __init__(self, steps: List[StepResult], seconds: float):
+        self.steps = steps
+        self.seconds = seconds
+
+    def __getitem__(self, key) -> StepResult:
+        if isinstance(key, int):
+            return self.steps[key]
+        for step in self.steps:
+            if step.name == key:
+                return step
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    @property
+    def ok(self) -> bool:
+        return all(step.ok for step in self.steps)
+
+    def raise_for_status(self) -> 'BatchResult':
+        for step in self.steps:
+            if not step.ok:
+                reason = 'skipped' if step.skipped else f"exit {step.exit_status}: {step.stderr.strip()}"
+                raise Exception(f"Remote step '{step.name}' failed ({reason})")
+        return self
+
+    def describe(self) -> str:
+        return ', '.join(
+            f"{step.name}={'skipped' if step.skipped else step.exit_status} ({step.seconds * 1000:.0f} ms)"
+            for step in self.steps
+        )
+
+
+class CommandBatch:
+    """Runs several commands as one shell script over one channel, collecting per-step results."""
+
+    MARKER = '__BATCH_STEP__'
+
+    def __init__(self, host: RemoteHost, stop_on_error: bool = True):
+        self.host = host
+        self.stop_on_error = stop_on_error
+        self.steps: List[Tuple[str, str, bool]] = []
+
+    def add(self, command: str, name: Optional[str] = None, always: bool = False) -> 'CommandBatch':
+        """Append a step; `always` steps (e.g. cleanup) run even after an earlier step failed."""
+        self.steps.append((name or f"step{len(self.steps) + 1}", command, always))
+        return self
+
+    def script(self) -> str:
+        """POSIX sh script; each step runs in a subshell with output captured to files, then base64-encoded."""
+        lines = [
+            'd=$(mktemp -d) || exit 97',
+            'trap \'rm -rf "$d"\' EXIT',
+            'rc=0',
+        ]
+        for index, (name, command, always) in enumerate(self.steps):
+            guard = 'if [ $rc -eq 0 ]; then' if self.stop_on_error and not always else 'if true; then'
+            lines += [
+                guard,
+                '  s=$(date +%s%N)',
+                f'  ( {command}\n  ) >"$d/out" 2>"$d/err" </dev/null',
+                '  r=$?',
+                '  e=$(date +%s%N)',
+                f'  echo "{self.MARKER} {index} $r $s $e"',
+                '  base64 "$d/out" | tr -d \'\\n\'; echo',
+                '  base64 "$d/err" | tr -d \'\\n\'; echo',
+                '  if [ $r -ne 0 ]; then rc=$r; fi',
+                'fi',
+            ]
+        return '\n'.join(lines) + '\n'
+
+    def run(self, timeout: Optional[float] = None) -> BatchResult:
+        """Send the script to `sh -s` and wait for every step to finish."""
+        started = time.perf_counter()
+        _, output, _ = self.host.run('sh -s', timeout=timeout, input=self.script())
+        output = output.splitlines()
+        seconds = time.perf_counter() - started
+
+        results = [StepResult(name, command) for name, command, _ in self.steps]
+        for position, line in enumerate(output):
+            if not line.startswith(self.MARKER):
+                continue
+            _, index, exit_status, start_ns, end_ns = line.split()
+            step = results[int(index)]
+            step.exit_status = int(exit_status)
+            step.seconds = (int(end_ns) - int(start_ns)) / 1e9
+            step.stdout = base64.b64decode(output[position + 1]).decode(errors='replace')
+            step.stderr = base64.b64decode(output[position + 2]).decode(errors='replace')
+        return BatchResult(results, seconds)
+
+
+def wait_until(predicate: Callable[[], bool], timeout: float, initial_delay: float = 0.1,
+               max_delay: float = 2.0) -> bool:
+    """Poll predicate with exponential backoff until it returns True or timeout seconds pass."""
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        try:
+            if predicate():
+                return True
+        except Exception:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+_pool: Dict[Tuple[str, int, str], RemoteHost] = {}
+_pool_lock = threading.Lock()
+
+
+def get_host(server_config: Dict, allow_password_prompt: bool = False) -> RemoteHost:
+    """Return the pooled connection for the `server` section of a tools configuration."""
+    key = (server_config['host'], int(server_config.get('ssh_port', 22)), server_config['username'])
+    with _pool_lock:
+        host = _pool.get(key)
+        if host is None:
+            host = RemoteHost(
+                host=key[0],
+                port=key[1],
+                username=key[2],
+                key_path=server_config.get('key_path'),
+                keepalive=server_config.get('keepalive', 30),
+                allow_password_prompt=allow_password_prompt
+            )
+            _pool[key] = host
+        elif allow_password_prompt:
+            host.allow_password_prompt = True
+        return host
+
+
+def close_all() -> None:
+    """Close every pooled connection, logging its timing counters."""
+    with _pool_lock:
+        for host in _pool.values():
+            if host.stats['handshakes']:
+                logger.info(f"SSH stats - {host.describe_stats()}")
+            host.close()
+        _pool.clear()
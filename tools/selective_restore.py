@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Selective in-place restore. Runs on the server and prints one JSON document with the diff.
+The files of a backup (a .tar.gz/.tar.zst archive, or a snapshot in the chunk store of snapshot_store.py) are
+compared with the live tree: a different size means changed, the same size and mtime means unchanged, and
+anything else is decided by SHA-256. Only files that differ are written, each straight into place through a
+temporary file and a rename. Optional paths (files, directories or glob patterns relative to TARGET) limit the
+restore; with --dry-run nothing is written. Files that only exist in the live tree are left alone.
+Uses only the standard library, so backup.py can pipe this file into a remote `python3 -`.
+
+Usage: python3 selective_restore.py archive ARCHIVE TARGET [--dry-run] [PATH...]
+       python3 selective_restore.py snapshot STORE NAME TARGET [--dry-run] [PATH...]
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import zlib
+import fnmatch
+import hashlib
+import tarfile
+import tempfile
+import subprocess
+from typing import Dict, Iterable, Iterator, List, Optional
+
+READ_SIZE = 1024 * 1024
+GLOB_CHARS = '*?['
+
+
+def normalize(name: str) -> str:
+    """Member name relative to the archive root ('./js/app.js' -> 'js/app.js'); '' for the root itself."""
+    path = os.path.normpath(name.lstrip('/'))
+    if path == '..' or path.startswith('../'):
+        raise ValueError(f"Unsafe path in backup: {name}")
+    return '' if path == '.' else path
+
+
+def selected(path: str, patterns: List[str]) -> bool:
+    if not patterns:
+        return True
+    return any(path == pattern or path.startswith(pattern + '/') or fnmatch.fnmatchcase(path, pattern)
+               for pattern in patterns)
+
+
+def compare(dest: str, size: int, mtime_ns: int, precision_ns: int) -> str:
+    """'added', 'changed', 'unchanged', or 'unknown' when only the content can tell (same size, other mtime)."""
+    try:
+        st = os.lstat(dest)
+    except FileNotFoundError:
+        return 'added'
+    if not stat.S_ISREG(st.st_mode) or st.st_size != size:
+        return 'changed'
+    if st.st_mtime_ns // precision_ns == mtime_ns // precision_ns:
+        return 'unchanged'
+    return 'unknown'
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_file(dest: str, blocks: Iterable[bytes], mode: int, mtime_ns: int,
+               unless_sha256: Optional[str] = None) -> bool:
+    """
+    Write blocks to dest through a temporary file and a rename, so readers never see a partial file.
+    When the content hashes to unless_sha256 only the mtime of dest is reset; returns whether dest was written.
+    """
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    temp_file = f"{dest}.restore.{os.getpid()}"
+    digest = hashlib.sha256()
+    try:
+        with open(temp_file, 'wb') as f:
+            for block in blocks:
+                f.write(block)
+                digest.update(block)
+        if digest.hexdigest() == unless_sha256:
+            os.unlink(temp_file)
+            os.utime(dest, ns=(mtime_ns, mtime_ns))
+            return False
+        os.chmod(temp_file, mode)
+        os.utime(temp_file, ns=(mtime_ns, mtime_ns))
+        os.replace(temp_file, dest)
+        return True
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.unlink(temp_file)
+        raise
+
+
+def restore_symlink(dest: str, target: str, dry_run: bool) -> str:
+    try:
+        if os.readlink(dest) == target:
+            return 'unchanged'
+        status = 'changed'
+    except FileNotFoundError:
+        status = 'added'
+    except OSError:
+        status = 'changed'
+    if not dry_run:
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        temp_link = f"{dest}.restore.{os.getpid()}"
+        os.symlink(target, temp_link)
+        os.replace(temp_link, dest)
+    return status
+
+
+class Diff:
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.started = time.time()
+        self.added: List[str] = []
+        self.changed: List[str] = []
+        self.unchanged = 0
+        self.written_bytes = 0
+
+    def record(self, status: str, path: str, size: int = 0) -> None:
+        if status == 'unchanged':
+            self.unchanged += 1
+            return
+        (self.added if status == 'added' else self.changed).append(path)
+        if not self.dry_run:
+            self.written_bytes += size
+
+    def result(self) -> Dict:
+        return {
+            'dry_run': self.dry_run,
+            'added': self.added,
+            'changed': self.changed,
+            'unchanged': self.unchanged,
+            'written_bytes': self.written_bytes,
+            'seconds': round(time.time() - self.started, 3),
+        }
+
+
+def open_archive(archive: str):
+    """Sequential tar reader for archive and the decompressor process feeding it, if any."""
+    if archive.endswith('.tar.zst'):
+        process = subprocess.Popen(['zstd', '-dcq', archive], stdout=subprocess.PIPE)
+        return tarfile.open(fileobj=process.stdout, mode='r|'), process
+    return tarfile.open(archive, 'r|gz'), None
+
+
+def close_archive(reader: tarfile.TarFile, process: Optional[subprocess.Popen]) -> None:
+    reader.close()
+    if process:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def restore_member(dest: str, source, member: tarfile.TarInfo, dry_run: bool) -> str:
+    """Compare a regular archive member (its content readable from source) with dest and write it if it differs."""
+    mtime_ns = int(member.mtime) * 10 ** 9
+    status = compare(dest, member.size, mtime_ns, 10 ** 9)
+    if status == 'unchanged':
+        return status
+    blocks = iter(lambda: source.read(READ_SIZE), b'')
+    live_sha256 = file_sha256(dest) if status == 'unknown' else None
+    if dry_run:
+        if not live_sha256:
+            return status
+        digest = hashlib.sha256()
+        for block in blocks:
+            digest.update(block)
+        return 'unchanged' if digest.hexdigest() == live_sha256 else 'changed'
+    if write_file(dest, blocks, stat.S_IMODE(member.mode), mtime_ns, live_sha256):
+        return 'changed' if live_sha256 else status
+    return 'unchanged'
+
+
+def restore_links(archive: str, target: str, links: Dict[str, List[str]], diff: Diff, dry_run: bool) -> None:
+    """
+    Second pass for hard-link members (releases seeded with `cp -al` are archived mostly as links), which carry no
+    data: each links[name] path is compared with and restored from the content of the member called name.
+    """
+    reader, process = open_archive(archive)
+    try:
+        for member in reader:
+            name = normalize(member.name)
+            if not member.isfile() or name not in links:
+                continue
+            with tempfile.TemporaryFile() as content:
+                source = reader.extractfile(member)
+                for block in iter(lambda: source.read(READ_SIZE), b''):
+                    content.write(block)
+                for path in links.pop(name):
+                    content.seek(0)
+                    status = restore_member(os.path.join(target, path), content, member, dry_run)
+                    diff.record(status, path, member.size)
+            if not links:
+                break
+    finally:
+        close_archive(reader, process)
+    if links:
+        raise ValueError(f"Hard link targets missing from backup: {', '.join(sorted(links))}")
+
+
+def restore_archive(archive: str, target: str, patterns: List[str], dry_run: bool) -> Dict:
+    diff = Diff(dry_run)
+    # Selected hard links by the member they link to; resolved once the scan has passed all link targets
+    links: Dict[str, List[str]] = {}
+    # Literal file paths can stop the scan once all of them have been seen
+    pending = {pattern for pattern in patterns if not any(char in pattern for char in GLOB_CHARS)}
+    stop_early = bool(patterns) and len(pending) == len(patterns)
+    reader, process = open_archive(archive)
+    try:
+        for member in reader:
+            path = normalize(member.name)
+            if not path or not selected(path, patterns):
+                continue
+            dest = os.path.join(target, path)
+            if member.isdir():
+                if not dry_run:
+                    os.makedirs(dest, exist_ok=True)
+                continue
+            if member.islnk():
+                links.setdefault(normalize(member.linkname), []).append(path)
+            elif member.issym():
+                diff.record(restore_symlink(dest, member.linkname, dry_run), path)
+            elif member.isfile():
+                diff.record(restore_member(dest, reader.extractfile(member), member, dry_run), path, member.size)
+            pending.discard(path)
+            if stop_early and not pending:
+                break
+    finally:
+        close_archive(reader, process)
+    if links:
+        restore_links(archive, target, links, diff, dry_run)
+    return diff.result()
+
+
+def read_chunks(store: str, chunks: List[str]) -> Iterator[bytes]:
+    """Content of a snapshot file (chunk layout of snapshot_store.py), verified chunk by chunk."""
+    for digest in chunks:
+        with open(os.path.join(store, 'chunks', digest[:2], digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Corrupt chunk {digest}")
+        yield data
+
+
+def live_chunks(path: str, chunk_size: int) -> List[str]:
+    with open(path, 'rb') as f:
+        return [hashlib.sha256(data).hexdigest() for data in iter(lambda: f.read(chunk_size), b'')]
+
+
+def restore_snapshot(store: str, name: str, target: str, patterns: List[str], dry_run: bool) -> Dict:
+    with open(os.path.join(store, 'manifests', f"{name}.json"), 'r') as f:
+        manifest = json.load(f)
+    diff = Diff(dry_run)
+    if not dry_run:
+        for entry in manifest['dirs']:
+            if selected(normalize(entry['path']), patterns):
+                os.makedirs(os.path.join(target, entry['path']), exist_ok=True)
+    for entry in manifest['files']:
+        path = normalize(entry['path'])
+        if not selected(path, patterns):
+            continue
+        dest = os.path.join(target, path)
+        status = compare(dest, entry['size'], entry['mtime_ns'], 1)
+        # The manifest already holds the chunk hashes, so the backup side is never read to compare
+        if status == 'unknown':
+            status = 'unchanged' if live_chunks(dest, manifest['chunk_size']) == entry['chunks'] else 'changed'
+            if status == 'unchanged' and not dry_run:
+                os.utime(dest, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        if status != 'unchanged' and not dry_run:
+            write_file(dest, read_chunks(store, entry['chunks']), entry['mode'], entry['mtime_ns'])
+        diff.record(status, path, entry['size'])
+    for entry in manifest['symlinks']:
+        path = normalize(entry['path'])
+        if selected(path, patterns):
+            diff.record(restore_symlink(os.path.join(target, path), entry['target'], dry_run), path)
+    return diff.result()
+
+
+if __name__ == '__main__':
+    command, args = sys.argv[1], sys.argv[2:]
+    dry_run = '--dry-run' in args
+    args = [arg for arg in args if arg != '--dry-run']
+    if command == 'archive':
+        result = restore_archive(args[0], args[1], [normalize(path) for path in args[2:]], dry_run)
+    elif command == 'snapshot':
+        result = restore_snapshot(args[0], args[1], args[2], [normalize(path) for path in args[3:]], dry_run)
+    else:
+        sys.exit(f"Unknown command: {command}")
+    print(json.dumps(result))
@@ -9,10 +9,19 @@
 import os
 import sys
 import json
+import shlex
+import tarfile
+import posixpath
 import subprocess
 import logging
-import paramiko
 from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from build import AssetBuilder
+from pipeline import DEFAULT_TIMINGS_DIR, Pipeline, run_pipeline
+from releases import ReleaseManager
+from remote import close_all, get_host, wait_until
 
 # 配置日志
 logging.basicConfig(
@@ -25,12 +34,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 上传到服务器作为 server.py 的脚本
+SERVER_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'game_server.py')
+
+# 服务器上记录上一次部署内容哈希的清单文件
+MANIFEST_NAME = '.deploy_manifest.json'
+
+class _CountingWriter:
+    """包装可写文件对象，统计写入的字节数"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes_written = 0
+
+    def write(self, data: bytes) -> int:
+        self.fileobj.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        self.fileobj.flush()
+
 class SimpleDeploy:
     def __init__(self, config_path: str = 'tools/config.json'):
         """初始化简单部署器"""
         self.config = self._load_config(config_path)
         self.ssh_client = None
         self.sftp_client = None
+        self.releases = None
+        self.builder = AssetBuilder(self.config)
+        self.build_dir = None
 
     def _load_config(self, config_path: str) -> dict:
         """加载配置文件"""
@@ -44,50 +77,48 @@ class SimpleDeploy:
     def connect_ssh(self) -> None:
         """建立SSH连接"""
         try:
-            self.ssh_client = paramiko.SSHClient()
-            self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            try:
-                self.ssh_client.connect(
-                    hostname=self.config['server']['host'],
-                    username=self.config['server']['username'],
-                    key_filename=os.path.expanduser(self.config['server']['key_path'])
-                )
-                logger.info("SSH密钥连接成功")
-            except:
-                password = input(f"请输入 {self.config['server']['username']}@{self.config['server']['host']} 的密码: ")
-                self.ssh_client.connect(
-                    hostname=self.config['server']['host'],
-                    username=self.config['server']['username'],
-                    password=password
-                )
-                logger.info("SSH密码连接成功")
+            # 共享连接池：密钥认证失败时提示输入密码
+            self.ssh_client = get_host(self.config['server'], allow_password_prompt=True).connect()
+            logger.info("SSH连接成功")
             
             self.sftp_client = self.ssh_client.open_sftp()
+            self.releases = ReleaseManager(
+                self.ssh_client,
+                self.config['server']['app_dir'],
+                self.config.get('deploy', {}).get('keep_releases', 5)
+            )
             
         except Exception as e:
             logger.error(f"SSH连接失败: {str(e)}")
             sys.exit(1)
 
+    def _run_remote(self, command: str) -> str:
+        """执行远程命令并等待完成，失败时抛出异常"""
+        exit_status, output, error = self.ssh_client.run(command)
+        if exit_status != 0:
+            raise Exception(f"远程命令失败: {command}: {error.strip()}")
+        return output
+
+    def build_assets(self) -> Path:
+        """构建阶段：只暂存静态文件并生成预压缩变体（每次部署只构建一次）"""
+        if self.build_dir is None:
+            self.build_dir = self.builder.build()
+        return self.build_dir
+
+    def prepare_package(self) -> Optional[str]:
+        """打包阶段（不需要SSH连接，与握手并行）：构建静态文件，tarball 模式下同时创建部署包"""
+        self.build_assets()
+        if self.config.get('deploy', {}).get('mode', 'manifest') == 'tarball':
+            return self.create_deployment_package()
+        return None
+
     def create_deployment_package(self) -> str:
         """创建部署包"""
         try:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             package_name = f"fangcheng_deploy_{timestamp}.tar.gz"
             
-            # 只打包静态文件
-            exclude_files = [
-                '--exclude=node_modules',
-                '--exclude=.git',
-                '--exclude=*.log',
-                '--exclude=.DS_Store',
-                '--exclude=backup',
-                '--exclude=*.tar.gz',
-                '--exclude=tools',
-                '--exclude=*.py'
-            ]
-            
-            cmd = ['tar', '-czf', package_name] + exclude_files + ['.']
+            cmd = ['tar', '-czf', package_name, '-C', str(self.build_assets()), '.']
             subprocess.run(cmd, check=True)
             
             logger.info(f"部署包创建成功: {package_name}")
@@ -97,27 +128,27 @@ class SimpleDeploy:
             logger.error(f"创建部署包失败: {str(e)}")
             sys.exit(1)
 
-    def upload_and_extract(self, package_name: str) -> None:
-        """上传并解压部署包"""
+    def upload_and_extract(self, package_name: str, target_dir: str) -> None:
+        """上传部署包并解压到发布目录"""
         try:
-            app_dir = self.config['server']['app_dir']
             temp_dir = self.config['server']['temp_dir']
             
             # 创建目录
-            self.ssh_client.exec_command(f"mkdir -p {app_dir}")
-            self.ssh_client.exec_command(f"mkdir -p {temp_dir}")
+            self._run_remote(f"mkdir -p {target_dir} {temp_dir}")
             
             # 上传文件
             remote_package = f"{temp_dir}/{package_name}"
             logger.info(f"上传文件到服务器: {remote_package}")
             self.sftp_client.put(package_name, remote_package)
             
-            # 解压到应用目录
-            logger.info(f"解压到应用目录: {app_dir}")
-            self.ssh_client.exec_command(f"tar -xzf {remote_package} -C {app_dir}")
-            
-            # 清理临时文件
-            self.ssh_client.exec_command(f"rm {remote_package}")
+            # 解压到发布目录并清理临时文件（一次往返，等待完成后才能切换 current 链接）
+            logger.info(f"解压到发布目录: {target_dir}")
+            result = self.ssh_client.batch() \
+                .add(f"tar -xzf {remote_package} -C {target_dir}", 'extract') \
+                .add(f"rm {remote_package}", 'cleanup') \
+                .run()
+            result.raise_for_status()
+            logger.info(f"远程步骤: {result.describe()}")
             os.remove(package_name)
             
             logger.info("文件上传和解压完成")
@@ -126,91 +157,245 @@ class SimpleDeploy:
             logger.error(f"上传和解压失败: {str(e)}")
             sys.exit(1)
 
-    def create_server_script(self) -> None:
-        """创建Python HTTP服务器脚本"""
+    def fetch_remote_manifest(self, directory: str) -> Optional[dict]:
+        """读取服务器上某个发布目录的部署清单，不存在或无法解析时返回None"""
+        manifest_path = f"{directory}/{MANIFEST_NAME}"
         try:
-            app_dir = self.config['server']['app_dir']
-            port = self.config['app']['port']
+            with self.sftp_client.open(manifest_path, 'r') as f:
+                return json.loads(f.read().decode('utf-8'))['files']
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def write_remote_manifest(self, directory: str, files: dict) -> None:
+        """在所有文件就位后写入新的部署清单"""
+        manifest_path = f"{directory}/{MANIFEST_NAME}"
+        with self.sftp_client.open(f"{manifest_path}.tmp", 'w') as f:
+            f.write(json.dumps({'created': datetime.now().isoformat(), 'files': files}))
+        self.sftp_client.posix_rename(f"{manifest_path}.tmp", manifest_path)
+
+    def upload_delta(self, target_dir: str) -> bool:
+        """增量部署：target_dir 是当前发布的硬链接副本，只上传新增或变化的文件并删除已移除的文件；无法增量时返回False"""
+        try:
+            build_dir = self.build_assets()
+            local_files = self.builder.manifest()
             
-            # 创建Python HTTP服务器脚本
-            server_script = f"""#!/usr/bin/env python3
-import http.server
-import socketserver
-import os
-import sys
+            remote_files = self.fetch_remote_manifest(target_dir)
+            if remote_files is None:
+                logger.info("服务器上没有部署清单，使用完整部署包")
+                return False
+            
+            changed = [path for path, entry in local_files.items()
+                       if remote_files.get(path, {}).get('sha256') != entry['sha256']]
+            deleted = [path for path in remote_files if path not in local_files]
+            
+            # 创建目录并逐个上传（先写临时文件再重命名，避免客户端读到半个文件）
+            remote_dirs = sorted({posixpath.dirname(f"{target_dir}/{path}") for path in changed})
+            if remote_dirs:
+                self._run_remote("mkdir -p " + ' '.join(shlex.quote(d) for d in remote_dirs))
+            for path in changed:
+                remote_path = f"{target_dir}/{path}"
+                self.sftp_client.put(str(build_dir / path), f"{remote_path}.uploading")
+                self.sftp_client.posix_rename(f"{remote_path}.uploading", remote_path)
+            
+            if deleted:
+                self._run_remote("rm -f " + ' '.join(shlex.quote(f"{target_dir}/{path}") for path in deleted))
+            
+            self.write_remote_manifest(target_dir, local_files)
+            
+            total_bytes = sum(entry['size'] for entry in local_files.values())
+            uploaded_bytes = sum(local_files[path]['size'] for path in changed)
+            saved_bytes = total_bytes - uploaded_bytes
+            logger.info(
+                f"增量部署: 上传 {len(changed)} 个文件 ({uploaded_bytes / 1024:.1f} KB)，"
+                f"删除 {len(deleted)} 个，未变化 {len(local_files) - len(changed)} 个，"
+                f"节省 {saved_bytes / 1024:.1f} KB ({saved_bytes * 100 / max(total_bytes, 1):.0f}%)"
+            )
+            return True
+            
+        except Exception as e:
+            logger.warning(f"增量部署失败，回退到完整部署包: {str(e)}")
+            return False
 
-PORT = {port}
-DIRECTORY = "{app_dir}"
+    def stream_upload(self, target_dir: str) -> None:
+        """流式部署：边打包边写入远程 tar 进程的标准输入，上传与解压同时进行，不产生任何临时文件"""
+        try:
+            target_dir = shlex.quote(target_dir)
+            build_dir = self.build_assets()
+            
+            channel = self.ssh_client.get_transport().open_session()
+            channel.exec_command(f"mkdir -p {target_dir} && tar -xzf - -C {target_dir}")
+            
+            stream = _CountingWriter(channel.makefile('wb'))
+            with tarfile.open(fileobj=stream, mode='w|gz') as archive:
+                archive.add(str(build_dir), arcname='.')
+            stream.flush()
+            channel.shutdown_write()
+            
+            exit_status = channel.recv_exit_status()
+            if exit_status != 0:
+                error = channel.makefile_stderr('rb').read().decode().strip()
+                raise Exception(f"远程解压失败 (退出码 {exit_status}): {error}")
+            channel.close()
+            
+            logger.info(f"流式上传并解压完成: {stream.bytes_written / 1024:.1f} KB")
+            
+        except Exception as e:
+            logger.error(f"流式部署失败: {str(e)}")
+            sys.exit(1)
 
-class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=DIRECTORY, **kwargs)
-    
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'healthy\\n')
-            return
-        super().do_GET()
-
-if __name__ == "__main__":
-    os.chdir(DIRECTORY)
-    with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
-        print(f"服务器运行在端口 {{PORT}}")
-        print(f"访问地址: http://localhost:{{PORT}}")
-        httpd.serve_forever()
-"""
+    def upload_application(self, package_name: Optional[str] = None) -> None:
+        """按 deploy.mode 把静态文件上传到新的发布目录：manifest（增量）、stream（流式）或 tarball（完整部署包），
+        然后原子切换 current 链接；package_name 为打包阶段已创建的部署包"""
+        try:
+            deploy_mode = self.config.get('deploy', {}).get('mode', 'manifest')
+            
+            # 增量上传失败或首次部署时回退到完整部署包
+            if deploy_mode == 'manifest':
+                release = self.releases.new_release(seed_from_current=True)
+                if self.upload_delta(self.releases.release_path(release)):
+                    self.publish_release(release)
+                    return
+                self.releases.discard(release)
+            
+            release = self.releases.new_release()
+            release_dir = self.releases.release_path(release)
+            if deploy_mode == 'stream':
+                self.stream_upload(release_dir)
+            else:
+                package_name = package_name or self.create_deployment_package()
+                self.upload_and_extract(package_name, release_dir)
+            self.write_remote_manifest(release_dir, self.builder.manifest())
+            self.publish_release(release)
             
-            # 写入服务器脚本
-            with open('temp_server.py', 'w') as f:
-                f.write(server_script)
+        except Exception as e:
+            logger.error(f"发布失败: {str(e)}")
+            sys.exit(1)
+
+    def publish_release(self, release: str) -> None:
+        """切换 current 链接到新发布，并只保留最近 deploy.keep_releases 个发布"""
+        self.releases.activate(release)
+        self.releases.prune()
+        logger.info(f"已发布: {self.releases.release_path(release)}")
+
+    def rollback(self, release: Optional[str] = None) -> None:
+        """回滚：把 current 链接指回上一个（或指定的）发布，无需重新上传或解压"""
+        try:
+            self.connect_ssh()
+            release = self.releases.rollback(release)
+            logger.info(f"已回滚到发布: {release}")
+        except Exception as e:
+            logger.error(f"回滚失败: {str(e)}")
+            sys.exit(1)
+        finally:
+            self.cleanup()
+
+    def _server_settings(self) -> dict:
+        """生成服务器脚本使用的配置（写入 server_config.json）"""
+        app = self.config['app']
+        return {
+            'port': app['port'],
+            'directory': f"{self.config['server']['app_dir']}/current",
+            'server_mode': app.get('server_mode', 'threaded'),
+            'max_workers': app.get('max_workers', 32),
+            'cache_max_bytes': app.get('cache_max_bytes', 32 * 1024 * 1024),
+            'sendfile_min_bytes': app.get('sendfile_min_bytes', 256 * 1024),
+            'keepalive_timeout': app.get('keepalive_timeout', 5),
+            'workers': app.get('workers', 0),
+            'pid_file': f"{self.config['server']['app_dir']}/server.pid",
+            'status_file': f"{self.config['server']['app_dir']}/server_status.json",
+        }
+
+    def create_server_script(self) -> None:
+        """上传Python HTTP服务器脚本及其配置"""
+        try:
+            app_dir = self.config['server']['app_dir']
+            settings = self._server_settings()
             
-            # 上传脚本
-            self.sftp_client.put('temp_server.py', f"{app_dir}/server.py")
-            os.remove('temp_server.py')
+            # 独立的SFTP会话：与部署包上传同时进行
+            sftp = self.ssh_client.open_sftp(new=True)
+            try:
+                # 上传服务器脚本（tools/game_server.py）
+                sftp.put(SERVER_TEMPLATE, f"{app_dir}/server.py")
+                
+                # 写入服务器配置
+                with sftp.open(f"{app_dir}/server_config.json", 'w') as f:
+                    f.write(json.dumps(settings, indent=4))
+            finally:
+                sftp.close()
             
             # 设置执行权限
-            self.ssh_client.exec_command(f"chmod +x {app_dir}/server.py")
+            self._run_remote(f"chmod +x {app_dir}/server.py")
             
-            logger.info("HTTP服务器脚本创建完成")
+            logger.info(f"HTTP服务器脚本创建完成（模式: {settings['server_mode']}）")
             
         except Exception as e:
             logger.error(f"创建服务器脚本失败: {str(e)}")
             sys.exit(1)
 
     def start_server(self) -> None:
-        """启动HTTP服务器"""
+        """启动HTTP服务器；主进程已在运行时发送 SIGHUP 平滑替换 worker，端口不中断"""
         try:
             app_dir = self.config['server']['app_dir']
             port = self.config['app']['port']
             
-            # 停止可能存在的进程
-            self.ssh_client.exec_command(f"pkill -f 'python.*server.py'")
-            
-            # 启动服务器（后台运行）
+            # 一次往返：读取当前状态，主进程存活则 SIGHUP，否则停止旧进程并在后台启动
             logger.info(f"启动HTTP服务器在端口 {port}...")
-            self.ssh_client.exec_command(f"cd {app_dir} && nohup python3 server.py > server.log 2>&1 &")
-            
-            # 等待启动
-            import time
-            time.sleep(3)
-            
-            # 检查进程是否启动
-            stdin, stdout, stderr = self.ssh_client.exec_command(f"ps aux | grep 'python.*server.py' | grep -v grep")
-            process = stdout.read().decode().strip()
+            result = self.ssh_client.batch(stop_on_error=False) \
+                .add(f"cat {app_dir}/server_status.json 2>/dev/null || true", 'status') \
+                .add(
+                    f"cd {app_dir} && if [ -f server.pid ] && kill -0 \"$(cat server.pid)\" 2>/dev/null; then "
+                    f"kill -HUP \"$(cat server.pid)\" && echo reload; else "
+                    f"pkill -f 'python.*server.py' || true; nohup python3 server.py > server.log 2>&1 & echo start; fi",
+                    'start'
+                ) \
+                .run()
+            logger.info(f"远程步骤: {result.describe()}")
+            reloaded = result['start'].stdout.strip() == 'reload'
+            
+            # 轮询等待（指数退避），代替固定等待
+            start_timeout = self.config['app'].get('start_timeout', 15)
+            if reloaded:
+                generation = self._server_generation(result['status'].stdout)
+                logger.info(f"服务器正在运行，已发送 SIGHUP 平滑重启（当前第 {generation} 代 worker）")
+                ready = wait_until(
+                    lambda: self._server_generation(self._read_remote_status()) > generation and self._is_serving(),
+                    timeout=start_timeout
+                )
+            else:
+                ready = wait_until(self._is_serving, timeout=start_timeout)
             
-            if process:
-                logger.info("HTTP服务器启动成功!")
+            if ready:
+                logger.info("HTTP服务器平滑重启完成!" if reloaded else "HTTP服务器启动成功!")
                 logger.info(f"访问地址: http://{self.config['server']['host']}:{port}")
             else:
-                logger.error("HTTP服务器启动失败，请检查日志")
+                exit_status, process, _ = self.ssh_client.run("ps aux | grep 'python.*server.py' | grep -v grep")
+                if process.strip():
+                    logger.warning(f"HTTP服务器进程已启动，但 {start_timeout} 秒内未就绪")
+                else:
+                    logger.error("HTTP服务器启动失败，请检查日志")
                 
         except Exception as e:
             logger.error(f"启动服务器失败: {str(e)}")
             sys.exit(1)
 
+    def _read_remote_status(self) -> str:
+        _, output, _ = self.ssh_client.run(f"cat {self.config['server']['app_dir']}/server_status.json")
+        return output
+
+    @staticmethod
+    def _server_generation(status: str) -> int:
+        """server_status.json 中的 worker 代数（没有状态文件时为 0）"""
+        try:
+            return int(json.loads(status)['generation'])
+        except (ValueError, KeyError, TypeError):
+            return 0
+
+    def _is_serving(self) -> bool:
+        """/health 是否返回200（用于启动轮询，不记录日志）"""
+        import requests
+        url = f"http://{self.config['server']['host']}:{self.config['app']['port']}/health"
+        return requests.get(url, timeout=2).status_code == 200
+
     def health_check(self) -> bool:
         """健康检查"""
         try:
@@ -230,36 +415,30 @@ if __name__ == "__main__":
             return False
 
     def cleanup(self) -> None:
-        """清理资源"""
-        if self.sftp_client:
-            self.sftp_client.close()
-        if self.ssh_client:
-            self.ssh_client.close()
+        """清理资源（关闭连接池并记录握手/命令耗时）"""
+        close_all()
 
     def deploy(self) -> None:
         """执行完整部署流程"""
         try:
             logger.info("开始简单HTTP服务器部署...")
             
-            # 1. 连接SSH
-            self.connect_ssh()
-            
-            # 2. 创建部署包
-            package_name = self.create_deployment_package()
-            
-            # 3. 上传和解压
-            self.upload_and_extract(package_name)
-            
-            # 4. 创建服务器脚本
-            self.create_server_script()
-            
-            # 5. 启动服务器
-            self.start_server()
-            
+            # 按依赖关系执行：打包与SSH握手并行，服务器脚本与静态文件同时上传
+            pipeline = Pipeline('simple_deploy')
+            # 1. 连接SSH / 2. 构建并打包
+            pipeline.add('connect', self.connect_ssh)
+            pipeline.add('package', self.prepare_package)
+            # 3. 上传静态文件 / 4. 上传服务器脚本
+            pipeline.add('upload', lambda: self.upload_application(pipeline.results['package']),
+                         after=['connect', 'package'])
+            pipeline.add('server_script', self.create_server_script, after=['connect'])
+            # 5. 启动服务器（轮询等待就绪）
+            pipeline.add('start', self.start_server, after=['upload', 'server_script'])
             # 6. 健康检查
-            import time
-            time.sleep(5)  # 等待服务器完全启动
-            if self.health_check():
+            pipeline.add('health', self.health_check, after=['start'])
+            results = run_pipeline(pipeline, self.config.get('deploy', {}).get('timings_dir', DEFAULT_TIMINGS_DIR))
+            
+            if results['health']:
                 logger.info("部署成功完成!")
             else:
                 logger.info("部署完成，但健康检查未通过，请手动检查")
@@ -273,8 +452,19 @@ if __name__ == "__main__":
             self.cleanup()
 
 def main():
-    deployer = SimpleDeploy()
-    deployer.deploy()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Simple HTTP server deployment')
+    parser.add_argument('--config', default='tools/config.json', help='Path to configuration file')
+    parser.add_argument('--rollback', nargs='?', const='', metavar='RELEASE',
+                        help='Point current back to the previous release (or the given one) and exit')
+    args = parser.parse_args()
+    
+    deployer = SimpleDeploy(args.config)
+    if args.rollback is not None:
+        deployer.rollback(args.rollback or None)
+    else:
+        deployer.deploy()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed snapshot store for backups. Runs on the server and prints one JSON document per command.
+Files are split into fixed-size chunks named by their SHA-256 and every chunk is stored once (zlib-compressed),
+so a snapshot is a small manifest of paths and chunk hashes. Files whose size and mtime match the previous
+snapshot of the same source are not read again. Deleting snapshots garbage-collects unreferenced chunks.
+Uses only the standard library, so backup.py can pipe this file into a remote `python3 -`; locally it is
+imported to maintain the downloaded mirror.
+
+Usage: python3 snapshot_store.py create STORE SOURCE NAME TYPE [CHUNK_SIZE]
+       python3 snapshot_store.py restore STORE NAME TARGET
+       python3 snapshot_store.py delete STORE NAME...
+       python3 snapshot_store.py list STORE
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import zlib
+import hashlib
+from typing import Dict, Iterator, List, Optional, Set
+
+CHUNK_SIZE = 1024 * 1024
+
+# Unreferenced chunks younger than this may belong to a snapshot that is still being written
+GC_GRACE_SECONDS = 3600
+
+
+def chunk_path(store: str, digest: str) -> str:
+    return os.path.join(store, 'chunks', digest[:2], digest)
+
+
+def manifest_path(store: str, name: str) -> str:
+    return os.path.join(store, 'manifests', f"{name}.json")
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_file = f"{path}.tmp.{os.getpid()}"
+    with open(temp_file, 'wb') as f:
+        f.write(data)
+    os.replace(temp_file, path)
+
+
+def write_chunk(store: str, data: bytes) -> Optional[str]:
+    """Store data under its hash; returns the hash if the chunk was new, None if it already existed."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = chunk_path(store, digest)
+    if os.path.exists(path):
+        # Refresh the mtime so a concurrent garbage collection treats it as in use
+        os.utime(path)
+        return None
+    write_atomic(path, zlib.compress(data, 6))
+    return digest
+
+
+def read_chunk(store: str, digest: str) -> bytes:
+    with open(chunk_path(store, digest), 'rb') as f:
+        data = zlib.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"Corrupt chunk {digest}")
+    return data
+
+
+def list_manifests(store: str) -> List[str]:
+    try:
+        names = os.listdir(os.path.join(store, 'manifests'))
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+
+def load_manifest(store: str, name: str) -> Dict:
+    with open(manifest_path(store, name), 'r') as f:
+        return json.load(f)
+
+
+def previous_files(store: str, source: str) -> Dict[str, Dict]:
+    """File entries of the newest snapshot of source, used to skip re-reading unchanged files."""
+    for name in reversed(list_manifests(store)):
+        try:
+            manifest = load_manifest(store, name)
+        except (OSError, ValueError):
+            continue
+        if manifest.get('source') == source:
+            return {entry['path']: entry for entry in manifest['files']}
+    return {}
+
+
+def iter_tree(source: str) -> Iterator[tuple]:
+    """(relative path, lstat) of every entry below source; symlinks are not followed."""
+    for root, dirs, files in os.walk(source):
+        for name in sorted(dirs) + sorted(files):
+            path = os.path.join(root, name)
+            try:
+                yield os.path.relpath(path, source), os.lstat(path)
+            except FileNotFoundError:
+                continue
+        dirs.sort()
+
+
+def create(store: str, source: str, name: str, backup_type: str = 'full', chunk_size: int = CHUNK_SIZE) -> Dict:
+    started = time.time()
+    previous = previous_files(store, source)
+    manifest = {
+        'name': name,
+        'type': backup_type,
+        'source': source,
+        'created': started,
+        'chunk_size': chunk_size,
+        'dirs': [],
+        'symlinks': [],
+        'files': [],
+    }
+    stats = {'files': 0, 'bytes': 0, 'unchanged_files': 0, 'read_bytes': 0, 'new_chunks': 0, 'new_bytes': 0}
+
+    for relative, st in iter_tree(source):
+        if stat.S_ISLNK(st.st_mode):
+            manifest['symlinks'].append({'path': relative, 'target': os.readlink(os.path.join(source, relative))})
+        elif stat.S_ISDIR(st.st_mode):
+            manifest['dirs'].append({'path': relative, 'mode': stat.S_IMODE(st.st_mode)})
+        elif stat.S_ISREG(st.st_mode):
+            entry = {'path': relative, 'mode': stat.S_IMODE(st.st_mode), 'size': st.st_size,
+                     'mtime_ns': st.st_mtime_ns}
+            old = previous.get(relative)
+            if old and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+                entry['chunks'] = old['chunks']
+                stats['unchanged_files'] += 1
+            else:
+                entry['chunks'] = []
+                try:
+                    with open(os.path.join(source, relative), 'rb') as f:
+                        for data in iter(lambda: f.read(chunk_size), b''):
+                            digest = write_chunk(store, data)
+                            entry['chunks'].append(digest or hashlib.sha256(data).hexdigest())
+                            stats['read_bytes'] += len(data)
+                            if digest:
+                                stats['new_chunks'] += 1
+                                stats['new_bytes'] += os.path.getsize(chunk_path(store, digest))
+                except FileNotFoundError:
+                    continue
+            manifest['files'].append(entry)
+            stats['files'] += 1
+            stats['bytes'] += st.st_size
+
+    # The manifest is written last: until then the snapshot does not exist and its chunks are garbage
+    write_atomic(manifest_path(store, name), json.dumps(manifest).encode())
+    stats['manifest_bytes'] = os.path.getsize(manifest_path(store, name))
+    stats['seconds'] = round(time.time() - started, 3)
+    return stats
+
+
+def restore(store: str, name: str, target: str) -> Dict:
+    """Materialize a snapshot into target (which should be empty)."""
+    manifest = load_manifest(store, name)
+    os.makedirs(target, exist_ok=True)
+    for entry in manifest['dirs']:
+        os.makedirs(os.path.join(target, entry['path']), exist_ok=True)
+    for entry in manifest['files']:
+        path = os.path.join(target, entry['path'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for digest in entry['chunks']:
+                f.write(read_chunk(store, digest))
+        os.chmod(path, entry['mode'])
+        os.utime(path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+    for entry in manifest['symlinks']:
+        path = os.path.join(target, entry['path'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.symlink(entry['target'], path)
+    # Directory modes last, so read-only directories do not block the files inside them
+    for entry in reversed(manifest['dirs']):
+        os.chmod(os.path.join(target, entry['path']), entry['mode'])
+    return {'files': len(manifest['files']), 'bytes': sum(entry['size'] for entry in manifest['files'])}
+
+
+def referenced_chunks(store: str) -> Set[str]:
+    referenced = set()
+    for name in list_manifests(store):
+        for entry in load_manifest(store, name)['files']:
+            referenced.update(entry['chunks'])
+    return referenced
+
+
+def gc(store: str) -> Dict:
+    """Delete chunks no manifest references (mark and sweep)."""
+    referenced = referenced_chunks(store)
+    cutoff = time.time() - GC_GRACE_SECONDS
+    deleted = freed = kept = 0
+    chunks_dir = os.path.join(store, 'chunks')
+    for prefix in (os.listdir(chunks_dir) if os.path.isdir(chunks_dir) else []):
+        for digest in os.listdir(os.path.join(chunks_dir, prefix)):
+            path = os.path.join(chunks_dir, prefix, digest)
+            if digest in referenced:
+                kept += 1
+                continue
+            st = os.stat(path)
+            if st.st_mtime > cutoff:
+                continue
+            os.unlink(path)
+            deleted += 1
+            freed += st.st_size
+    return {'kept_chunks': kept, 'deleted_chunks': deleted, 'freed_bytes': freed}
+
+
+def delete(store: str, names: List[str]) -> Dict:
+    removed = []
+    for name in names:
+        try:
+            os.unlink(manifest_path(store, name))
+            removed.append(name)
+        except FileNotFoundError:
+            continue
+    return dict(gc(store), deleted=removed)
+
+
+def summary(store: str) -> List[Dict]:
+    snapshots = []
+    for name in list_manifests(store):
+        manifest = load_manifest(store, name)
+        snapshots.append({
+            'name': name,
+            'type': manifest.get('type'),
+            'created': manifest['created'],
+            'files': len(manifest['files']),
+            'bytes': sum(entry['size'] for entry in manifest['files']),
+        })
+    return snapshots
+
+
+if __name__ == '__main__':
+    command, args = sys.argv[1], sys.argv[2:]
+    if command == 'create':
+        result = create(args[0], args[1], args[2], args[3] if len(args) > 3 else 'full',
+                        int(args[4]) if len(args) > 4 else CHUNK_SIZE)
+    elif command == 'restore':
+        result = restore(args[0], args[1], args[2])
+    elif command == 'delete':
+        result = delete(args[0], args[1:])
+    elif command == 'list':
+        result = summary(args[0])
+    else:
+        sys.exit(f"Unknown command: {command}")
+    print(json.dumps(result))
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Parallel, resumable SFTP downloads.
+A file is fetched in fixed-size byte ranges over several SFTP sessions at once (each pipelines its reads).
+Finished ranges are recorded in a sidecar state file, so an interrupted download resumes where it stopped.
+The result is only moved into place after its size and SHA-256 match the remote file.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from remote import RemoteHost
+
+logger = logging.getLogger(__name__)
+
+PART_SIZE = 8 * 1024 * 1024
+# Size of the individual reads from the prefetch buffer
+READ_SIZE = 1024 * 1024
+MAX_ATTEMPTS = 5
+
+
+def remote_sha256(host: RemoteHost, remote_path: str) -> str:
+    exit_status, output, error = host.run(f"sha256sum {remote_path}")
+    if exit_status != 0:
+        raise Exception(f"Remote checksum failed: {error.strip()}")
+    return output.split()[0]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ParallelDownload:
+    def __init__(self, host: RemoteHost, remote_path: str, local_path: str, workers: int = 4,
+                 part_size: int = PART_SIZE):
+        self.host = host
+        self.remote_path = remote_path
+        self.local_path = local_path
+        self.workers = max(1, workers)
+        self.part_size = part_size
+        self.part_path = f"{local_path}.part"
+        self.state_path = f"{local_path}.part.json"
+        self.state: Dict = {}
+        self._lock = threading.Lock()
+
+    def load_state(self, size: int, mtime: int) -> List[int]:
+        """Parts already on disk from an earlier attempt at the same remote file; empty when starting over."""
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if state.get('remote_path') != self.remote_path or state.get('size') != size \
+                or state.get('mtime') != mtime or state.get('part_size') != self.part_size \
+                or not os.path.exists(self.part_path):
+            state = {'remote_path': self.remote_path, 'size': size, 'mtime': mtime,
+                     'part_size': self.part_size, 'done': []}
+            with open(self.part_path, 'wb') as f:
+                f.truncate(size)
+        self.state = state
+        return state['done']
+
+    def save_state(self) -> None:
+        temp_file = f"{self.state_path}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temp_file, self.state_path)
+
+    def fetch_run(self, sftp, fd: int, run: List[int], size: int, progress: Dict) -> None:
+        """
+        Fetch consecutive parts through one pipelined read (like SFTPClient.get), recording each part as it completes.
+        Completed parts are removed from run, so a retry continues with the rest.
+        """
+        start = run[0] * self.part_size
+        end = min((run[-1] + 1) * self.part_size, size)
+        with sftp.open(self.remote_path, 'r') as remote_file:
+            remote_file.seek(start)
+            remote_file.prefetch(end)
+            while run:
+                offset = run[0] * self.part_size
+                length = min(self.part_size, size - offset)
+                received = 0
+                while received < length:
+                    data = remote_file.read(min(READ_SIZE, length - received))
+                    if not data:
+                        raise IOError(f"Unexpected end of file at offset {offset + received}")
+                    os.pwrite(fd, data, offset + received)
+                    received += len(data)
+                with self._lock:
+                    self.state['done'].append(run.pop(0))
+                    self.save_state()
+                    progress['bytes'] += length
+
+    def worker(self, parts: List[int], fd: int, size: int, errors: List[Exception], progress: Dict) -> None:
+        # Consecutive runs of this worker's parts, each fetched with a single prefetch
+        runs: List[List[int]] = []
+        for index in parts:
+            if runs and runs[-1][-1] == index - 1:
+                runs[-1].append(index)
+            else:
+                runs.append([index])
+
+        sftp = None
+        try:
+            for run in runs:
+                for attempt in range(1, MAX_ATTEMPTS + 1):
+                    try:
+                        if sftp is None:
+                            sftp = self.host.open_sftp(new=True)
+                        self.fetch_run(sftp, fd, run, size, progress)
+                        break
+                    except Exception as e:
+                        # Dropped link: reopen the session (the pool reconnects the transport) and retry the rest
+                        logger.warning(
+                            f"Download of {self.remote_path} failed at part {run[0]} (attempt {attempt}): {e}"
+                        )
+                        # Close the failed session first, or its channel stays open on the shared transport
+                        self._close_sftp(sftp)
+                        sftp = None
+                        if attempt == MAX_ATTEMPTS:
+                            errors.append(e)
+                            return
+                        time.sleep(min(2 ** attempt, 30))
+        finally:
+            self._close_sftp(sftp)
+
+    @staticmethod
+    def _close_sftp(sftp) -> None:
+        if sftp is None:
+            return
+        try:
+            sftp.close()
+        except Exception:
+            # The transport may already be gone with the session
+            pass
+
+    def run(self, expected_sha256: Optional[str] = None) -> Dict:
+        """Download (or resume) the file and verify it; returns transfer statistics."""
+        started = time.time()
+        st = self.host.open_sftp().stat(self.remote_path)
+        done = set(self.load_state(st.st_size, int(st.st_mtime)))
+        part_count = max(1, -(-st.st_size // self.part_size))
+        pending = [index for index in range(part_count) if index not in done]
+        resumed = len(done)
+        progress = {'bytes': 0}
+        errors: List[Exception] = []
+
+        # Each worker gets one contiguous share of the pending parts
+        workers = min(self.workers, len(pending))
+        shares = [pending[len(pending) * i // workers:len(pending) * (i + 1) // workers] for i in range(workers)]
+
+        fd = os.open(self.part_path, os.O_WRONLY)
+        try:
+            threads = [
+                threading.Thread(target=self.worker, args=(share, fd, st.st_size, errors, progress), daemon=True)
+                for share in shares
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if errors:
+            raise Exception(f"Download of {self.remote_path} incomplete, resumable from {self.state_path}: {errors[0]}")
+
+        # Only a complete, matching file replaces the target
+        if os.path.getsize(self.part_path) != st.st_size:
+            raise Exception(f"Size mismatch for {self.remote_path}")
+        actual = file_sha256(self.part_path)
+        if expected_sha256 and actual != expected_sha256:
+            os.unlink(self.part_path)
+            os.unlink(self.state_path)
+            raise Exception(f"Checksum mismatch for {self.remote_path}: expected {expected_sha256}, got {actual}")
+        os.replace(self.part_path, self.local_path)
+        os.unlink(self.state_path)
+
+        seconds = time.time() - started
+        return {
+            'size': st.st_size,
+            'downloaded': progress['bytes'],
+            'resumed_parts': resumed,
+            'parts': part_count,
+            'sha256': actual,
+            'seconds': round(seconds, 3),
+            'mb_per_second': round(progress['bytes'] / 1024 / 1024 / seconds, 2) if seconds else 0.0,
+        }